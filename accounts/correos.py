@@ -0,0 +1,123 @@
+# accounts/correos.py
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import Usuario
+from notificaciones.cola import encolar, manejador
+from notificaciones.correo import crear_mensaje, enviar_correo
+
+
+TIPO_CORREO_CUENTA = "CORREO_CUENTA"
+
+
+# ----------------------------------------------------------
+# PLANTILLAS (asunto, texto, html)
+# El token de los enlaces se genera al enviar: no queda guardado en la cola
+# ----------------------------------------------------------
+def _bienvenida(user):
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    backend_url = getattr(settings, "BACKEND_URL", "http://127.0.0.1:8000")
+    reset_url = f"{backend_url}/usuarios/reset-password-form/{uid}/{token}/"
+
+    nombre = f"{user.first_name or ''} {user.last_name or ''}".strip()
+    asunto = "Bienvenido a SCODA"
+
+    mensaje_texto = (
+        f"Hola {nombre or user.email},\n\n"
+        f"Tu cuenta ({user.email}) ha sido creada exitosamente.\n"
+        f"Antes de acceder, debes definir tu contraseña.\n\n"
+        f"Haz clic en el siguiente enlace:\n{reset_url}\n\n"
+        f"Saludos,\nEquipo SCODA"
+    )
+
+    mensaje_html = f"""
+    <html>
+      <body style="font-family: Arial, sans-serif; color:#333;">
+        <h2>¡Bienvenido a SCODA, {nombre or user.email}!</h2>
+        <p>Tu cuenta con el correo <b>{user.email}</b> ha sido creada exitosamente.</p>
+        <p><b>Antes de iniciar sesión, debes definir tu contraseña.</b></p>
+        <p>
+          <a href="{reset_url}" style="display:inline-block; padding:10px 20px; background:#007BFF;
+                    color:#fff; text-decoration:none; border-radius:5px;">
+             Definir mi contraseña
+          </a>
+        </p>
+        <br>
+        <p style="color: gray;">Saludos,<br>Equipo SCODA</p>
+      </body>
+    </html>
+    """
+    return asunto, mensaje_texto, mensaje_html
+
+
+def _cambio_password(user):
+    return (
+        "Cambio de contraseña en SCODA",
+        (
+            f"Hola {user.first_name or user.email},\n\n"
+            f"Tu contraseña ha sido cambiada correctamente.\n\n"
+            f"Si no realizaste este cambio, contacta al administrador.\n\n"
+            f"Saludos,\nEquipo SCODA"
+        ),
+        None
+    )
+
+
+def _link_reset(user):
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    reset_url = f"{settings.FRONTEND_URL}/reset-password-form/{uidb64}/{token}/"
+    return (
+        "Restablecer contraseña - SCODA",
+        (
+            f"Hola {user.first_name or user.email},\n\n"
+            f"Para definir o restablecer tu contraseña, haz clic en el siguiente enlace:\n"
+            f"{reset_url}\n\n"
+            f"Este enlace expira en 24 horas.\n\n"
+            f"Saludos,\nEquipo SCODA"
+        ),
+        None
+    )
+
+
+def _password_definida(user):
+    return (
+        "Contraseña creada en SCODA",
+        (
+            f"Hola {user.first_name or user.email},\n\n"
+            f"Tu contraseña ha sido definida correctamente.\n\n"
+            f"Si no realizaste este proceso, contacta al administrador.\n\n"
+            f"Saludos,\nEquipo SCODA"
+        ),
+        None
+    )
+
+
+PLANTILLAS = {
+    "bienvenida": _bienvenida,
+    "cambio_password": _cambio_password,
+    "link_reset": _link_reset,
+    "password_definida": _password_definida,
+}
+
+
+# ----------------------------------------------------------
+# COLA
+# ----------------------------------------------------------
+def encolar_correo_cuenta(plantilla, user):
+    """Deja el correo en la cola (lo envía procesar_notificaciones). Retorna el trabajo."""
+    if plantilla not in PLANTILLAS:
+        raise ValueError(f"Plantilla de correo desconocida: {plantilla}")
+    return encolar(TIPO_CORREO_CUENTA, {"plantilla": plantilla, "usuario_id": str(user.pk)}, usuario=user)
+
+
+@manejador(TIPO_CORREO_CUENTA)
+def enviar_correo_cuenta(datos):
+    user = Usuario.objects.filter(pk=datos["usuario_id"]).first()
+    if not user or not user.email:
+        return
+    asunto, texto, html = PLANTILLAS[datos["plantilla"]](user)
+    enviar_correo(crear_mensaje(asunto, texto, [user.email], html=html))
@@ -1,13 +1,9 @@
 # accounts/signals.py
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
-from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode
-from django.utils.encoding import force_bytes
-from django.conf import settings
 from django.db import IntegrityError
 
+from .correos import encolar_correo_cuenta
 from .models import Usuario
 from notificaciones.models import Notificacion
 from personas.models import Persona
@@ -65,51 +61,10 @@ def sincronizar_persona_y_notificar(sender, instance, created, **kwargs):
             mensaje=f"Se ha creado la cuenta para {instance.email}"
         )
 
-        # Envío de correo de bienvenida
-        uid = urlsafe_base64_encode(force_bytes(instance.pk))
-        token = default_token_generator.make_token(instance)
-        backend_url = getattr(settings, "BACKEND_URL", "http://127.0.0.1:8000")
-        reset_url = f"{backend_url}/usuarios/reset-password-form/{uid}/{token}/"
+        # Correo de bienvenida: queda en la cola, no bloquea la creación
+        encolar_correo_cuenta("bienvenida", instance)
 
-        nombre = f"{instance.first_name or ''} {instance.last_name or ''}".strip()
-        asunto = "Bienvenido a SCODA"
-
-        mensaje_texto = (
-            f"Hola {nombre or instance.email},\n\n"
-            f"Tu cuenta ({instance.email}) ha sido creada exitosamente.\n"
-            f"Antes de acceder, debes definir tu contraseña.\n\n"
-            f"Haz clic en el siguiente enlace:\n{reset_url}\n\n"
-            f"Saludos,\nEquipo SCODA"
-        )
-
-        mensaje_html = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color:#333;">
-            <h2>¡Bienvenido a SCODA, {nombre or instance.email}!</h2>
-            <p>Tu cuenta con el correo <b>{instance.email}</b> ha sido creada exitosamente.</p>
-            <p><b>Antes de iniciar sesión, debes definir tu contraseña.</b></p>
-            <p>
-              <a href="{reset_url}" style="display:inline-block; padding:10px 20px; background:#007BFF;
-                        color:#fff; text-decoration:none; border-radius:5px;">
-                 Definir mi contraseña
-              </a>
-            </p>
-            <br>
-            <p style="color: gray;">Saludos,<br>Equipo SCODA</p>
-          </body>
-        </html>
-        """
-
-        send_mail(
-            subject=asunto,
-            message=mensaje_texto,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[instance.email],
-            html_message=mensaje_html,
-            fail_silently=False,
-        )
-
-        print(f"Usuario '{instance.email}' sincronizado con Persona '{persona.id}' y correo enviado.")
+        print(f"Usuario '{instance.email}' sincronizado con Persona '{persona.id}' y correo en cola.")
 
     except IntegrityError as e:
         print(f"Error de integridad al crear Persona para {instance.email}: {e}")
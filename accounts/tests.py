@@ -1,3 +1,67 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notificaciones.cola import procesar, reclamar
+from notificaciones.models import TrabajoNotificacion
+from .correos import TIPO_CORREO_CUENTA
+from .models import Usuario
+
+
+class CorreosCuentaTests(TestCase):
+    """Los correos de cuenta salen por la cola, fuera de la solicitud."""
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            email="cuenta@prueba.cl", password="secreta1", first_name="Cuenta", rol=Usuario.Roles.PORTERIA
+        )
+        self.client = APIClient()
+
+    def procesar_cola(self):
+        # now() de Postgres es el inicio de la transacción de la prueba,
+        # anterior al disponible_en que se guardó al encolar
+        TrabajoNotificacion.objects.update(disponible_en=timezone.now() - timedelta(minutes=1))
+        return procesar(reclamar())
+
+    def correos(self):
+        self.client.force_authenticate(self.usuario)
+        respuesta = self.client.get(f'/api/usuarios/{self.usuario.email}/correos')
+        self.assertEqual(respuesta.status_code, 200)
+        return [(c['plantilla'], c['estado']) for c in respuesta.json()]
+
+    def test_bienvenida_queda_en_cola(self):
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(self.correos(), [("bienvenida", TrabajoNotificacion.PENDIENTE)])
+
+        self.assertEqual(self.procesar_cola(), (1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [[self.usuario.email]])
+        self.assertEqual(self.correos(), [("bienvenida", TrabajoNotificacion.ENVIADO)])
+
+    def test_reset_password_responde_sin_esperar_el_envio(self):
+        respuesta = self.client.post(
+            '/api/usuarios/reset-password', {'email': self.usuario.email, 'password': 'nueva123'},
+            format='json', headers={'X-API-Key': settings.SCODA_API_KEY}
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['envio']['estado'], TrabajoNotificacion.PENDIENTE)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            self.correos(),
+            [("cambio_password", TrabajoNotificacion.PENDIENTE), ("bienvenida", TrabajoNotificacion.PENDIENTE)]
+        )
+
+    def test_envio_fallido_se_informa_y_reintenta(self):
+        with mock.patch('accounts.correos.enviar_correo', side_effect=OSError("SMTP caído")):
+            self.assertEqual(self.procesar_cola(), (0, 1))
 
-# Create your tests here.
+        trabajo = TrabajoNotificacion.objects.get(tipo=TIPO_CORREO_CUENTA, usuario=self.usuario)
+        self.assertEqual((trabajo.estado, trabajo.intentos), (TrabajoNotificacion.PENDIENTE, 1))
+        self.client.force_authenticate(self.usuario)
+        envio, = self.client.get(f'/api/usuarios/{self.usuario.email}/correos').json()
+        self.assertEqual(envio['ultimo_error'], "OSError: SMTP caído")
@@ -4,10 +4,6 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.decorators import action
-from django.core.mail import send_mail
-from django.utils.http import urlsafe_base64_encode
-from django.utils.encoding import force_bytes
-from django.contrib.auth.tokens import default_token_generator
 from django.shortcuts import render
 from django.views import View
 from django.http import HttpResponse
@@ -24,7 +20,9 @@ from .serializers import (
     ResetPasswordLinkSerializer,
 )
 from .permiso import HasAPIKey
-from notificaciones.models import Notificacion
+from .correos import TIPO_CORREO_CUENTA, encolar_correo_cuenta
+from notificaciones.cola import estado_envio
+from notificaciones.models import Notificacion, TrabajoNotificacion
 
 
 # ==============================================================
@@ -79,7 +77,16 @@ class UsuarioViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             f"Se creó el usuario {user_data.get('email', 'sin email')}"
         )
 
-        return Response({"message": message, "user": user_data}, status=201)
+        # El correo de bienvenida lo encola la señal post_save del usuario
+        trabajo = TrabajoNotificacion.objects.filter(
+            tipo=TIPO_CORREO_CUENTA,
+            usuario__email=user_data.get("email"),
+        ).order_by("-id").first()
+
+        return Response(
+            {"message": message, "user": user_data, "envio": estado_envio(trabajo) if trabajo else None},
+            status=201
+        )
 
     # ----------------------------------------------------------
     # ACTUALIZAR USUARIO
@@ -150,19 +157,11 @@ class UsuarioViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             mensaje=f"La contraseña de {user.email} ha sido cambiada.",
         )
 
-        send_mail(
-            subject="Cambio de contraseña en SCODA",
-            message=(
-                f"Hola {user.first_name or user.email},\n\n"
-                f"Tu contraseña ha sido cambiada correctamente.\n\n"
-                f"Si no realizaste este cambio, contacta al administrador.\n\n"
-                f"Saludos,\nEquipo SCODA"
-            ),
-            from_email=None,
-            recipient_list=[user.email],
-            fail_silently=False,
+        trabajo = encolar_correo_cuenta("cambio_password", user)
+        return Response(
+            {"message": "Contraseña actualizada con éxito", "envio": estado_envio(trabajo)},
+            status=200
         )
-        return Response({"message": "Contraseña actualizada con éxito"}, status=200)
 
     # ----------------------------------------------------------
     # ENVIAR LINK DE RESETEO
@@ -174,24 +173,8 @@ class UsuarioViewSet(AuditoriaMixin, viewsets.ModelViewSet):
         except Usuario.DoesNotExist:
             return Response({"error": "Usuario no encontrado"}, status=404)
 
-        # Generar token clásico de Django
-        uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
-        token = default_token_generator.make_token(user)
-        reset_url = f"{settings.FRONTEND_URL}/reset-password-form/{uidb64}/{token}/"
-
-        send_mail(
-            subject="Restablecer contraseña - SCODA",
-            message=(
-                f"Hola {user.first_name or user.email},\n\n"
-                f"Para definir o restablecer tu contraseña, haz clic en el siguiente enlace:\n"
-                f"{reset_url}\n\n"
-                f"Este enlace expira en 24 horas.\n\n"
-                f"Saludos,\nEquipo SCODA"
-            ),
-            from_email=None,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
+        # El enlace (token clásico de Django) se genera al enviar
+        trabajo = encolar_correo_cuenta("link_reset", user)
 
         #Registrar auditoría
         self.registrar_auditoria(
@@ -201,7 +184,26 @@ class UsuarioViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             f"Se envió link de restablecimiento a {email}"
         )
 
-        return Response({"message": "Correo de restablecimiento enviado"}, status=200)
+        return Response(
+            {"message": "Correo de restablecimiento enviado", "envio": estado_envio(trabajo)},
+            status=200
+        )
+
+    # ----------------------------------------------------------
+    # ESTADO DE LOS CORREOS DE LA CUENTA (cola de envío)
+    # ----------------------------------------------------------
+    @action(detail=True, methods=["get"], url_path="correos")
+    def correos(self, request, email=None):
+        user = self.get_object()
+        trabajos = TrabajoNotificacion.objects.filter(
+            usuario=user,
+            tipo=TIPO_CORREO_CUENTA
+        ).order_by("-id")[:20]
+
+        return Response([
+            {"plantilla": t.datos.get("plantilla"), **estado_envio(t)}
+            for t in trabajos
+        ])
 
     # ----------------------------------------------------------
     # CONFIRMAR NUEVA CONTRASEÑA (link público)
@@ -225,20 +227,12 @@ class UsuarioViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             mensaje=f"El usuario {user.email} definió su contraseña con link.",
         )
 
-        send_mail(
-            subject="Contraseña creada en SCODA",
-            message=(
-                f"Hola {user.first_name or user.email},\n\n"
-                f"Tu contraseña ha sido definida correctamente.\n\n"
-                f"Si no realizaste este proceso, contacta al administrador.\n\n"
-                f"Saludos,\nEquipo SCODA"
-            ),
-            from_email=None,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
+        trabajo = encolar_correo_cuenta("password_definida", user)
 
-        return Response({"message": "Contraseña creada con éxito"}, status=200)
+        return Response(
+            {"message": "Contraseña creada con éxito", "envio": estado_envio(trabajo)},
+            status=200
+        )
 
 
 # ==============================================================
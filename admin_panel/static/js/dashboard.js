@@ -96,28 +96,16 @@ document.addEventListener("DOMContentLoaded", () => {
         try {
             const q = cursoId ? `?curso_id=${cursoId}` : "";
 
-            const endpoints = {
-                ausentes: `${BASE}/api/estado-alumnos/ausentes${q}`,
-                extension: `${BASE}/api/estado-alumnos/extension${q}`,
-                anticipados: `${BASE}/api/estado-alumnos/retiros-anticipados${q}`,
-                retiros: `${BASE}/api/estado-alumnos/retiros${q}`,
-            };
-
-            const responses = await Promise.all([
-                fetch(endpoints.ausentes, { headers: getHeaders() }),
-                fetch(endpoints.extension, { headers: getHeaders() }),
-                fetch(endpoints.anticipados, { headers: getHeaders() }),
-                fetch(endpoints.retiros, { headers: getHeaders() }),
-            ]);
-
-            const [aus, ext, ant, ret] = await Promise.all(
-                responses.map(r => r.json())
-            );
-
-            const totalAus = aus?.total_ausentes ?? 0;
-            const totalExt = ext?.total_extension ?? 0;
-            const totalAnt = ant?.total_retiros_anticipados ?? 0;
-            const totalRet = ret?.total_retiros ?? 0;
+            // Un solo endpoint con conteos; el navegador revalida con ETag (304)
+            const res = await fetch(`${BASE}/api/estado-alumnos/resumen${q}`, {
+                headers: getHeaders()
+            });
+            const resumen = await res.json();
+
+            const totalAus = resumen?.total_ausentes ?? 0;
+            const totalExt = resumen?.total_extension ?? 0;
+            const totalAnt = resumen?.total_retiros_anticipados ?? 0;
+            const totalRet = resumen?.total_retiros ?? 0;
 
             document.getElementById("ausentes-count").textContent = totalAus;
             document.getElementById("extension-count").textContent = totalExt;
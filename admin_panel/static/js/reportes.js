@@ -156,7 +156,11 @@ document.addEventListener("DOMContentLoaded", () => {
                     <td>${item.observacion || ""}</td>
                     <td>
                         ${
-                            item.foto_documento
+                            item.foto_miniatura
+                                ? `<img class="img-thumbnail" style="max-height:48px; cursor:pointer;"
+                                        data-miniatura="${item.foto_miniatura}" alt="Foto"
+                                        onclick="verFoto('${item.foto_documento}')">`
+                                : item.foto_documento
                                 ? `<button class="btn btn-sm btn-outline-success" onclick="verFoto('${item.foto_documento}')">
                                         <i class="bi bi-image"></i>
                                    </button>`
@@ -166,20 +170,50 @@ document.addEventListener("DOMContentLoaded", () => {
                 </tr>
             `;
         });
+
+        cargarMiniaturas();
+    }
+
+    // =======================================================
+    // MINIATURAS (la foto completa solo se descarga al abrirla)
+    // =======================================================
+    function cargarMiniaturas() {
+        tablaRetiros.querySelectorAll("img[data-miniatura]").forEach(async img => {
+            try {
+                const res = await fetch(img.dataset.miniatura, { headers });
+                if (!res.ok) throw new Error("Error HTTP cargando miniatura");
+                img.src = URL.createObjectURL(await res.blob());
+            } catch (error) {
+                console.error("Error cargando miniatura:", error);
+            }
+        });
     }
 
     // =======================================================
-    // VER FOTO (BASE64) EN MODAL
+    // VER FOTO EN MODAL (URL DEL ALMACÉN DE FOTOS O BASE64 LEGADO)
     // =======================================================
-    window.verFoto = function (base64) {
-        imgFoto.src = base64.startsWith("data:")
-            ? base64
-            : `data:image/jpeg;base64,${base64}`;
+    window.verFoto = async function (foto) {
+        if (foto.startsWith("http") || foto.startsWith("/")) {
+            try {
+                // La URL requiere token: se descarga y se muestra como blob
+                const res = await fetch(foto, { headers });
+                if (!res.ok) throw new Error("Error HTTP cargando foto");
+                imgFoto.src = URL.createObjectURL(await res.blob());
+            } catch (error) {
+                console.error("Error cargando foto:", error);
+                alert("No se pudo cargar la foto.");
+                return;
+            }
+        } else {
+            imgFoto.src = foto.startsWith("data:")
+                ? foto
+                : `data:image/jpeg;base64,${foto}`;
+        }
         modalFoto.show();
     };
 
     // =======================================================
-    // EXPORTAR CSV (SIN RUN Y SIN FOTO)
+    // EXPORTAR CSV (SIN RUN Y SIN FOTO, GENERADO EN STREAMING POR EL SERVIDOR)
     // =======================================================
     async function exportarCSV() {
 
@@ -191,35 +225,23 @@ document.addEventListener("DOMContentLoaded", () => {
             return;
         }
 
-        const url = `${API_BASE_URL}/api/estado-alumnos/retiros?curso_id=${cursoId}&fecha=${fecha}`;
+        const url = `${API_BASE_URL}/api/estado-alumnos/exportar?curso_id=${cursoId}&desde=${fecha}&hasta=${fecha}&estado=RETIRADO`;
 
         try {
             showLoader();
 
             const res = await fetch(url, { headers });
-            const data = await res.json();
 
-            const alumnos = data.alumnos || [];
+            if (!res.ok) throw new Error("Error HTTP exportando CSV");
 
-            if (alumnos.length === 0) {
+            const csv = await res.text();
+
+            // Solo el encabezado: no hay retiros en el rango
+            if (csv.split("\n").filter(linea => linea.trim()).length <= 1) {
                 alert("No hay datos para exportar.");
                 return;
             }
 
-            let csv = "Alumno,Curso,Fecha,Hora,Estado,Retirado por,Parentesco,Registrado por,Comentario\n";
-
-            alumnos.forEach(item => {
-                csv += `"${item.alumno_nombre}",`;
-                csv += `"${item.curso_nombre}",`;
-                csv += `"${formatFecha(item.fecha)}",`;
-                csv += `"${formatHora(item.hora_registro)}",`;
-                csv += `"${item.estado}",`;
-                csv += `"${item.quien_retiro || ""}",`;
-                csv += `"${item.parentesco || ""}",`;
-                csv += `"${item.quien_registro || ""}",`;
-                csv += `"${item.observacion || ""}"\n`;
-            });
-
             const blob = new Blob([csv], { type: "text/csv;charset=utf-8;" });
             const link = document.createElement("a");
             link.href = URL.createObjectURL(blob);
@@ -1,22 +1,20 @@
-import threading
-import time
-from threading import Lock
+import traceback
+
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import EmailMultiAlternatives
-from django.conf import settings
 from django.utils import timezone
-from datetime import timedelta
+from django.db.models import Q
 from estados.models import HistorialEstadoAlumno
+from estados.signals import historiales_creados
 from alumnos.models import PersonaAutorizadaAlumno
+from notificaciones.cola import encolar_agrupado, manejador
+from notificaciones.correo import crear_mensaje, enviar_correos
 from notificaciones.models import Notificacion
+from personas.models import Persona
 
 
+# Retiros del mismo apoderado dentro de esta ventana salen en un solo correo
 AGRUPACION_SEGUNDOS = 10
-DELAY_REVISION = 1
-
-LOCK_UNIFICADO = Lock()
-ULTIMO_ENVIO_UNIFICADO = None
 
 
 def html_scoda(titulo, contenido):
@@ -34,155 +32,176 @@ def html_scoda(titulo, contenido):
     """
 
 
-def enviar_individual(instance, persona_apoderado):
+def personas_retiro(historial):
+    """
+    Líneas "Retirado por" / "Registrado por". Un retiro sin usuario (carga
+    por trigger, usuario eliminado) o sin persona vinculada omite la línea.
+    """
+    registrado_por = getattr(historial.usuario_registro, 'persona', None)
+    retirado_por = historial.retirado_por or registrado_por
+    lineas = ""
+    for etiqueta, persona in (("Retirado por", retirado_por), ("Registrado por", registrado_por)):
+        if persona:
+            lineas += f"<p><strong>{etiqueta}:</strong> {persona.nombres} {persona.apellido_uno}</p>\n"
+    return lineas
+
+
+def correo_individual(instance, email):
     alumno = instance.alumno.persona
     nombre = f"{alumno.nombres} {alumno.apellido_uno} {alumno.apellido_dos or ''}"
     curso = instance.curso.nombre
     fecha = instance.fecha.strftime("%d/%m/%Y")
     hora = timezone.localtime(instance.hora_cambio).strftime("%H:%M")
-    retirado_por = instance.retirado_por or instance.usuario_registro.persona
-    registrado_por = instance.usuario_registro.persona
 
     contenido = f"""
         <p><strong>Alumno:</strong> {nombre}</p>
         <p><strong>Curso:</strong> {curso}</p>
-        <p><strong>Retirado por:</strong> {retirado_por.nombres} {retirado_por.apellido_uno}</p>
-        <p><strong>Registrado por:</strong> {registrado_por.nombres} {registrado_por.apellido_uno}</p>
+        {personas_retiro(instance)}
         <p><strong>Fecha:</strong> {fecha}</p>
         <p><strong>Hora:</strong> {hora}</p>
     """
 
     html = html_scoda("Notificación de Retiro - SCODA", contenido)
-    email = persona_apoderado.email
-    if not email:
-        return
-
-    email_obj = EmailMultiAlternatives(
-        subject=f"Retiro de {nombre} - SCODA",
-        body="Retiro registrado.",
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=[email]
-    )
-    email_obj.attach_alternative(html, "text/html")
-    email_obj.send()
-
-    Notificacion.objects.create(
-        usuario=persona_apoderado.usuario,
-        mensaje=f"Retiro de {nombre}"
-    )
-
-
-def enviar_unificado(retiros, persona_apoderado):
-    global ULTIMO_ENVIO_UNIFICADO
+    return crear_mensaje(f"Retiro de {nombre} - SCODA", "Retiro registrado.", [email], html=html)
+
+
+def correo_unificado(retiros, email):
+    first = retiros[0]
+    fecha = first.fecha.strftime("%d/%m/%Y")
+
+    filas = ""
+    for r in retiros:
+        pa = r.alumno.persona
+        curso = r.curso.nombre
+        hora = timezone.localtime(r.hora_cambio).strftime("%H:%M")
+        filas += f"""
+            <tr>
+                <td style="padding:8px; border:1px solid #ccc;">{pa.nombres} {pa.apellido_uno} {pa.apellido_dos or ''}</td>
+                <td style="padding:8px; border:1px solid #ccc;">{curso}</td>
+                <td style="padding:8px; border:1px solid #ccc;">{hora}</td>
+            </tr>
+        """
 
-    if not LOCK_UNIFICADO.acquire(blocking=False):
-        print("Unificado omitido")
-        return
+    contenido = f"""
+        {personas_retiro(first)}
+        <p><strong>Fecha:</strong> {fecha}</p>
 
-    try:
-        ahora = timezone.now()
-        if ULTIMO_ENVIO_UNIFICADO and ULTIMO_ENVIO_UNIFICADO > ahora - timedelta(seconds=5):
-            print("Unificado omitido por ventana")
-            return
-
-        ULTIMO_ENVIO_UNIFICADO = ahora
-
-        first = retiros[0]
-        retirado_por = first.retirado_por or first.usuario_registro.persona
-        registrado_por = first.usuario_registro.persona
-        fecha = first.fecha.strftime("%d/%m/%Y")
-
-        filas = ""
-        for r in retiros:
-            pa = r.alumno.persona
-            curso = r.curso.nombre
-            hora = timezone.localtime(r.hora_cambio).strftime("%H:%M")
-            filas += f"""
-                <tr>
-                    <td style="padding:8px; border:1px solid #ccc;">{pa.nombres} {pa.apellido_uno} {pa.apellido_dos or ''}</td>
-                    <td style="padding:8px; border:1px solid #ccc;">{curso}</td>
-                    <td style="padding:8px; border:1px solid #ccc;">{hora}</td>
+        <table style="width:100%; border-collapse:collapse; margin-top:20px;">
+            <thead>
+                <tr style="background:#e8f5e9;">
+                    <th style="padding:10px; border:1px solid #ccc;">Alumno</th>
+                    <th style="padding:10px; border:1px solid #ccc;">Curso</th>
+                    <th style="padding:10px; border:1px solid #ccc;">Hora</th>
                 </tr>
-            """
-
-        contenido = f"""
-            <p><strong>Retirado por:</strong> {retirado_por.nombres} {retirado_por.apellido_uno}</p>
-            <p><strong>Registrado por:</strong> {registrado_por.nombres} {registrado_por.apellido_uno}</p>
-            <p><strong>Fecha:</strong> {fecha}</p>
-
-            <table style="width:100%; border-collapse:collapse; margin-top:20px;">
-                <thead>
-                    <tr style="background:#e8f5e9;">
-                        <th style="padding:10px; border:1px solid #ccc;">Alumno</th>
-                        <th style="padding:10px; border:1px solid #ccc;">Curso</th>
-                        <th style="padding:10px; border:1px solid #ccc;">Hora</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {filas}
-                </tbody>
-            </table>
-        """
+            </thead>
+            <tbody>
+                {filas}
+            </tbody>
+        </table>
+    """
 
-        html = html_scoda("Retiros múltiples - SCODA", contenido)
-        email = persona_apoderado.email
-        if not email:
-            return
+    html = html_scoda("Retiros múltiples - SCODA", contenido)
+    return crear_mensaje(
+        "Retiros múltiples de alumnos - SCODA", "Retiros múltiples registrados.", [email], html=html
+    )
 
-        email_obj = EmailMultiAlternatives(
-            subject="Retiros múltiples de alumnos - SCODA",
-            body="Retiros múltiples registrados.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email]
-        )
-        email_obj.attach_alternative(html, "text/html")
-        email_obj.send()
 
-        Notificacion.objects.create(
-            usuario=persona_apoderado.usuario,
-            mensaje=f"Retiros múltiples ({len(retiros)})"
-        )
+def mensaje_notificacion(retiros):
+    if len(retiros) > 1:
+        return f"Retiros múltiples ({len(retiros)})"
+    alumno = retiros[0].alumno.persona
+    return f"Retiro de {alumno.nombres} {alumno.apellido_uno} {alumno.apellido_dos or ''}"
 
-        print("Unificado enviado")
 
-    finally:
-        LOCK_UNIFICADO.release()
+# ----------------------------------------------------------
+# ENVÍO (worker de la cola)
+# ----------------------------------------------------------
+@manejador("RETIRO", lote=True)
+def procesar_retiros(lote):
+    """
+    Trabajos de la cola, un trabajo por destinatario con los retiros que se
+    agruparon en él (datos["items"] = ids de historial). Todo el lote con
+    una consulta por tabla: notificaciones con bulk_create y correos por una
+    sola conexión. Cada trabajo arma su correo por separado: si uno falla
+    (al armarlo o al enviarlo) solo ese trabajo queda para reintento, sin
+    crear su notificación (se crea cuando el correo sale).
+    """
+    personas = Persona.objects.in_bulk({datos.get("persona_id") for datos in lote})
+    historiales = HistorialEstadoAlumno.objects.select_related(
+        "alumno__persona", "curso", "retirado_por", "usuario_registro__persona"
+    ).in_bulk({i for datos in lote for i in datos.get("items", [])})
+
+    errores = [None] * len(lote)
+    listos = []   # (posición en el lote, persona, correo o None, texto de la notificación)
+    for posicion, datos in enumerate(lote):
+        try:
+            persona = personas.get(datos["persona_id"])
+            retiros = sorted(
+                (historiales[i] for i in datos["items"] if i in historiales and historiales[i].estado == "RETIRADO"),
+                key=lambda h: h.hora_cambio
+            )
+            if not persona or not retiros:
+                continue
+            correo = None
+            if persona.email:
+                correo = (correo_unificado(retiros, persona.email) if len(retiros) > 1
+                          else correo_individual(retiros[0], persona.email))
+            listos.append((posicion, persona, correo, mensaje_notificacion(retiros)))
+        except Exception:
+            errores[posicion] = traceback.format_exc(limit=5)
+
+    con_correo = [(posicion, correo) for posicion, _, correo, _ in listos if correo]
+    resultados = enviar_correos([correo for _, correo in con_correo])
+    for (posicion, _), resultado in zip(con_correo, resultados):
+        if not resultado["enviado"]:
+            errores[posicion] = resultado["error"]
+
+    # Notificación en la app para usuarios y personas sin cuenta por igual
+    Notificacion.objects.bulk_create([
+        Notificacion(usuario_id=persona.usuario_id, persona=persona, mensaje=mensaje)
+        for posicion, persona, _, mensaje in listos
+        if errores[posicion] is None
+    ])
+    return errores
+
+
+# ----------------------------------------------------------
+# FAN-OUT: un trabajo por apoderado/autorizado de cada alumno
+# ----------------------------------------------------------
+def encolar_retiros(historiales):
+    """
+    Resuelve con una consulta todos los destinatarios (apoderados y personas
+    autorizadas) de los retiros del lote y los encola con una sentencia.
+    Debounce por destinatario en la BD: si ya tiene un trabajo pendiente,
+    los retiros se suman a ese correo. Lo envía procesar_notificaciones.
+    """
+    retiros = [h for h in historiales if h.estado == "RETIRADO"]
+    if not retiros:
+        return 0
+
+    destinatarios = {}
+    for alumno_id, persona_id in PersonaAutorizadaAlumno.objects.filter(
+        Q(autorizado=True) | Q(tipo_relacion__icontains="apoderado"),
+        alumno_id__in={h.alumno_id for h in retiros}
+    ).values_list("alumno_id", "persona_id"):
+        destinatarios.setdefault(alumno_id, []).append(persona_id)
 
+    grupos = {}
+    for h in retiros:
+        for persona_id in destinatarios.get(h.alumno_id, []):
+            grupo = grupos.setdefault(f"retiro:{persona_id}", {"persona_id": persona_id, "items": []})
+            grupo["items"].append(h.id)
 
-def procesar_retiros(instance, persona_apoderado):
-    time.sleep(DELAY_REVISION)
+    return encolar_agrupado("RETIRO", grupos, ventana=AGRUPACION_SEGUNDOS)
 
-    hace_x = timezone.now() - timedelta(seconds=AGRUPACION_SEGUNDOS)
-    retiros = HistorialEstadoAlumno.objects.filter(
-        usuario_registro=instance.usuario_registro,
-        estado="RETIRADO",
-        fecha=instance.fecha,
-        hora_cambio__gte=hace_x
-    ).order_by("hora_cambio")
 
-    if retiros.count() > 1:
-        enviar_unificado(retiros, persona_apoderado)
-    else:
-        enviar_individual(instance, persona_apoderado)
+@receiver(historiales_creados)
+def signal_retiros_lote(sender, historiales, **kwargs):
+    encolar_retiros(historiales)
 
 
 @receiver(post_save, sender=HistorialEstadoAlumno)
 def signal_retiro(sender, instance, created, **kwargs):
     if not created or instance.estado != "RETIRADO":
         return
-
-    apoderado_rel = PersonaAutorizadaAlumno.objects.filter(
-        alumno=instance.alumno,
-        tipo_relacion__icontains="apoderado"
-    ).first()
-
-    if not apoderado_rel:
-        return
-
-    persona_apoderado = apoderado_rel.persona
-
-    threading.Thread(
-        target=procesar_retiros,
-        args=(instance, persona_apoderado),
-        daemon=True
-    ).start()
+    encolar_retiros([instance])
@@ -1,3 +1,134 @@
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from accounts.models import Usuario
+from escuela.models import Curso
+from establecimientos.models import Establecimiento
+from estados.models import EstadoAlumno, HistorialEstadoAlumno
+from notificaciones.models import Notificacion
+from personas.models import Persona
+from ubicacion.models import Comuna, Pais, Region
+from .models import Alumno
+from .signals import correo_individual, procesar_retiros
+
+
+class ProcesarRetirosTests(TestCase):
+    """Correos de retiro del worker: un trabajo que falla no arrastra al resto del lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        pais = Pais.objects.create(nombre="Chile")
+        region = Region.objects.create(nombre="Metropolitana", pais=pais)
+        comuna = Comuna.objects.create(nombre="Santiago", region=region)
+        establecimiento = Establecimiento.objects.create(nombre="Colegio Prueba", comuna=comuna)
+        curso = Curso.objects.create(nombre="1A", nivel=1, establecimiento=establecimiento, hora_termino="15:00")
+        porteria = Usuario.objects.create_user(email="porteria@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA)
+
+        alumnos = [
+            Alumno.objects.create(persona=Persona.objects.create(nombres=f"Alumno{n}", apellido_uno="Prueba"), curso=curso)
+            for n in range(2)
+        ]
+        cls.apoderados = [
+            Persona.objects.create(nombres=f"Apoderado{n}", apellido_uno="Prueba", email=f"apoderado{n}@prueba.cl")
+            for n in range(2)
+        ]
+
+        cls.historiales = []
+        # El segundo retiro no tiene quién lo registró (p. ej. cargado por trigger)
+        for alumno, usuario in zip(alumnos, [porteria, None]):
+            estado = EstadoAlumno.objects.create(
+                alumno=alumno, curso=curso, fecha=date(2024, 6, 12), estado='RETIRADO', usuario_registro=usuario
+            )
+            cls.historiales.extend(HistorialEstadoAlumno.objects.bulk_create([HistorialEstadoAlumno(
+                estado_alumno=estado, alumno=alumno, curso=curso, fecha=estado.fecha,
+                estado='RETIRADO', usuario_registro=usuario
+            )]))
+
+    def lote(self):
+        return [
+            {"persona_id": apoderado.id, "items": [historial.id]}
+            for apoderado, historial in zip(self.apoderados, self.historiales)
+        ]
+
+    def test_retiro_sin_usuario_registro_se_notifica(self):
+        errores = procesar_retiros(self.lote())
+
+        self.assertEqual(errores, [None, None])
+        self.assertEqual([m.to for m in mail.outbox], [[a.email] for a in self.apoderados])
+        con_usuario, sin_usuario = (m.alternatives[0][0] for m in mail.outbox)
+        self.assertIn("Registrado por:", con_usuario)
+        self.assertNotIn("Registrado por:", sin_usuario)
+        self.assertEqual(
+            Notificacion.objects.filter(persona__in=self.apoderados).count(), 2
+        )
+
+    def test_error_de_un_trabajo_no_afecta_al_resto(self):
+        def falla_el_segundo(historial, email):
+            if email == self.apoderados[1].email:
+                raise ValueError("plantilla")
+            return correo_individual(historial, email)
+
+        with mock.patch("alumnos.signals.correo_individual", side_effect=falla_el_segundo):
+            errores = procesar_retiros(self.lote())
+
+        self.assertIsNone(errores[0])
+        self.assertIn("ValueError", errores[1])
+        self.assertEqual([m.to for m in mail.outbox], [[self.apoderados[0].email]])
+        self.assertEqual(
+            list(Notificacion.objects.filter(persona__in=self.apoderados).values_list('persona_id', flat=True)),
+            [self.apoderados[0].id]
+        )
+
+
+class CalendarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        pais = Pais.objects.create(nombre="Chile")
+        region = Region.objects.create(nombre="Metropolitana", pais=pais)
+        comuna = Comuna.objects.create(nombre="Santiago", region=region)
+        establecimiento = Establecimiento.objects.create(nombre="Colegio Prueba", comuna=comuna)
+        curso = Curso.objects.create(nombre="1A", nivel=1, establecimiento=establecimiento, hora_termino="15:00")
+        cls.usuario = Usuario.objects.create_user(email="calendario@prueba.cl", password="x", rol=Usuario.Roles.ADMIN)
+        cls.alumno = Alumno.objects.create(
+            persona=Persona.objects.create(nombres="Alumno", apellido_uno="Prueba"), curso=curso
+        )
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=cls.alumno, curso=curso, fecha=date(2024, 1, 2), estado='AUSENTE'),
+            EstadoAlumno(alumno=cls.alumno, curso=curso, fecha=date(2024, 1, 3), estado='AUSENTE'),
+            EstadoAlumno(alumno=cls.alumno, curso=curso, fecha=date(2024, 1, 5), estado='RETIRADO',
+                         retiro_anticipado=True),
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.client.credentials(HTTP_X_API_KEY=settings.SCODA_API_KEY)
+
+    def calendario(self, pk, **params):
+        return self.client.get(f'/api/alumnos/{pk}/calendario', params)
+
+    def test_dias_y_rle(self):
+        dias = self.calendario(self.alumno.id, anio=2024).json()
+        self.assertEqual(len(dias['dias']), 366)
+        self.assertEqual(dias['dias'][:6], ".AA.T.")
+        self.assertEqual(dias['totales']['A'], 2)
+
+        rle = self.calendario(self.alumno.id, anio=2024, formato='rle').json()
+        self.assertEqual(rle['rle'], ".2A.T361.")
+
+    def test_etag_responde_304(self):
+        primera = self.calendario(self.alumno.id, anio=2023)
+        segunda = self.client.get(
+            f'/api/alumnos/{self.alumno.id}/calendario', {'anio': 2023}, HTTP_IF_NONE_MATCH=primera['ETag']
+        )
+        self.assertEqual(segunda.status_code, 304)
 
-# Create your tests here.
+    def test_alumno_inexistente_o_invalido_responde_404(self):
+        for pk in (self.alumno.id + 1000, 'abc'):
+            self.assertEqual(self.calendario(pk, anio=2024).status_code, 404, pk)
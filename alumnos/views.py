@@ -1,4 +1,7 @@
+import hashlib
+from datetime import date
 from django.db import IntegrityError
+from django.http import HttpResponseNotModified
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -12,6 +15,9 @@ from .serializers import AlumnoSerializer
 from personas.models import Persona
 from escuela.models import Curso
 from ubicacion.models import Direccion
+from estados.utils import (
+    calendario_anual, comprimir_rle, CODIGOS_CALENDARIO, CODIGO_ANTICIPADO, CODIGO_SIN_REGISTRO,
+)
 
 def format_direccion(d):
     if not d:
@@ -150,6 +156,55 @@ class AlumnoViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             "total_autorizados": len(data_autorizados)
         })
 
+    # =====================================
+    # CALENDARIO ANUAL DE ASISTENCIA
+    # =====================================
+    @action(detail=True, methods=['get'], url_path='calendario')
+    def calendario(self, request, pk=None):
+        """
+        Un carácter por día del año (`dias`, posición 0 = 1 de enero):
+        A ausente, R retirado, T retiro anticipado, E extensión, . sin registro.
+        Con `formato=rle` se entrega comprimido por largo de racha ("4.2A.").
+        """
+        try:
+            anio = int(request.query_params.get('anio') or date.today().year)
+            if not 2000 <= anio <= 2100:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "Año inválido."}, status=400)
+
+        alumno = self.get_object()
+
+        dias = calendario_anual(alumno.id, anio)
+        data = {
+            "alumno_id": alumno.id,
+            "anio": anio,
+            "leyenda": {**{v: k for k, v in CODIGOS_CALENDARIO.items()},
+                        CODIGO_ANTICIPADO: "RETIRO_ANTICIPADO", CODIGO_SIN_REGISTRO: "SIN_REGISTRO"},
+            "totales": {
+                codigo: dias.count(codigo)
+                for codigo in (*CODIGOS_CALENDARIO.values(), CODIGO_ANTICIPADO)
+            },
+        }
+        if request.query_params.get('formato') == 'rle':
+            data["formato"] = "rle"
+            data["rle"] = comprimir_rle(dias)
+        else:
+            data["formato"] = "dias"
+            data["dias"] = dias
+
+        # Cacheable por (alumno, año): el ETag cambia solo si cambia el calendario
+        etag = '"%s-%s-%s"' % (alumno.id, anio, hashlib.md5(dias.encode()).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        # Años cerrados casi no cambian; el año en curso se revalida siempre
+        response['Cache-Control'] = 'private, max-age=86400' if anio < date.today().year else 'private, no-cache'
+        return response
+
     # ===============
     # UPDATE ALUMNO
     # ===============
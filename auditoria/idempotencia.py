@@ -0,0 +1,116 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import SolicitudIdempotente
+
+
+IDEMPOTENCIA_TTL = timedelta(hours=24)
+# Sin respuesta después de esto, el worker que la atendía murió: se retoma
+IDEMPOTENCIA_EN_PROCESO_MAXIMO = timedelta(minutes=5)
+IDEMPOTENCIA_HEADER = 'Idempotency-Key'
+
+
+def _huella(request):
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(request.get_full_path().encode())
+    h.update(request.body)
+    return h.hexdigest()
+
+
+def _retomar_abandonada(usuario, clave, huella, ahora):
+    """
+    Toma una solicitud sin respuesta más antigua que IDEMPOTENCIA_EN_PROCESO_MAXIMO
+    y con el mismo cuerpo, para volver a ejecutar la vista. select_for_update:
+    si llegan dos reintentos a la vez, solo uno la retoma (el otro, al obtener
+    el lock, ya no la ve como abandonada).
+    """
+    with transaction.atomic():
+        registro = SolicitudIdempotente.objects.select_for_update().filter(
+            usuario=usuario,
+            clave=clave,
+            huella=huella,
+            estado_http__isnull=True,
+            creado__lt=ahora - IDEMPOTENCIA_EN_PROCESO_MAXIMO
+        ).first()
+        if registro is None:
+            return None
+        registro.creado = ahora
+        registro.expira = ahora + IDEMPOTENCIA_TTL
+        registro.save(update_fields=['creado', 'expira'])
+    return registro
+
+
+def idempotente(vista):
+    """
+    Decorador para acciones POST: si el cliente envía `Idempotency-Key`,
+    la primera respuesta se guarda y los reintentos con la misma clave la
+    reciben tal cual, sin volver a ejecutar la vista.
+    - Reintento mientras la primera sigue en curso: 409 con Retry-After.
+      Si lleva más de IDEMPOTENCIA_EN_PROCESO_MAXIMO sin respuesta (worker
+      caído), el reintento la retoma y ejecuta la vista.
+    - Misma clave con otro cuerpo o ruta: 422.
+    - Errores 5xx o excepciones no se guardan: el cliente puede reintentar.
+    Sin header la vista se ejecuta normalmente.
+    """
+    @wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get(IDEMPOTENCIA_HEADER)
+        if not clave:
+            return vista(self, request, *args, **kwargs)
+        if len(clave) > 255:
+            return Response({'error': f'{IDEMPOTENCIA_HEADER} demasiado largo.'}, status=400)
+
+        usuario = request.user if request.user.is_authenticated else None
+        huella = _huella(request)
+        ahora = timezone.now()
+
+        # El registro vencido cuenta como inexistente
+        SolicitudIdempotente.objects.filter(usuario=usuario, clave=clave, expira__lt=ahora).delete()
+
+        try:
+            with transaction.atomic():
+                registro = SolicitudIdempotente.objects.create(
+                    usuario=usuario,
+                    clave=clave,
+                    ruta=request.path[:255],
+                    huella=huella,
+                    expira=ahora + IDEMPOTENCIA_TTL
+                )
+        except IntegrityError:
+            registro = _retomar_abandonada(usuario, clave, huella, ahora)
+            if registro is None:
+                previo = SolicitudIdempotente.objects.filter(usuario=usuario, clave=clave).first()
+                if previo is None or previo.estado_http is None:
+                    return Response(
+                        {'error': 'Hay una solicitud con esta clave en proceso.'},
+                        status=409,
+                        headers={'Retry-After': '1'}
+                    )
+                if previo.huella != huella:
+                    return Response(
+                        {'error': f'{IDEMPOTENCIA_HEADER} ya fue usado con otra solicitud.'},
+                        status=422
+                    )
+                return Response(previo.respuesta, status=previo.estado_http, headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = vista(self, request, *args, **kwargs)
+        except Exception:
+            registro.delete()
+            raise
+
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            registro.delete()
+        else:
+            registro.estado_http = response.status_code
+            registro.respuesta = response.data
+            registro.save(update_fields=['estado_http', 'respuesta'])
+        return response
+
+    return envoltura
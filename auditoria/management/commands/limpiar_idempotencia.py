@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from auditoria.models import SolicitudIdempotente
+
+
+class Command(BaseCommand):
+    help = "Elimina las respuestas idempotentes vencidas (Idempotency-Key)"
+
+    def handle(self, *args, **options):
+        eliminadas, _ = SolicitudIdempotente.objects.filter(expira__lt=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Se eliminaron {eliminadas} registros vencidos."))
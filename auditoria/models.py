@@ -1,6 +1,7 @@
 ﻿# auditoria/models.py
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
 
@@ -23,3 +24,36 @@ class Auditoria(models.Model):
 
     def __str__(self):
         return f"{self.fecha:%Y-%m-%d %H:%M} - {self.accion} por {self.usuario_id}"
+
+
+class SolicitudIdempotente(models.Model):
+    """
+    Respuesta guardada de un POST con header Idempotency-Key (ver
+    auditoria/idempotencia.py). Se elimina al vencer `expira`
+    con `manage.py limpiar_idempotencia`.
+    """
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='solicitudes_idempotentes'
+    )
+    clave = models.CharField(max_length=255)
+    ruta = models.CharField(max_length=255)
+    # SHA-256 de método + ruta + cuerpo: la misma clave con otro cuerpo es un error
+    huella = models.CharField(max_length=64)
+    # Nulo mientras la primera solicitud sigue en proceso
+    estado_http = models.PositiveSmallIntegerField(blank=True, null=True)
+    respuesta = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    creado = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'solicitud_idempotente'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='unique_idempotencia_usuario_clave')
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.ruta})"
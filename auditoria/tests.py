@@ -1,3 +1,83 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from rest_framework.response import Response
+
+from accounts.models import Usuario
+from .idempotencia import IDEMPOTENCIA_EN_PROCESO_MAXIMO, IDEMPOTENCIA_HEADER, idempotente
+from .models import SolicitudIdempotente
+
+
+class VistaPrueba:
+    """Acción mínima decorada: cuenta cuántas veces se ejecuta."""
+
+    def __init__(self):
+        self.ejecuciones = 0
+
+    @idempotente
+    def crear(self, request):
+        self.ejecuciones += 1
+        return Response({'ejecucion': self.ejecuciones}, status=201)
+
+
+class IdempotenciaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email="idempotencia@prueba.cl", password="x")
+
+    def setUp(self):
+        self.vista = VistaPrueba()
+
+    def solicitud(self, clave="clave-1", cuerpo='{"a": 1}'):
+        request = RequestFactory().post(
+            '/api/prueba', data=cuerpo, content_type='application/json',
+            headers={IDEMPOTENCIA_HEADER: clave}
+        )
+        request.user = self.usuario
+        return request
+
+    def en_proceso(self, antiguedad):
+        """Simula una primera solicitud cuyo worker no alcanzó a responder."""
+        self.vista.crear(self.solicitud())
+        SolicitudIdempotente.objects.update(
+            estado_http=None, respuesta=None, creado=timezone.now() - antiguedad
+        )
+        self.vista.ejecuciones = 0
+
+    def test_reintento_repite_respuesta(self):
+        primera = self.vista.crear(self.solicitud())
+        segunda = self.vista.crear(self.solicitud())
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda.data, primera.data)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.vista.ejecuciones, 1)
+
+    def test_en_proceso_reciente_responde_409(self):
+        self.en_proceso(timedelta(seconds=5))
+        respuesta = self.vista.crear(self.solicitud())
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(self.vista.ejecuciones, 0)
+
+    def test_en_proceso_abandonada_se_retoma(self):
+        self.en_proceso(IDEMPOTENCIA_EN_PROCESO_MAXIMO + timedelta(seconds=1))
+
+        respuesta = self.vista.crear(self.solicitud())
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(self.vista.ejecuciones, 1)
+
+        registro = SolicitudIdempotente.objects.get()
+        self.assertEqual(registro.estado_http, 201)
+        self.assertEqual(registro.respuesta, {'ejecucion': 1})
+
+        # Los siguientes reintentos reciben la respuesta guardada
+        repetida = self.vista.crear(self.solicitud())
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.vista.ejecuciones, 1)
+
+    def test_abandonada_con_otro_cuerpo_no_se_retoma(self):
+        self.en_proceso(IDEMPOTENCIA_EN_PROCESO_MAXIMO + timedelta(seconds=1))
+        respuesta = self.vista.crear(self.solicitud(cuerpo='{"a": 2}'))
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(self.vista.ejecuciones, 0)
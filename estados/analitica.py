@@ -0,0 +1,114 @@
+from datetime import date
+
+from django.db import connection
+
+from alumnos.models import Alumno
+from escuela.models import Curso
+from personas.models import Persona
+from .models import EstadoAlumno, ResumenDiarioAsistencia
+
+
+def ausentismo_cronico(dias=30, umbral=10.0, racha=None, hasta=None,
+                       curso_ids=None, establecimiento_id=None, limite=200):
+    """
+    Alumnos con ausentismo crónico en los últimos `dias` días hábiles de su
+    curso (días con registros en resumen_diario_asistencia hasta `hasta`).
+    Una sola consulta: ventana de días por curso, islas de ausencias
+    consecutivas (racha máxima y actual) y ranking por curso y general.
+    Se marcan los alumnos con porcentaje >= umbral, o con racha actual
+    >= `racha` si se indica. Retorna una lista de dicts ordenada por gravedad.
+    """
+    hasta = hasta or date.today()
+
+    filtro = ""
+    params = [hasta]
+    if curso_ids:
+        filtro += " AND r.curso_id = ANY(%s)"
+        params.append([int(c) for c in curso_ids])
+    if establecimiento_id:
+        filtro += " AND r.establecimiento_id = %s"
+        params.append(establecimiento_id)
+
+    condicion = "porcentaje >= %s"
+    params_final = [umbral]
+    if racha:
+        condicion += " OR racha_actual >= %s"
+        params_final.append(racha)
+
+    sql = f"""
+        WITH ventana AS (
+            SELECT r.curso_id, r.fecha,
+                   ROW_NUMBER() OVER (PARTITION BY r.curso_id ORDER BY r.fecha DESC) AS idx
+            FROM {ResumenDiarioAsistencia._meta.db_table} r
+            WHERE r.fecha <= %s {filtro}
+        ),
+        ventana_n AS (
+            SELECT curso_id, fecha, idx FROM ventana WHERE idx <= %s
+        ),
+        dias_curso AS (
+            SELECT curso_id, COUNT(*) AS dias FROM ventana_n GROUP BY curso_id
+        ),
+        ausencias AS (
+            -- idx consecutivos = ausencias consecutivas: misma "isla"
+            SELECT e.alumno_id, e.curso_id, v.idx,
+                   v.idx - ROW_NUMBER() OVER (PARTITION BY e.alumno_id, e.curso_id ORDER BY v.idx) AS isla
+            FROM {EstadoAlumno._meta.db_table} e
+            JOIN ventana_n v ON v.curso_id = e.curso_id AND v.fecha = e.fecha
+            WHERE e.estado = 'AUSENTE'
+              -- acota el índice (fecha, estado, curso) al rango de la ventana
+              AND e.fecha >= (SELECT MIN(fecha) FROM ventana_n) AND e.fecha <= %s
+        ),
+        islas AS (
+            SELECT alumno_id, curso_id, COUNT(*) AS largo, MIN(idx) AS inicio
+            FROM ausencias
+            GROUP BY alumno_id, curso_id, isla
+        ),
+        por_alumno AS (
+            SELECT i.alumno_id, i.curso_id, d.dias,
+                   SUM(i.largo)::int AS ausencias,
+                   MAX(i.largo) AS racha_maxima,
+                   COALESCE(MAX(i.largo) FILTER (WHERE i.inicio = 1), 0) AS racha_actual,
+                   ROUND(100.0 * SUM(i.largo) / d.dias, 1) AS porcentaje
+            FROM islas i
+            JOIN dias_curso d ON d.curso_id = i.curso_id
+            GROUP BY i.alumno_id, i.curso_id, d.dias
+        ),
+        rankeado AS (
+            SELECT p.*,
+                   RANK() OVER (PARTITION BY p.curso_id ORDER BY p.porcentaje DESC) AS ranking_curso,
+                   RANK() OVER (ORDER BY p.porcentaje DESC) AS ranking_general
+            FROM por_alumno p
+        )
+        SELECT k.alumno_id, k.curso_id, c.nombre, k.dias, k.ausencias, k.porcentaje,
+               k.racha_maxima, k.racha_actual, k.ranking_curso, k.ranking_general,
+               pe.nombres, pe.apellido_uno, pe.apellido_dos
+        FROM rankeado k
+        JOIN {Curso._meta.db_table} c ON c.id = k.curso_id
+        JOIN {Alumno._meta.db_table} a ON a.id = k.alumno_id
+        JOIN {Persona._meta.db_table} pe ON pe.id = a.persona_id
+        WHERE {condicion}
+        ORDER BY k.porcentaje DESC, k.racha_actual DESC, k.alumno_id
+        LIMIT %s
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [dias, hasta] + params_final + [limite])
+        filas = cursor.fetchall()
+
+    return [
+        {
+            'alumno_id': alumno_id,
+            'alumno': " ".join(p for p in (nombres, apellido_uno, apellido_dos) if p),
+            'curso_id': curso_id,
+            'curso': curso,
+            'dias_habiles': dias_habiles,
+            'ausencias': ausencias,
+            'porcentaje_ausencia': float(porcentaje),
+            'racha_maxima': racha_maxima,
+            'racha_actual': racha_actual,
+            'ranking_curso': ranking_curso,
+            'ranking_general': ranking_general,
+        }
+        for (alumno_id, curso_id, curso, dias_habiles, ausencias, porcentaje, racha_maxima,
+             racha_actual, ranking_curso, ranking_general, nombres, apellido_uno, apellido_dos) in filas
+    ]
@@ -0,0 +1,116 @@
+import json
+import time
+from datetime import timedelta
+from itertools import takewhile
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.timezone import localtime
+from rest_framework.renderers import BaseRenderer
+
+from .models import HistorialEstadoAlumno
+
+
+# Parámetros del feed de cambios
+EVENTOS_LOTE = 200          # máximo de eventos por consulta
+SSE_INTERVALO = 1.0         # segundos entre consultas a la BD
+SSE_LATIDO = 15             # comentario ":" para mantener viva la conexión
+SSE_DURACION_MAXIMA = 55    # el cliente se reconecta solo (retry) con Last-Event-ID
+SSE_RETRY_MS = 3000
+LONGPOLL_ESPERA_MAXIMA = 25
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Permite que DRF acepte `Accept: text/event-stream` (EventSource)."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Solo se usa para errores (403/400); el stream arma su propio cuerpo
+        return f"event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+def ultimo_evento_id():
+    return HistorialEstadoAlumno.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def eventos_desde(cursor, filtros, limite=EVENTOS_LOTE):
+    """
+    Eventos compactos (dict) del historial con id > cursor, en orden de id.
+    El id del historial es el cursor del feed (Last-Event-ID).
+    Se corta en el primer evento de los últimos CAMBIOS_VENTANA_SEGUNDOS
+    (settings): una transacción lenta puede confirmar después un id menor, y
+    el cursor no debe haber pasado por encima. Ese evento sale en la próxima
+    consulta.
+    """
+    tope = timezone.now() - timedelta(seconds=settings.CAMBIOS_VENTANA_SEGUNDOS)
+    filas = (
+        HistorialEstadoAlumno.objects
+        .filter(id__gt=cursor, **filtros)
+        .order_by('id')
+        .values(
+            'id', 'alumno_id', 'curso_id', 'fecha', 'estado', 'hora_cambio',
+            'alumno__persona__nombres', 'alumno__persona__apellido_uno',
+            'estado_alumno__retiro_anticipado',
+        )[:limite]
+    )
+    return [
+        {
+            'id': f['id'],
+            'alumno_id': f['alumno_id'],
+            'alumno': " ".join(
+                p for p in (f['alumno__persona__nombres'], f['alumno__persona__apellido_uno']) if p
+            ),
+            'curso_id': f['curso_id'],
+            'fecha': f['fecha'].isoformat(),
+            'estado': f['estado'],
+            'retiro_anticipado': f['estado_alumno__retiro_anticipado'],
+            'hora': localtime(f['hora_cambio']).strftime("%H:%M:%S"),
+        }
+        for f in takewhile(lambda f: f['hora_cambio'] <= tope, filas)
+    ]
+
+
+def esperar_eventos(cursor, filtros, espera):
+    """Long-poll: retorna en cuanto hay eventos o al cumplirse `espera` segundos."""
+    limite = time.monotonic() + espera
+    while True:
+        eventos = eventos_desde(cursor, filtros)
+        if eventos or time.monotonic() >= limite:
+            return eventos
+        time.sleep(SSE_INTERVALO)
+
+
+def stream_sse(cursor, filtros, duracion=SSE_DURACION_MAXIMA):
+    """
+    Generador SSE que consulta el historial cada SSE_INTERVALO segundos.
+    No requiere broker: la BD es la fuente de eventos. La conexión se cierra
+    tras `duracion` segundos y EventSource reconecta enviando Last-Event-ID.
+    """
+    inicio = ultimo_latido = time.monotonic()
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    while True:
+        eventos = eventos_desde(cursor, filtros)
+        if eventos:
+            bloque = []
+            for evento in eventos:
+                bloque.append(
+                    f"id: {evento['id']}\nevent: estado\n"
+                    f"data: {json.dumps(evento, ensure_ascii=False)}\n\n"
+                )
+            cursor = eventos[-1]['id']
+            ultimo_latido = time.monotonic()
+            yield "".join(bloque)
+            # Hay más pendientes: seguir sin esperar
+            if len(eventos) == EVENTOS_LOTE:
+                continue
+
+        ahora = time.monotonic()
+        if ahora - inicio >= duracion:
+            return
+        if ahora - ultimo_latido >= SSE_LATIDO:
+            ultimo_latido = ahora
+            yield ": ping\n\n"
+        time.sleep(SSE_INTERVALO)
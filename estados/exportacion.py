@@ -0,0 +1,126 @@
+import csv
+import json
+
+from django.db.models import OuterRef, Subquery
+from django.utils.timezone import localtime
+
+from alumnos.models import PersonaAutorizadaAlumno
+from .models import EstadoAlumno, HistorialEstadoAlumno
+
+
+CHUNK_SIZE = 2000
+
+# Sin RUN ni foto, igual que el CSV original del panel
+COLUMNAS = {
+    'estados': [
+        'fecha', 'hora', 'alumno_id', 'alumno', 'curso', 'establecimiento',
+        'estado', 'retiro_anticipado', 'retirado_por', 'parentesco', 'registrado_por', 'observacion',
+    ],
+    'historial': [
+        'fecha', 'hora', 'alumno_id', 'alumno', 'curso', 'establecimiento',
+        'estado', 'retirado_por', 'registrado_por', 'observacion',
+    ],
+}
+
+
+class Echo:
+    """Pseudo-buffer para csv.writer: retorna la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def _nombre(*partes):
+    return " ".join(p for p in partes if p)
+
+
+def consulta_exportacion(fuente, filtros):
+    """
+    Queryset (.values()) de la exportación. Se arma antes de abrir la
+    respuesta: un filtro inválido falla aquí y no a mitad del stream.
+    """
+    if fuente == 'historial':
+        queryset = HistorialEstadoAlumno.objects.filter(**filtros).order_by('fecha', 'hora_cambio', 'id')
+        campo_hora = 'hora_cambio'
+    else:
+        parentesco = PersonaAutorizadaAlumno.objects.filter(
+            alumno_id=OuterRef('alumno_id'),
+            persona_id=OuterRef('retirado_por_id')
+        ).values('tipo_relacion')[:1]
+        queryset = (
+            EstadoAlumno.objects.filter(**filtros)
+            .annotate(parentesco=Subquery(parentesco))
+            .order_by('fecha', 'curso_id', 'id')
+        )
+        campo_hora = 'hora_registro'
+
+    campos = [
+        'fecha', campo_hora, 'alumno_id', 'estado', 'observacion',
+        'alumno__persona__nombres', 'alumno__persona__apellido_uno', 'alumno__persona__apellido_dos',
+        'curso__nombre', 'curso__establecimiento__nombre',
+        'retirado_por__nombres', 'retirado_por__apellido_uno', 'usuario_registro__email',
+    ]
+    if fuente != 'historial':
+        campos += ['retiro_anticipado', 'parentesco']
+    return queryset.values(*campos)
+
+
+def filas_exportacion(fuente, consulta):
+    """
+    Genera las filas (dict) de la exportación leyendo la BD por bloques
+    con un cursor del servidor; nunca se arma la lista completa en memoria.
+    """
+    campo_hora = 'hora_cambio' if fuente == 'historial' else 'hora_registro'
+    for r in consulta.iterator(chunk_size=CHUNK_SIZE):
+        fila = {
+            'fecha': r['fecha'].isoformat(),
+            'hora': localtime(r[campo_hora]).strftime("%H:%M") if r[campo_hora] else None,
+            'alumno_id': r['alumno_id'],
+            'alumno': _nombre(
+                r['alumno__persona__nombres'],
+                r['alumno__persona__apellido_uno'],
+                r['alumno__persona__apellido_dos']
+            ),
+            'curso': r['curso__nombre'],
+            'establecimiento': r['curso__establecimiento__nombre'],
+            'estado': r['estado'],
+            'retirado_por': _nombre(r['retirado_por__nombres'], r['retirado_por__apellido_uno']) or None,
+            'registrado_por': r['usuario_registro__email'],
+            'observacion': r['observacion'],
+        }
+        if fuente != 'historial':
+            fila['retiro_anticipado'] = r['retiro_anticipado']
+            fila['parentesco'] = r['parentesco']
+        yield fila
+
+
+def _en_bloques(lineas, tamano=500):
+    # Agrupa líneas para no emitir un write() del servidor por cada fila
+    bloque = []
+    for linea in lineas:
+        bloque.append(linea)
+        if len(bloque) >= tamano:
+            yield "".join(bloque)
+            bloque = []
+    if bloque:
+        yield "".join(bloque)
+
+
+def stream_csv(fuente, consulta):
+    columnas = COLUMNAS[fuente]
+    writer = csv.writer(Echo())
+
+    def lineas():
+        yield '\ufeff'  # BOM para que Excel reconozca UTF-8
+        yield writer.writerow(columnas)
+        for fila in filas_exportacion(fuente, consulta):
+            yield writer.writerow([fila[c] if fila[c] is not None else '' for c in columnas])
+
+    return _en_bloques(lineas())
+
+
+def stream_ndjson(fuente, consulta):
+    return _en_bloques(
+        json.dumps(fila, ensure_ascii=False) + "\n"
+        for fila in filas_exportacion(fuente, consulta)
+    )
@@ -0,0 +1,137 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import re
+
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import FotoDocumento
+
+
+logger = logging.getLogger(__name__)
+
+DATA_URL_RE = re.compile(r'^data:(?P<content_type>[\w/+.-]+)?;base64,', re.IGNORECASE)
+
+# Tamaños máximos (px, lado mayor) de la foto guardada y de su miniatura
+FOTO_LADO_MAX = 1600
+MINIATURA_LADO_MAX = 240
+CALIDAD_JPEG = 80
+
+
+def decodificar_foto(valor):
+    """
+    Convierte un data URL (data:image/jpeg;base64,...) o un Base64 plano
+    en (bytes, content_type). Retorna None si el valor no es Base64 válido.
+    """
+    if not valor or not isinstance(valor, str):
+        return None
+
+    content_type = 'image/jpeg'
+    match = DATA_URL_RE.match(valor)
+    if match:
+        content_type = match.group('content_type') or content_type
+        valor = valor[match.end():]
+
+    try:
+        contenido = base64.b64decode(valor.strip(), validate=False)
+    except (binascii.Error, ValueError):
+        return None
+
+    if not contenido:
+        return None
+    return contenido, content_type
+
+
+def _codificar_jpeg(imagen, lado_max):
+    copia = imagen.copy()
+    copia.thumbnail((lado_max, lado_max), Image.LANCZOS)
+    salida = io.BytesIO()
+    # Sin exif=...: los metadatos (GPS, cámara, etc.) no se copian
+    copia.save(salida, 'JPEG', quality=CALIDAD_JPEG, optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def procesar_imagen(contenido):
+    """
+    Decodifica la imagen recibida, aplica la orientación EXIF, la reduce a
+    FOTO_LADO_MAX y la recodifica como JPEG progresivo sin metadatos.
+    Retorna (foto, miniatura) en bytes, o None si no es una imagen válida.
+    """
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        imagen = ImageOps.exif_transpose(imagen)
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    if imagen.mode in ('RGBA', 'LA', 'P'):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        imagen = fondo
+    elif imagen.mode != 'RGB':
+        imagen = imagen.convert('RGB')
+
+    return _codificar_jpeg(imagen, FOTO_LADO_MAX), _codificar_jpeg(imagen, MINIATURA_LADO_MAX)
+
+
+def guardar_fotos(valores):
+    """
+    Guarda en lote las fotos recibidas en Base64 y retorna, en el mismo orden,
+    el SHA-256 de cada una (None si el valor venía vacío o era inválido).
+    Las fotos repetidas o ya almacenadas no se vuelven a procesar ni escribir.
+    """
+    hashes = []
+    recibidas = {}
+
+    for valor in valores:
+        decodificada = decodificar_foto(valor)
+        if not decodificada:
+            if valor:
+                logger.warning("Foto de documento inválida — ignorada.")
+            hashes.append(None)
+            continue
+
+        contenido, _ = decodificada
+        sha = hashlib.sha256(contenido).hexdigest()
+        hashes.append(sha)
+        recibidas.setdefault(sha, contenido)
+
+    if not recibidas:
+        return hashes
+
+    existentes = set(
+        FotoDocumento.objects.filter(sha256__in=recibidas.keys()).values_list('sha256', flat=True)
+    )
+
+    nuevas = []
+    invalidas = set()
+    for sha, contenido in recibidas.items():
+        if sha in existentes:
+            continue
+        procesada = procesar_imagen(contenido)
+        if not procesada:
+            logger.warning("Foto de documento %s no es una imagen válida — ignorada.", sha)
+            invalidas.add(sha)
+            continue
+        foto, miniatura = procesada
+        nuevas.append(FotoDocumento(
+            sha256=sha,
+            content_type='image/jpeg',
+            contenido=foto,
+            miniatura=miniatura,
+            tamano=len(foto)
+        ))
+
+    FotoDocumento.objects.bulk_create(nuevas, ignore_conflicts=True)
+
+    return [None if sha in invalidas else sha for sha in hashes]
+
+
+def url_foto(request, sha256, miniatura=False):
+    if not sha256:
+        return None
+    nombre = 'estado-alumno-foto-miniatura' if miniatura else 'estado-alumno-foto'
+    return request.build_absolute_uri(reverse(nombre, kwargs={'sha256': sha256}))
@@ -0,0 +1,136 @@
+from datetime import datetime, date
+
+from django.db.models import Case, CharField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, Trim
+from django.utils.timezone import localtime
+from rest_framework.response import Response
+
+from alumnos.models import PersonaAutorizadaAlumno
+from .fotos import url_foto
+from .models import EstadoAlumno
+
+
+# ----------------------------------------------------------
+# PERFILES DE LISTADO POR ESTADO
+#   filtros: condiciones fijas del listado
+#   total:   clave del total en la respuesta
+#   extras:  columnas adicionales a las comunes
+# ----------------------------------------------------------
+PERFILES = {
+    'ausentes': {
+        'filtros': {'estado': 'AUSENTE'},
+        'total': 'total_ausentes',
+        'extras': [],
+    },
+    'retiros': {
+        'filtros': {'estado': 'RETIRADO'},
+        'total': 'total_retiros',
+        'extras': ['quien_retiro', 'parentesco', 'retiro_anticipado'],
+    },
+    'retiros_anticipados': {
+        'filtros': {'estado': 'RETIRADO', 'retiro_anticipado': True},
+        'total': 'total_retiros_anticipados',
+        'extras': ['quien_retiro', 'retiro_anticipado'],
+    },
+    'extension': {
+        'filtros': {'estado': 'EXTENSION'},
+        'total': 'total_extension',
+        'extras': [],
+    },
+}
+
+
+def _anotaciones(extras):
+    anotaciones = {
+        'alumno_nombre': Trim(Concat(
+            'alumno__persona__nombres', Value(' '),
+            'alumno__persona__apellido_uno', Value(' '),
+            Coalesce('alumno__persona__apellido_dos', Value('')),
+            output_field=CharField()
+        )),
+        'curso_actual_id': F('alumno__curso_id'),
+        'curso_nombre': F('alumno__curso__nombre'),
+        'establecimiento': F('alumno__curso__establecimiento__nombre'),
+        'quien_registro': F('usuario_registro__email'),
+    }
+    if 'quien_retiro' in extras:
+        anotaciones['quien_retiro'] = Case(
+            When(retirado_por__isnull=False, then=Concat(
+                'retirado_por__nombres', Value(' '), 'retirado_por__apellido_uno',
+                output_field=CharField()
+            )),
+            default=None,
+            output_field=CharField()
+        )
+    if 'parentesco' in extras:
+        anotaciones['parentesco'] = Subquery(
+            PersonaAutorizadaAlumno.objects.filter(
+                alumno_id=OuterRef('alumno_id'),
+                persona_id=OuterRef('retirado_por_id')
+            ).values('tipo_relacion')[:1]
+        )
+    return anotaciones
+
+
+def listar_estados(request, clave):
+    """
+    Motor común de los listados del día (ausentes, retiros, anticipados y
+    extensión). Arma el payload con .values(), sin instanciar modelos.
+    """
+    perfil = PERFILES[clave]
+
+    if getattr(request.user, 'rol', '').lower() == 'apoderado':
+        return Response({'error': 'No autorizado'}, status=403)
+
+    fecha_str = request.query_params.get('fecha')
+    curso_id = request.query_params.get('curso_id')
+
+    try:
+        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else date.today()
+    except ValueError:
+        fecha = date.today()
+    if curso_id and not curso_id.isdecimal():
+        return Response({'error': 'curso_id debe ser un número entero.'}, status=400)
+
+    filtros = {'fecha': fecha, **perfil['filtros']}
+    if curso_id:
+        filtros['curso_id'] = curso_id
+
+    extras = perfil['extras']
+    anotaciones = _anotaciones(extras)
+    campos = ['id', 'alumno_id', 'fecha', 'estado', 'hora_registro', 'observacion',
+              'foto_id', 'foto_documento', 'retiro_anticipado', *anotaciones]
+
+    filas = EstadoAlumno.objects.filter(**filtros).annotate(**anotaciones).values(*campos)
+
+    alumnos_data = []
+    for r in filas:
+        item = {
+            "id": r['id'],
+            "alumno": r['alumno_id'],
+            "alumno_nombre": r['alumno_nombre'],
+            "curso_id": r['curso_actual_id'],
+            "curso_nombre": r['curso_nombre'],
+            "establecimiento": r['establecimiento'],
+            "fecha": r['fecha'],
+            "estado": r['estado'],
+            "hora_registro": localtime(r['hora_registro']).strftime("%H:%M") if r['hora_registro'] else "-",
+            "observacion": r['observacion'],
+            "foto_documento": url_foto(request, r['foto_id']) or r['foto_documento'],
+            "foto_miniatura": url_foto(request, r['foto_id'], miniatura=True),
+        }
+        if 'quien_retiro' in extras:
+            item["quien_retiro"] = r['quien_retiro']
+        item["quien_registro"] = r['quien_registro']
+        if 'parentesco' in extras:
+            item["parentesco"] = r['parentesco'] if r['quien_retiro'] else None
+        if 'retiro_anticipado' in extras:
+            item["retiro_anticipado"] = r['retiro_anticipado']
+        alumnos_data.append(item)
+
+    return Response({
+        "fecha": str(fecha),
+        "curso_id": curso_id,
+        perfil['total']: len(alumnos_data),
+        "alumnos": alumnos_data
+    }, status=200)
@@ -0,0 +1,193 @@
+import gzip
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from estados.models import EstadoAlumno, HistorialEstadoAlumno, MesArchivado
+from estados.utils import actualizar_resumenes
+
+
+def _columnas(modelo):
+    return ", ".join(f.column for f in modelo._meta.concrete_fields)
+
+
+def _mes_siguiente(inicio):
+    return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+
+
+def _filtro_mes(modelo, inicio, fin):
+    """
+    Condición SQL de las filas de `modelo` que pertenecen al mes. En el
+    historial incluye las filas de estados del mes aunque su propia fecha sea
+    de otro mes: el COPY, el DELETE y la restauración usan la misma condición.
+    """
+    condicion = f"fecha >= '{inicio}' AND fecha < '{fin}'"
+    if modelo is HistorialEstadoAlumno:
+        condicion = (
+            f"({condicion} OR estado_alumno_id IN "
+            f"(SELECT id FROM {EstadoAlumno._meta.db_table} WHERE {condicion}))"
+        )
+    return condicion
+
+
+def _parse_mes(valor):
+    try:
+        anio, mes = valor.split('-')
+        return date(int(anio), int(mes), 1)
+    except ValueError:
+        raise CommandError("Formato de mes inválido, use YYYY-MM.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Separa datos fríos: exporta meses completos de estado_alumno e historial "
+        "a CSV comprimido (COPY) y los elimina de las tablas. El resumen diario "
+        "se recalcula antes, así los reportes mensuales/anuales siguen completos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=12,
+                            help="Meses que se mantienen en caliente, incluido el actual (defecto: 12)")
+        parser.add_argument('--hasta', help="Archivar hasta este mes inclusive, YYYY-MM (ignora --meses)")
+        parser.add_argument('--directorio', default='archivo', help="Carpeta de los archivos .csv.gz")
+        parser.add_argument('--dry-run', action='store_true', help="Solo informa qué meses se archivarían")
+        parser.add_argument('--vacuum', action='store_true', help="VACUUM ANALYZE de ambas tablas al terminar")
+        parser.add_argument('--restaurar', metavar='YYYY-MM', help="Vuelve a cargar un mes archivado")
+
+    def handle(self, *args, **options):
+        directorio = options['directorio']
+
+        if options['restaurar']:
+            self.restaurar(_parse_mes(options['restaurar']), directorio)
+            return
+
+        if options['hasta']:
+            limite = _mes_siguiente(_parse_mes(options['hasta']))
+        else:
+            if options['meses'] < 1:
+                raise CommandError("--meses debe ser al menos 1.")
+            hoy = date.today()
+            total = hoy.year * 12 + hoy.month - 1 - (options['meses'] - 1)
+            limite = date(total // 12, total % 12 + 1, 1)
+
+        primera = EstadoAlumno.objects.filter(fecha__lt=limite).order_by('fecha').values_list('fecha', flat=True).first()
+        if not primera:
+            self.stdout.write(self.style.SUCCESS(f"No hay datos anteriores a {limite}."))
+            return
+
+        meses = []
+        inicio = primera.replace(day=1)
+        while inicio < limite:
+            meses.append(inicio)
+            inicio = _mes_siguiente(inicio)
+
+        if options['dry_run']:
+            for inicio in meses:
+                cantidad = EstadoAlumno.objects.filter(fecha__gte=inicio, fecha__lt=_mes_siguiente(inicio)).count()
+                self.stdout.write(f"{inicio:%Y-%m}: {cantidad} estados")
+            return
+
+        os.makedirs(directorio, exist_ok=True)
+        for inicio in meses:
+            self.archivar_mes(inicio, directorio)
+
+        if options['vacuum']:
+            with connection.cursor() as cursor:
+                for modelo in (EstadoAlumno, HistorialEstadoAlumno):
+                    cursor.execute(f"VACUUM ANALYZE {modelo._meta.db_table}")
+            self.stdout.write(self.style.SUCCESS("VACUUM ANALYZE completado."))
+
+    # ----------------------------------------------------------
+    # ARCHIVAR UN MES
+    # ----------------------------------------------------------
+    def archivar_mes(self, inicio, directorio):
+        fin = _mes_siguiente(inicio)
+        estado_tabla = EstadoAlumno._meta.db_table
+        historial_tabla = HistorialEstadoAlumno._meta.db_table
+        t0 = time.perf_counter()
+
+        # Los reportes leen el resumen: debe quedar completo antes de borrar
+        actualizar_resumenes(inicio, date.fromordinal(fin.toordinal() - 1))
+
+        rutas = {
+            modelo: os.path.join(directorio, f"{modelo._meta.db_table}_{inicio:%Y-%m}.csv.gz")
+            for modelo in (EstadoAlumno, HistorialEstadoAlumno)
+        }
+
+        for ruta in rutas.values():
+            if os.path.exists(ruta):
+                raise CommandError(f"{ruta} ya existe; no se sobrescribe un archivo.")
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for modelo, ruta in rutas.items():
+                    with gzip.open(ruta + '.tmp', 'wb') as archivo:
+                        cursor.copy_expert(
+                            f"COPY (SELECT {_columnas(modelo)} FROM {modelo._meta.db_table} "
+                            f"WHERE {_filtro_mes(modelo, inicio, fin)} ORDER BY id) "
+                            f"TO STDOUT WITH (FORMAT csv, HEADER true)",
+                            archivo
+                        )
+
+                # historial primero: referencia a estado_alumno
+                cursor.execute(
+                    f"DELETE FROM {historial_tabla} WHERE {_filtro_mes(HistorialEstadoAlumno, inicio, fin)}"
+                )
+                historial_borrados = cursor.rowcount
+                cursor.execute(f"DELETE FROM {estado_tabla} WHERE {_filtro_mes(EstadoAlumno, inicio, fin)}")
+                estados_borrados = cursor.rowcount
+
+                # Desde aquí actualizar_resumenes no recalcula (ni borra) el resumen del mes
+                MesArchivado.objects.update_or_create(mes=inicio, defaults={
+                    'directorio': directorio,
+                    'estados': estados_borrados,
+                    'historiales': historial_borrados,
+                })
+        except Exception:
+            for ruta in rutas.values():
+                if os.path.exists(ruta + '.tmp'):
+                    os.remove(ruta + '.tmp')
+            raise
+
+        # El archivo queda definitivo solo después del commit del borrado
+        for ruta in rutas.values():
+            os.replace(ruta + '.tmp', ruta)
+
+        duracion = (time.perf_counter() - t0) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{inicio:%Y-%m}: {estados_borrados} estados y {historial_borrados} historiales "
+            f"archivados en {directorio} ({duracion:.0f} ms)."
+        ))
+
+    # ----------------------------------------------------------
+    # RESTAURAR UN MES ARCHIVADO
+    # ----------------------------------------------------------
+    def restaurar(self, inicio, directorio):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # estado_alumno antes que historial (clave foránea)
+            for modelo in (EstadoAlumno, HistorialEstadoAlumno):
+                ruta = os.path.join(directorio, f"{modelo._meta.db_table}_{inicio:%Y-%m}.csv.gz")
+                if not os.path.exists(ruta):
+                    raise CommandError(f"No existe {ruta}.")
+                if modelo is HistorialEstadoAlumno:
+                    # Filas que haya escrito el trigger al cargar los estados:
+                    # se reemplazan por las originales del archivo
+                    cursor.execute(
+                        f"DELETE FROM {modelo._meta.db_table} "
+                        f"WHERE {_filtro_mes(modelo, inicio, _mes_siguiente(inicio))}"
+                    )
+                with gzip.open(ruta, 'rb') as archivo:
+                    cursor.copy_expert(
+                        f"COPY {modelo._meta.db_table} ({_columnas(modelo)}) "
+                        f"FROM STDIN WITH (FORMAT csv, HEADER true)",
+                        archivo
+                    )
+                self.stdout.write(f"Restaurado {ruta}")
+
+            MesArchivado.objects.filter(mes=inicio).delete()
+
+        actualizar_resumenes(inicio, date.fromordinal(_mes_siguiente(inicio).toordinal() - 1))
+        self.stdout.write(self.style.SUCCESS(f"{inicio:%Y-%m} restaurado."))
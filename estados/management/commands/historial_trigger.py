@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from estados.trigger_historial import sincronizar
+
+
+class Command(BaseCommand):
+    help = "Instala o quita el trigger de historial según HISTORIAL_POR_TRIGGER"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING("El trigger de historial solo existe en PostgreSQL."))
+            return
+
+        with connection.cursor() as cursor:
+            instalado = sincronizar(cursor)
+
+        if instalado:
+            self.stdout.write(self.style.SUCCESS("Trigger de historial instalado: el historial lo escribe la BD."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Trigger de historial quitado: el historial lo escribe la aplicación."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from estados.fotos import guardar_fotos
+from estados.models import EstadoAlumno
+
+
+class Command(BaseCommand):
+    help = "Mueve las fotos Base64 de estado_alumno al almacén de fotos (foto_documento), por lotes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=200, help="Registros por lote (default 200)")
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        ultimo_id = 0
+        migrados = 0
+        invalidos = 0
+
+        while True:
+            filas = list(
+                EstadoAlumno.objects
+                .filter(id__gt=ultimo_id, foto__isnull=True, foto_documento__isnull=False)
+                .exclude(foto_documento='')
+                .order_by('id')
+                .values_list('id', 'foto_documento')[:lote]
+            )
+            if not filas:
+                break
+
+            ultimo_id = filas[-1][0]
+
+            with transaction.atomic():
+                hashes = guardar_fotos([foto for _, foto in filas])
+                estados = []
+                for (estado_id, _), sha in zip(filas, hashes):
+                    if not sha:
+                        invalidos += 1
+                        continue
+                    estados.append(EstadoAlumno(id=estado_id, foto_id=sha, foto_documento=None))
+                EstadoAlumno.objects.bulk_update(estados, ['foto', 'foto_documento'])
+
+            migrados += len(estados)
+            self.stdout.write(f"Lote hasta id {ultimo_id}: {len(estados)} fotos migradas.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Se migraron {migrados} fotos ({invalidos} inválidas se dejaron sin cambios)."
+        ))
@@ -0,0 +1,41 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from estados.models import MesArchivado
+from estados.utils import actualizar_resumenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el resumen diario de asistencia para un rango de fechas. "
+        "Los meses archivados (archivar_estados) se omiten: su resumen se conserva."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', required=True, help="Fecha inicial YYYY-MM-DD")
+        parser.add_argument('--hasta', help="Fecha final YYYY-MM-DD (defecto: igual a --desde)")
+        parser.add_argument('--establecimiento', type=int, help="Solo cursos de este establecimiento (id)")
+
+    def handle(self, *args, **options):
+        try:
+            desde = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date() if options['hasta'] else desde
+        except ValueError:
+            raise CommandError("Formato de fecha inválido, use YYYY-MM-DD.")
+
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde.")
+
+        archivados = MesArchivado.objects.filter(mes__gte=desde.replace(day=1), mes__lte=hasta)
+        for mes in archivados:
+            self.stdout.write(self.style.WARNING(
+                f"{mes}: mes archivado, se conserva su resumen (restaurar con archivar_estados --restaurar {mes})."
+            ))
+
+        inicio = time.perf_counter()
+        filas = actualizar_resumenes(desde, hasta, establecimiento_id=options['establecimiento'])
+        duracion = (time.perf_counter() - inicio) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Se recalcularon {filas} filas de resumen entre {desde} y {hasta} ({duracion:.0f} ms)."
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estados', '0008_estadoalumno_retiro_anticipado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FotoDocumento',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('content_type', models.CharField(default='image/jpeg', max_length=50)),
+                ('contenido', models.BinaryField()),
+                ('tamano', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Foto de Documento',
+                'verbose_name_plural': 'Fotos de Documentos',
+                'db_table': 'foto_documento',
+            },
+        ),
+        migrations.AlterField(
+            model_name='estadoalumno',
+            name='foto_documento',
+            field=models.TextField(blank=True, help_text='Legado: imagen en formato Base64 (data:image/jpeg;base64,...)', null=True),
+        ),
+        migrations.AddField(
+            model_name='estadoalumno',
+            name='foto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='estados', to='estados.fotodocumento'),
+        ),
+    ]
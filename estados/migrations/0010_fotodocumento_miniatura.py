@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estados', '0009_fotodocumento_alter_estadoalumno_foto_documento_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fotodocumento',
+            name='miniatura',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alumnos', '0005_alumno_furgon'),
+        ('escuela', '0002_curso_hora_inicio_curso_hora_termino'),
+        ('estados', '0010_fotodocumento_miniatura'),
+        ('personas', '0009_persona_sexo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estadoalumno',
+            index=models.Index(fields=['fecha', 'estado', 'curso'], name='estado_fecha_estado_curso_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estadoalumno',
+            index=models.Index(fields=['fecha', 'curso'], name='estado_fecha_curso_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estadoalumno',
+            index=models.Index(fields=['alumno', 'fecha'], name='estado_alumno_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estadoalumno',
+            index=models.Index(condition=models.Q(('retiro_anticipado', True)), fields=['fecha', 'curso'], name='estado_anticipado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialestadoalumno',
+            index=models.Index(fields=['usuario_registro', 'estado', 'fecha', 'hora_cambio'], name='hist_usuario_estado_fecha_idx'),
+        ),
+    ]
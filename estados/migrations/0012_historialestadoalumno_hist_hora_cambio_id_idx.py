@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alumnos', '0005_alumno_furgon'),
+        ('escuela', '0002_curso_hora_inicio_curso_hora_termino'),
+        ('estados', '0011_estadoalumno_estado_fecha_estado_curso_idx_and_more'),
+        ('personas', '0009_persona_sexo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialestadoalumno',
+            index=models.Index(fields=['hora_cambio', 'id'], name='hist_hora_cambio_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escuela', '0002_curso_hora_inicio_curso_hora_termino'),
+        ('establecimientos', '0001_initial'),
+        ('estados', '0012_historialestadoalumno_hist_hora_cambio_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioAsistencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('ausentes', models.PositiveIntegerField(default=0)),
+                ('retiros', models.PositiveIntegerField(default=0)),
+                ('extension', models.PositiveIntegerField(default=0)),
+                ('retiros_anticipados', models.PositiveIntegerField(default=0)),
+                ('matriculados', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('curso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='escuela.curso')),
+                ('establecimiento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='establecimientos.establecimiento')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Asistencia',
+                'verbose_name_plural': 'Resúmenes Diarios de Asistencia',
+                'db_table': 'resumen_diario_asistencia',
+                'indexes': [models.Index(fields=['establecimiento', 'fecha'], name='resumen_estab_fecha_idx')],
+                'unique_together': {('fecha', 'curso')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def sincronizar_trigger(apps, schema_editor):
+    # Solo Postgres; el trigger se instala si HISTORIAL_POR_TRIGGER=True
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from estados.trigger_historial import sincronizar
+    with schema_editor.connection.cursor() as cursor:
+        sincronizar(cursor)
+
+
+def quitar_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from estados.trigger_historial import quitar
+    with schema_editor.connection.cursor() as cursor:
+        quitar(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estados', '0014_estadoalumno_estado_fecha_hora_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(sincronizar_trigger, quitar_trigger),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('alumnos', '0005_alumno_furgon'),
+        ('estados', '0015_trigger_historial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='estadoalumno',
+            name='alumno',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='estados', to='alumnos.alumno'),
+        ),
+        migrations.AlterField(
+            model_name='estadoalumno',
+            name='foto',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='estados', to='estados.fotodocumento'),
+        ),
+    ]
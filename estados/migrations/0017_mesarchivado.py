@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estados', '0016_estadoalumno_sin_indices_fk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesArchivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes', unique=True)),
+                ('directorio', models.CharField(max_length=255)),
+                ('estados', models.PositiveIntegerField(default=0)),
+                ('historiales', models.PositiveIntegerField(default=0)),
+                ('archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Mes Archivado',
+                'verbose_name_plural': 'Meses Archivados',
+                'db_table': 'mes_archivado',
+                'ordering': ['mes'],
+            },
+        ),
+    ]
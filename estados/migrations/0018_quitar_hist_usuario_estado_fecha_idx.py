@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estados', '0017_mesarchivado'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='historialestadoalumno',
+            name='hist_usuario_estado_fecha_idx',
+        ),
+    ]
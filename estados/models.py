@@ -9,10 +9,12 @@ class EstadoAlumno(models.Model):
         ('EXTENSION', 'Extensión'),
     ]
 
+    # Sin índice propio: lo cubren (alumno, curso, fecha) y estado_alumno_fecha_idx
     alumno = models.ForeignKey(
         'alumnos.Alumno',
         on_delete=models.CASCADE,
-        related_name='estados'
+        related_name='estados',
+        db_index=False
     )
     curso = models.ForeignKey(
         'escuela.Curso',
@@ -41,11 +43,21 @@ class EstadoAlumno(models.Model):
     )
 
     observacion = models.TextField(blank=True, null=True)
-    # Imagen en Base64
+    # Foto del documento en el almacén de fotos (direccionado por SHA-256).
+    # Sin índice: nunca se busca por foto y las fotos no se borran
+    foto = models.ForeignKey(
+        'estados.FotoDocumento',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='estados',
+        db_index=False
+    )
+    # Legado: imagen en Base64, se vacía con `manage.py migrar_fotos`
     foto_documento = models.TextField(
         null=True,
         blank=True,
-        help_text="Imagen en formato Base64 (data:image/jpeg;base64,...)"
+        help_text="Legado: imagen en formato Base64 (data:image/jpeg;base64,...)"
     )
     retiro_anticipado = models.BooleanField(
         default=False,
@@ -57,6 +69,22 @@ class EstadoAlumno(models.Model):
         verbose_name = 'Estado de Alumno'
         verbose_name_plural = 'Estados de Alumnos'
         unique_together = ('alumno', 'curso', 'fecha')
+        indexes = [
+            # listar_* / resumen: fecha + estado (+ curso_id)
+            models.Index(fields=['fecha', 'estado', 'curso'], name='estado_fecha_estado_curso_idx'),
+            # get_queryset: fecha + curso_id
+            models.Index(fields=['fecha', 'curso'], name='estado_fecha_curso_idx'),
+            # cambios: keyset sobre (hora_registro, id) dentro del día
+            models.Index(fields=['fecha', 'hora_registro', 'id'], name='estado_fecha_hora_id_idx'),
+            # subconsultas de CursoViewSet.alumnos_del_curso: alumno + fecha
+            models.Index(fields=['alumno', 'fecha'], name='estado_alumno_fecha_idx'),
+            # retiros-anticipados: fracción pequeña de las filas
+            models.Index(
+                fields=['fecha', 'curso'],
+                condition=models.Q(retiro_anticipado=True),
+                name='estado_anticipado_idx'
+            ),
+        ]
 
     def __str__(self):
         alumno_nombre = getattr(self.alumno.persona, "nombres", "Sin nombre")
@@ -64,6 +92,25 @@ class EstadoAlumno(models.Model):
         return f"{alumno_nombre} - {self.estado} ({self.fecha}){anticipado}"
 
 
+class FotoDocumento(models.Model):
+    # SHA-256 de los bytes recibidos: fotos idénticas se guardan una sola vez
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    content_type = models.CharField(max_length=50, default='image/jpeg')
+    # JPEG progresivo, reducido y sin metadatos EXIF (ver estados/fotos.py)
+    contenido = models.BinaryField()
+    miniatura = models.BinaryField(null=True, blank=True)
+    tamano = models.PositiveIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'foto_documento'
+        verbose_name = 'Foto de Documento'
+        verbose_name_plural = 'Fotos de Documentos'
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.content_type}, {self.tamano} bytes)"
+
+
 class HistorialEstadoAlumno(models.Model):
     estado_alumno = models.ForeignKey(
         'estados.EstadoAlumno',
@@ -99,6 +146,10 @@ class HistorialEstadoAlumno(models.Model):
         verbose_name = 'Historial de Estado de Alumno'
         verbose_name_plural = 'Historiales de Estados de Alumnos'
         ordering = ['-hora_cambio']
+        indexes = [
+            # historial paginado por keyset (hora_cambio, id)
+            models.Index(fields=['hora_cambio', 'id'], name='hist_hora_cambio_id_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['alumno', 'fecha', 'estado'],
@@ -109,3 +160,63 @@ class HistorialEstadoAlumno(models.Model):
     def __str__(self):
         alumno_nombre = getattr(self.alumno.persona, "nombres", "Sin nombre")
         return f"{alumno_nombre} - {self.estado} ({self.fecha})"
+
+
+class ResumenDiarioAsistencia(models.Model):
+    """
+    Conteos por (fecha, curso), mantenidos por estados.utils.actualizar_resumenes
+    en cada escritura de estados. Los reportes de rangos largos leen esta tabla
+    en vez de estado_alumno.
+    """
+    fecha = models.DateField()
+    curso = models.ForeignKey(
+        'escuela.Curso',
+        on_delete=models.CASCADE,
+        related_name='resumenes_diarios'
+    )
+    establecimiento = models.ForeignKey(
+        'establecimientos.Establecimiento',
+        on_delete=models.CASCADE,
+        related_name='resumenes_diarios'
+    )
+    ausentes = models.PositiveIntegerField(default=0)
+    retiros = models.PositiveIntegerField(default=0)
+    extension = models.PositiveIntegerField(default=0)
+    retiros_anticipados = models.PositiveIntegerField(default=0)
+    # Alumnos del curso al momento de calcular el resumen
+    matriculados = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'resumen_diario_asistencia'
+        verbose_name = 'Resumen Diario de Asistencia'
+        verbose_name_plural = 'Resúmenes Diarios de Asistencia'
+        unique_together = ('fecha', 'curso')
+        indexes = [
+            models.Index(fields=['establecimiento', 'fecha'], name='resumen_estab_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.curso_id} - {self.fecha}"
+
+
+class MesArchivado(models.Model):
+    """
+    Mes cuyos estados e historial se movieron a CSV con `archivar_estados`.
+    Su resumen diario quedó calculado antes de borrar y ya no se puede
+    recalcular desde estado_alumno: actualizar_resumenes no toca esas fechas.
+    """
+    mes = models.DateField(unique=True, help_text="Primer día del mes")
+    directorio = models.CharField(max_length=255)
+    estados = models.PositiveIntegerField(default=0)
+    historiales = models.PositiveIntegerField(default=0)
+    archivado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'mes_archivado'
+        verbose_name = 'Mes Archivado'
+        verbose_name_plural = 'Meses Archivados'
+        ordering = ['mes']
+
+    def __str__(self):
+        return f"{self.mes:%Y-%m}"
@@ -0,0 +1,301 @@
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from alumnos.models import Alumno, PersonaAutorizadaAlumno
+from .fotos import guardar_fotos
+from .models import EstadoAlumno, HistorialEstadoAlumno
+from .signals import historiales_creados
+from .trigger_historial import historial_por_trigger
+from .utils import actualizar_resumenes
+
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_VALIDOS = {'AUSENTE': 1, 'RETIRADO': 2, 'EXTENSION': 3}
+
+
+def _bloqueo(reg, estado, codigo_estado, codigo_bloqueo, observacion):
+    resultado = {
+        'alumno_id': reg.get('alumno_id'),
+        'estado': estado,
+        'codigo_estado': codigo_estado,
+        'codigo_bloqueo': codigo_bloqueo,
+        'observacion': observacion
+    }
+    if 'id_cliente' in reg:
+        resultado['id_cliente'] = reg['id_cliente']
+    return resultado
+
+
+def validar_registros(registros, usuario):
+    """
+    Valida un lote de registros de estado con una consulta por tabla.
+    Cada registro trae alumno_id, estado, fecha (date) y hora (time, para
+    calcular el retiro anticipado); opcionales: observacion, retirado_por_id,
+    foto_documento e id_cliente (se devuelve tal cual en el resultado).
+
+    Retorna (procesados, pendientes): un resultado por registro en el mismo
+    orden y, por cada estado a crear, la tupla (EstadoAlumno sin guardar,
+    foto, resultado) para que guardar_estados informe si perdió la carrera.
+    Códigos de bloqueo: 900 estado inválido, 901 alumno sin curso,
+    902 ya tiene estado ese día, 910 persona no autorizada.
+    """
+    alumno_ids = {str(r['alumno_id']) for r in registros}
+    fechas = {r['fecha'] for r in registros}
+    retirado_por_ids = {
+        str(r['retirado_por_id']) for r in registros
+        if r.get('retirado_por_id') and str(r['estado']).upper().strip() == 'RETIRADO'
+    }
+
+    alumnos = {
+        str(a.id): a
+        for a in Alumno.objects.select_related('curso').filter(id__in=alumno_ids)
+    }
+    existentes = {
+        (str(e.alumno_id), e.curso_id, e.fecha): e
+        for e in EstadoAlumno.objects.filter(fecha__in=fechas, alumno_id__in=alumno_ids)
+    }
+    autorizados = set()
+    if retirado_por_ids:
+        relaciones = PersonaAutorizadaAlumno.objects.filter(
+            alumno_id__in=alumno_ids,
+            persona_id__in=retirado_por_ids
+        ).values('alumno_id', 'persona_id', 'autorizado', 'tipo_relacion')
+        for rel in relaciones:
+            if rel['autorizado'] or 'apoderado' in (rel['tipo_relacion'] or '').lower():
+                autorizados.add((str(rel['alumno_id']), str(rel['persona_id'])))
+
+    procesados = []
+    pendientes = []  # (EstadoAlumno validado sin guardar, foto Base64, resultado)
+
+    for reg in registros:
+        alumno_id = reg.get('alumno_id')
+        estado = reg.get('estado')
+        observacion = reg.get('observacion', '')
+        retirado_por_id = reg.get('retirado_por_id')
+        fecha = reg['fecha']
+
+        estado_upper = str(estado).upper().strip()
+
+        if estado_upper not in ESTADOS_VALIDOS:
+            procesados.append(_bloqueo(reg, estado_upper, 0, 900, f"Estado '{estado}' no es válido."))
+            continue
+
+        # OBTENER EL CURSO REAL DEL ALUMNO
+        alumno_obj = alumnos.get(str(alumno_id))
+        if not alumno_obj or not alumno_obj.curso:
+            procesados.append(_bloqueo(reg, estado_upper, 0, 901, "El alumno no tiene curso asignado."))
+            continue
+
+        curso_real = alumno_obj.curso
+
+        existente = existentes.get((str(alumno_id), curso_real.id, fecha))
+        if existente:
+            procesados.append(_bloqueo(
+                reg, existente.estado, ESTADOS_VALIDOS.get(existente.estado.upper(), 0), 902,
+                f"El alumno ya tiene estado '{existente.estado}' asignado hoy."
+            ))
+            continue
+
+        # VALIDAR APODERADO/AUTORIZADO
+        if estado_upper == 'RETIRADO' and retirado_por_id:
+            if (str(alumno_id), str(retirado_por_id)) not in autorizados:
+                procesados.append(_bloqueo(reg, estado_upper, 0, 910, "La persona indicada NO está autorizada."))
+                continue
+
+        obj = EstadoAlumno(
+            alumno_id=alumno_obj.id,
+            curso_id=curso_real.id,  # ← CURSO CORRECTO
+            fecha=fecha,
+            estado=estado_upper,
+            observacion=observacion,
+            usuario_registro=usuario,
+            retirado_por_id=retirado_por_id if estado_upper == 'RETIRADO' and retirado_por_id else None,
+            # RETIRO ANTICIPADO usando curso REAL y la hora del registro
+            retiro_anticipado=bool(
+                estado_upper == 'RETIRADO'
+                and curso_real.hora_termino
+                and reg['hora'] < curso_real.hora_termino
+            ),
+        )
+        # Un alumno repetido en el mismo lote queda bloqueado igual que en BD
+        existentes[(str(alumno_id), curso_real.id, fecha)] = obj
+
+        resultado = _bloqueo(reg, estado_upper, ESTADOS_VALIDOS.get(estado_upper, 0), 0, observacion)
+        resultado['retiro_anticipado'] = obj.retiro_anticipado
+        procesados.append(resultado)
+        pendientes.append((obj, reg.get('foto_documento'), resultado))
+
+    return procesados, pendientes
+
+
+def insertar_estados(estados):
+    """
+    INSERT ... ON CONFLICT (alumno_id, curso_id, fecha) DO NOTHING en una sola
+    sentencia. Asigna id a los estados que quedaron guardados; los que
+    chocaron con una fila existente (la primera escritura gana) quedan con
+    id None. Retorna la lista de estados guardados.
+    """
+    if not estados:
+        return []
+
+    ahora = timezone.now()
+    for e in estados:
+        e.hora_registro = ahora
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {EstadoAlumno._meta.db_table}
+                (alumno_id, curso_id, fecha, estado, observacion, hora_registro,
+                 usuario_registro_id, retirado_por_id, foto_id, retiro_anticipado)
+            SELECT * FROM unnest(
+                %s::bigint[], %s::bigint[], %s::date[], %s::varchar[], %s::text[],
+                %s::timestamptz[], %s::uuid[], %s::bigint[], %s::varchar[], %s::boolean[]
+            )
+            ON CONFLICT (alumno_id, curso_id, fecha) DO NOTHING
+            RETURNING id, alumno_id, curso_id, fecha
+        """, [
+            [e.alumno_id for e in estados],
+            [e.curso_id for e in estados],
+            [e.fecha for e in estados],
+            [e.estado for e in estados],
+            [e.observacion for e in estados],
+            [e.hora_registro for e in estados],
+            [str(e.usuario_registro_id) if e.usuario_registro_id else None for e in estados],
+            [int(e.retirado_por_id) if e.retirado_por_id else None for e in estados],
+            [e.foto_id for e in estados],
+            [e.retiro_anticipado for e in estados],
+        ])
+        ids = {(a, c, f): id_ for id_, a, c, f in cursor.fetchall()}
+
+    guardados = []
+    for e in estados:
+        e.id = ids.get((int(e.alumno_id), int(e.curso_id), e.fecha))
+        if e.id:
+            e._state.adding = False
+            guardados.append(e)
+    return guardados
+
+
+def _insertar_historial(estados, usuario):
+    """
+    Historial de los estados recién guardados, con ON CONFLICT DO NOTHING
+    sobre (alumno, fecha, estado). Retorna las filas creadas.
+    """
+    historiales = {
+        (e.alumno_id, e.fecha, e.estado): HistorialEstadoAlumno(
+            estado_alumno_id=e.id,
+            alumno_id=e.alumno_id,
+            curso_id=e.curso_id,
+            fecha=e.fecha,
+            estado=e.estado,
+            observacion=e.observacion,
+            usuario_registro=usuario,
+            retirado_por_id=e.retirado_por_id,
+            hora_cambio=timezone.now(),
+        )
+        for e in estados
+    }
+    if not historiales:
+        return []
+
+    filas = list(historiales.values())
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {HistorialEstadoAlumno._meta.db_table}
+                (estado_alumno_id, alumno_id, curso_id, fecha, estado, observacion,
+                 usuario_registro_id, retirado_por_id, hora_cambio)
+            SELECT * FROM unnest(
+                %s::bigint[], %s::bigint[], %s::bigint[], %s::date[], %s::varchar[], %s::text[],
+                %s::uuid[], %s::bigint[], %s::timestamptz[]
+            )
+            ON CONFLICT ON CONSTRAINT unique_estado_por_dia_y_alumno DO NOTHING
+            RETURNING id, alumno_id, fecha, estado
+        """, [
+            [h.estado_alumno_id for h in filas],
+            [h.alumno_id for h in filas],
+            [h.curso_id for h in filas],
+            [h.fecha for h in filas],
+            [h.estado for h in filas],
+            [h.observacion for h in filas],
+            [str(h.usuario_registro_id) if h.usuario_registro_id else None for h in filas],
+            [h.retirado_por_id for h in filas],
+            [h.hora_cambio for h in filas],
+        ])
+        creados = []
+        for id_, alumno_id, fecha, estado in cursor.fetchall():
+            h = historiales[(alumno_id, fecha, estado)]
+            h.id = id_
+            h._state.adding = False
+            creados.append(h)
+
+    if len(creados) < len(filas):
+        logger.warning("%d historiales duplicados — ignorados.", len(filas) - len(creados))
+    return creados
+
+
+def guardar_estados(pendientes, usuario):
+    """
+    Escribe en una transacción los estados validados y su historial con
+    INSERT ... ON CONFLICT DO NOTHING: si otra solicitud guardó antes el
+    mismo (alumno, curso, fecha), esa escritura gana y el resultado del
+    registro pasa a 902 con el estado ganador.
+    historiales_creados se emite con todo el lote dentro de la misma
+    transacción: los trabajos de notificación de retiro (outbox) se
+    confirman junto con el estado y su historial, o no se confirma nada.
+    Después del commit actualiza el resumen diario.
+    """
+    if not pendientes:
+        return []
+
+    with transaction.atomic():
+        fotos = [foto for _, foto, _ in pendientes]
+        if any(fotos):
+            for (obj, _, _), sha in zip(pendientes, guardar_fotos(fotos)):
+                obj.foto_id = sha
+        guardados = insertar_estados([obj for obj, _, _ in pendientes])
+        if not historial_por_trigger():
+            historiales = _insertar_historial(guardados, usuario)
+        elif guardados:
+            # El trigger ya escribió el historial; se lee para emitir la señal
+            historiales = list(HistorialEstadoAlumno.objects.filter(
+                estado_alumno_id__in=[obj.id for obj in guardados]
+            ))
+        else:
+            historiales = []
+
+        if historiales:
+            historiales_creados.send(sender=HistorialEstadoAlumno, historiales=historiales)
+
+    perdedores = [(obj, resultado) for obj, _, resultado in pendientes if not obj.id]
+    if perdedores:
+        ganadores = {
+            (e.alumno_id, e.curso_id, e.fecha): e.estado
+            for e in EstadoAlumno.objects.filter(
+                alumno_id__in={obj.alumno_id for obj, _ in perdedores},
+                fecha__in={obj.fecha for obj, _ in perdedores}
+            ).only('alumno_id', 'curso_id', 'fecha', 'estado')
+        }
+        for obj, resultado in perdedores:
+            estado = ganadores.get((obj.alumno_id, obj.curso_id, obj.fecha), obj.estado)
+            resultado.pop('retiro_anticipado', None)
+            resultado.update({
+                'estado': estado,
+                'codigo_estado': ESTADOS_VALIDOS.get(estado, 0),
+                'codigo_bloqueo': 902,
+                'observacion': f"El alumno ya tiene estado '{estado}' asignado hoy."
+            })
+
+    for fecha in {obj.fecha for obj in guardados}:
+        actualizar_resumenes(fecha, curso_ids={obj.curso_id for obj in guardados if obj.fecha == fecha})
+
+    return historiales
+
+
+def registrar_estados(registros, usuario):
+    """Valida y guarda un lote. Retorna la lista de resultados por registro."""
+    procesados, pendientes = validar_registros(registros, usuario)
+    guardar_estados(pendientes, usuario)
+    return procesados
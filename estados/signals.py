@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+
+# Se emite una vez por lote de historial escrito con guardar_estados
+# (argumento `historiales`), en vez de un post_save por fila. Se emite dentro
+# de la transacción de la escritura: lo que encolen los receptores se
+# confirma (o se descarta) junto con los estados.
+historiales_creados = Signal()
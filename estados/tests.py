@@ -1,3 +1,1097 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from accounts.models import Usuario
+from alumnos.models import Alumno, PersonaAutorizadaAlumno
+from escuela.models import Curso
+from establecimientos.models import Establecimiento
+from notificaciones.models import TrabajoNotificacion
+from personas.models import Persona
+from ubicacion.models import Comuna, Pais, Region
+from .models import EstadoAlumno, FotoDocumento, HistorialEstadoAlumno, MesArchivado, ResumenDiarioAsistencia
+from .exportacion import COLUMNAS
+from .fotos import FOTO_LADO_MAX, MINIATURA_LADO_MAX, guardar_fotos, procesar_imagen
+from .eventos import eventos_desde
+from .registro import registrar_estados
+from .utils import actualizar_resumenes, ausentes
+
+
+# Datos de prueba: varios años de estados diarios (días hábiles)
+ALUMNOS = 200
+CURSOS = 8
+DESDE = date(2022, 3, 1)
+HASTA = date(2024, 12, 20)
+
+
+def crear_base(alumnos=ALUMNOS, cursos=CURSOS):
+    """Establecimiento, cursos y alumnos mínimos. Retorna (cursos, alumnos)."""
+    pais = Pais.objects.create(nombre="Chile")
+    region = Region.objects.create(nombre="Metropolitana", pais=pais)
+    comuna = Comuna.objects.create(nombre="Santiago", region=region)
+    establecimiento = Establecimiento.objects.create(nombre="Colegio Prueba", comuna=comuna)
+
+    lista_cursos = Curso.objects.bulk_create([
+        Curso(nombre=f"Curso {n}", nivel=n, establecimiento=establecimiento, hora_termino="15:00")
+        for n in range(1, cursos + 1)
+    ])
+    personas = Persona.objects.bulk_create([
+        Persona(run=f"{n}-T", nombres=f"Alumno{n}", apellido_uno=f"Apellido{n}")
+        for n in range(alumnos)
+    ])
+    lista_alumnos = Alumno.objects.bulk_create([
+        Alumno(persona=p, curso=lista_cursos[n % cursos])
+        for n, p in enumerate(personas)
+    ])
+    return lista_cursos, lista_alumnos
+
+
+class IndicesEstadosTests(TestCase):
+    """
+    Verifica con EXPLAIN que los caminos calientes de estado_alumno e
+    historial_estado_alumno usan sus índices sobre un volumen de varios años
+    (con ANALYZE, como en producción).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base()
+        with connection.cursor() as cursor:
+            # Un estado por alumno y día hábil; ~1% de retiros anticipados
+            cursor.execute(f"""
+                INSERT INTO {EstadoAlumno._meta.db_table}
+                    (alumno_id, curso_id, fecha, estado, observacion, hora_registro, retiro_anticipado)
+                SELECT a.id, a.curso_id, d::date,
+                       CASE WHEN (a.id + (d::date - DATE '2000-01-01')) %% 10 < 6 THEN 'AUSENTE'
+                            WHEN (a.id + (d::date - DATE '2000-01-01')) %% 10 < 9 THEN 'RETIRADO'
+                            ELSE 'EXTENSION' END,
+                       '', d + time '12:00' + (a.id %% 300) * interval '1 second',
+                       (a.id + (d::date - DATE '2000-01-01')) %% 100 = 7
+                FROM {Alumno._meta.db_table} a
+                CROSS JOIN generate_series(%s::date, %s::date, interval '1 day') d
+                WHERE extract(isodow FROM d) < 6
+            """, [DESDE, HASTA])
+            cursor.execute(f"""
+                INSERT INTO {HistorialEstadoAlumno._meta.db_table}
+                    (estado_alumno_id, alumno_id, curso_id, fecha, estado, observacion, hora_cambio)
+                SELECT id, alumno_id, curso_id, fecha, estado, '', hora_registro
+                FROM {EstadoAlumno._meta.db_table}
+            """)
+            # Valida una sola vez las FK diferidas (si no, se revisan al cerrar cada test)
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+            cursor.execute(f"ANALYZE {EstadoAlumno._meta.db_table}")
+            cursor.execute(f"ANALYZE {HistorialEstadoAlumno._meta.db_table}")
+
+        cls.fecha = date(2024, 6, 12)
+        cls.curso = cls.cursos[3]
+        cls.alumno = cls.alumnos[17]
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(indice, plan, plan)
+        self.assertNotIn("Seq Scan", plan, plan)
+
+    def test_listar_por_estado(self):
+        # listar_* (ausentes, retiros, extensión)
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(fecha=self.fecha, estado='RETIRADO'),
+            'estado_fecha_estado_curso_idx'
+        )
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(fecha=self.fecha, estado='AUSENTE', curso_id=self.curso.id),
+            'estado_fecha_estado_curso_idx'
+        )
+
+    def test_get_queryset_fecha_curso(self):
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(fecha=self.fecha, curso_id=self.curso.id),
+            'estado_fecha_curso_idx'
+        )
+
+    def test_retiros_anticipados_indice_parcial(self):
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(fecha=self.fecha, estado='RETIRADO', retiro_anticipado=True),
+            'estado_anticipado_idx'
+        )
+
+    def test_alumno_fecha(self):
+        # alumnos_del_curso (subconsulta por alumno y día) y calendario anual
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(alumno_id=self.alumno.id, fecha=self.fecha),
+            'estado_alumno_fecha_idx'
+        )
+        self.assertUsaIndice(
+            EstadoAlumno.objects.filter(alumno_id=self.alumno.id, fecha__year=2023),
+            'estado_alumno_fecha_idx'
+        )
+
+    def test_cambios_keyset(self):
+        desde = timezone.make_aware(datetime.combine(self.fecha, time(12, 1)))
+        self.assertUsaIndice(
+            EstadoAlumno.objects
+            .filter(fecha=self.fecha, hora_registro__gt=desde)
+            .order_by('hora_registro', 'id')[:500],
+            'estado_fecha_hora_id_idx'
+        )
+
+    def test_historial_keyset(self):
+        hasta = timezone.make_aware(datetime.combine(self.fecha, time(12))) - timedelta(days=30)
+        self.assertUsaIndice(
+            HistorialEstadoAlumno.objects
+            .filter(hora_cambio__lt=hasta)
+            .order_by('-hora_cambio', '-id')[:50],
+            'hist_hora_cambio_id_idx'
+        )
+
+
+class ListadosEstadosTests(TestCase):
+    """
+    Los listados del día arman todo el payload (nombre, curso, quién retiró,
+    parentesco) en una sola consulta, sin importar cuántas filas haya.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=40, cursos=2)
+        cls.usuario = Usuario.objects.create_user(
+            email="porteria@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+        cls.apoderados = Persona.objects.bulk_create([
+            Persona(run=f"{n}-A", nombres=f"Apoderado{n}", apellido_uno="Prueba")
+            for n in range(len(cls.alumnos))
+        ])
+        PersonaAutorizadaAlumno.objects.bulk_create([
+            PersonaAutorizadaAlumno(alumno=alumno, persona=persona, tipo_relacion="apoderado",
+                                    parentesco=PersonaAutorizadaAlumno.ParentescoChoices.MADRE)
+            for alumno, persona in zip(cls.alumnos, cls.apoderados)
+        ])
+        cls.fecha = date(2024, 6, 12)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def retirar(self, cantidad):
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=alumno, curso_id=alumno.curso_id, fecha=self.fecha, estado='RETIRADO',
+                         hora_registro=timezone.now(), usuario_registro=self.usuario, retirado_por=persona)
+            for alumno, persona in zip(self.alumnos[:cantidad], self.apoderados)
+        ])
+
+    def listar_retiros(self):
+        respuesta = self.client.get('/api/estado-alumnos/retiros', {'fecha': str(self.fecha)})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_retiros_una_consulta(self):
+        self.retirar(5)
+        with self.assertNumQueries(1):
+            pocos = self.listar_retiros()
+
+        EstadoAlumno.objects.all().delete()
+        self.retirar(40)
+        with self.assertNumQueries(1):
+            muchos = self.listar_retiros()
+
+        self.assertEqual(pocos['total_retiros'], 5)
+        self.assertEqual(muchos['total_retiros'], 40)
+        fila = muchos['alumnos'][0]
+        self.assertEqual(fila['parentesco'], 'apoderado')
+        self.assertTrue(fila['quien_retiro'].startswith('Apoderado'))
+        self.assertEqual(fila['quien_registro'], self.usuario.email)
+
+    def test_parentesco_de_quien_retira(self):
+        desconocido = Persona.objects.create(nombres="Vecino", apellido_uno="Prueba")
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=self.alumnos[0], curso_id=self.alumnos[0].curso_id, fecha=self.fecha,
+                         estado='RETIRADO', retirado_por=self.apoderados[0]),
+            # Retirado por alguien sin relación con el alumno, y sin persona indicada
+            EstadoAlumno(alumno=self.alumnos[1], curso_id=self.alumnos[1].curso_id, fecha=self.fecha,
+                         estado='RETIRADO', retirado_por=desconocido),
+            EstadoAlumno(alumno=self.alumnos[2], curso_id=self.alumnos[2].curso_id, fecha=self.fecha,
+                         estado='RETIRADO'),
+        ])
+        # La relación del apoderado 0 con otro alumno no cuenta para este
+        PersonaAutorizadaAlumno.objects.create(
+            alumno=self.alumnos[3], persona=self.apoderados[0], tipo_relacion="tío"
+        )
+
+        filas = {f['alumno']: f for f in self.listar_retiros()['alumnos']}
+        self.assertEqual(
+            [(filas[a.id]['quien_retiro'], filas[a.id]['parentesco']) for a in self.alumnos[:3]],
+            [("Apoderado0 Prueba", "apoderado"), ("Vecino Prueba", None), (None, None)]
+        )
+
+
+class MotorListadosTests(TestCase):
+    """Los cuatro listados del día salen del mismo motor (estados/listados.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=8, cursos=2)
+        cls.fecha = date(2024, 6, 12)
+        estados = [
+            ('AUSENTE', False), ('AUSENTE', False), ('RETIRADO', True), ('RETIRADO', False),
+            ('EXTENSION', False), ('RETIRADO', True), ('AUSENTE', False), ('EXTENSION', False),
+        ]
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=cls.fecha, estado=estado, retiro_anticipado=anticipado)
+            for a, (estado, anticipado) in zip(cls.alumnos, estados)
+        ] + [
+            # Otro día: no aparece
+            EstadoAlumno(alumno=cls.alumnos[0], curso_id=cls.alumnos[0].curso_id,
+                         fecha=cls.fecha - timedelta(days=1), estado='RETIRADO'),
+        ])
+        cls.usuario = Usuario.objects.create_user(
+            email="listados@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def listar(self, ruta, **params):
+        return self.client.get(f'/api/estado-alumnos/{ruta}', {'fecha': str(self.fecha), **params})
+
+    def test_cada_listado_con_su_total_y_columnas(self):
+        casos = [
+            ('ausentes', 'total_ausentes', [0, 1, 6], set()),
+            ('retiros', 'total_retiros', [2, 3, 5], {'quien_retiro', 'parentesco', 'retiro_anticipado'}),
+            ('retiros-anticipados', 'total_retiros_anticipados', [2, 5], {'quien_retiro', 'retiro_anticipado'}),
+            ('extension', 'total_extension', [4, 7], set()),
+        ]
+        comunes = {
+            'id', 'alumno', 'alumno_nombre', 'curso_id', 'curso_nombre', 'establecimiento', 'fecha',
+            'estado', 'hora_registro', 'observacion', 'foto_documento', 'foto_miniatura', 'quien_registro',
+        }
+        for ruta, total, posiciones, extras in casos:
+            with self.assertNumQueries(1):
+                data = self.listar(ruta).json()
+            self.assertEqual(data[total], len(posiciones), ruta)
+            self.assertEqual(sorted(f['alumno'] for f in data['alumnos']),
+                             [self.alumnos[n].id for n in posiciones], ruta)
+            self.assertEqual(set(data['alumnos'][0]), comunes | extras, ruta)
+
+    def test_filtro_por_curso(self):
+        data = self.listar('ausentes', curso_id=self.cursos[0].id).json()
+        self.assertEqual(sorted(f['alumno'] for f in data['alumnos']), [self.alumnos[0].id, self.alumnos[6].id])
+        self.assertEqual(self.listar('ausentes', curso_id='abc').status_code, 400)
+
+
+class ResumenDiarioTests(TestCase):
+    """resumen_diario_asistencia se mantiene al día con cada escritura."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=4, cursos=2)
+        cls.usuario = Usuario.objects.create_user(
+            email="rollup@prueba.cl", password="x", rol=Usuario.Roles.ADMIN
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def resumen(self, fecha):
+        return list(
+            ResumenDiarioAsistencia.objects.filter(fecha=fecha).order_by('curso_id')
+            .values_list('curso_id', 'ausentes', 'retiros', 'extension', 'matriculados')
+        )
+
+    def actualizar(self, fecha, registros):
+        respuesta = self.client.post('/api/estado-alumnos/actualizar', {
+            'curso_id': self.cursos[0].id, 'fecha': str(fecha), 'registros': registros
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_escrituras_mantienen_el_resumen(self):
+        fecha = date(2024, 6, 12)
+        primero, segundo = self.cursos
+        self.actualizar(fecha, [
+            {'alumno_id': self.alumnos[0].id, 'estado': 'ausente'},
+            {'alumno_id': self.alumnos[2].id, 'estado': 'ausente'},
+            {'alumno_id': self.alumnos[1].id, 'estado': 'extension'},
+        ])
+        self.assertEqual(self.resumen(fecha), [(primero.id, 2, 0, 0, 2), (segundo.id, 0, 0, 1, 2)])
+
+        estado = EstadoAlumno.objects.get(alumno=self.alumnos[2])
+        # El detalle se busca dentro del día del listado (?fecha=)
+        respuesta = self.client.patch(
+            f'/api/estado-alumnos/{estado.id}?fecha={fecha}', {'estado': 'EXTENSION'}, format='json'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.resumen(fecha), [(primero.id, 1, 0, 1, 2), (segundo.id, 0, 0, 1, 2)])
+
+        # Sin estados el (fecha, curso) desaparece del resumen
+        extension = EstadoAlumno.objects.get(alumno=self.alumnos[1])
+        self.assertEqual(self.client.delete(f'/api/estado-alumnos/{extension.id}?fecha={fecha}').status_code, 204)
+        self.assertEqual(self.resumen(fecha), [(primero.id, 1, 0, 1, 2)])
+
+    def test_rebuild_coincide_con_lo_incremental(self):
+        for n, fecha in enumerate([date(2024, 5, 30), date(2024, 6, 3), date(2024, 6, 4)]):
+            self.actualizar(fecha, [
+                {'alumno_id': a.id, 'estado': ('ausente', 'extension', 'retirado')[(n + i) % 3]}
+                for i, a in enumerate(self.alumnos[:n + 2])
+            ])
+        incremental = sorted(ResumenDiarioAsistencia.objects.values_list(
+            'fecha', 'curso_id', 'ausentes', 'retiros', 'extension', 'retiros_anticipados', 'matriculados'
+        ))
+
+        ResumenDiarioAsistencia.objects.all().delete()
+        call_command('rebuild_rollups', desde='2024-05-01', hasta='2024-06-30', stdout=StringIO())
+        self.assertEqual(sorted(ResumenDiarioAsistencia.objects.values_list(
+            'fecha', 'curso_id', 'ausentes', 'retiros', 'extension', 'retiros_anticipados', 'matriculados'
+        )), incremental)
+
+    def test_reporte_por_mes(self):
+        self.actualizar(date(2024, 5, 30), [{'alumno_id': self.alumnos[0].id, 'estado': 'ausente'}])
+        self.actualizar(date(2024, 6, 3), [{'alumno_id': a.id, 'estado': 'ausente'} for a in self.alumnos[:2]])
+
+        respuesta = self.client.get('/api/estado-alumnos/reporte-asistencia', {
+            'desde': '2024-05-01', 'hasta': '2024-06-30', 'agrupar': 'mes', 'curso_id': self.cursos[0].id
+        })
+        self.assertEqual(
+            [(p['periodo'], p['ausentes'], p['matriculados_dia'], p['porcentaje_asistencia'])
+             for p in respuesta.json()['periodos']],
+            [('2024-05-01', 1, 2, 50.0), ('2024-06-01', 1, 2, 50.0)]
+        )
+        self.assertEqual(
+            self.client.get('/api/estado-alumnos/reporte-asistencia', {'curso_id': 'abc'}).status_code, 400
+        )
+
+
+class ResumenesConcurrentesTests(TestCase):
+    """actualizar_resumenes toma los advisory locks de cada (fecha, curso)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, _ = crear_base(alumnos=4, cursos=2)
+        cls.fecha = date(2024, 6, 12)
+        cls.dia = (cls.fecha - date(2000, 1, 1)).days
+
+    def locks(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT classid::int, objid::int, mode FROM pg_locks
+                WHERE locktype = 'advisory' AND pid = pg_backend_pid()
+                ORDER BY 1, 2
+            """)
+            return cursor.fetchall()
+
+    def test_lock_por_curso(self):
+        curso = self.cursos[1]
+        actualizar_resumenes(self.fecha, curso_ids=[curso.id])
+        self.assertEqual(self.locks(), [
+            (0, self.dia, 'ShareLock'),
+            (curso.id, self.dia, 'ExclusiveLock'),
+        ])
+
+    def test_lock_dia_completo(self):
+        actualizar_resumenes(self.fecha, self.fecha + timedelta(days=1))
+        self.assertEqual(self.locks(), [
+            (0, self.dia, 'ExclusiveLock'),
+            (0, self.dia + 1, 'ExclusiveLock'),
+        ])
+
+
+class EventosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=3, cursos=1)
+        fecha = timezone.localdate()
+        estados = EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=fecha, estado='RETIRADO') for a in cls.alumnos
+        ])
+        cls.historiales = HistorialEstadoAlumno.objects.bulk_create([
+            HistorialEstadoAlumno(estado_alumno=e, alumno_id=e.alumno_id, curso_id=e.curso_id,
+                                  fecha=e.fecha, estado=e.estado)
+            for e in estados
+        ])
+
+    def test_retiene_eventos_recientes(self):
+        # El segundo evento todavía está dentro de la ventana: el feed se
+        # detiene antes de él aunque el tercero ya sea antiguo
+        antiguo = timezone.now() - timedelta(seconds=settings.CAMBIOS_VENTANA_SEGUNDOS + 5)
+        primero, segundo, tercero = self.historiales
+        HistorialEstadoAlumno.objects.filter(id__in=[primero.id, tercero.id]).update(hora_cambio=antiguo)
+
+        eventos = eventos_desde(0, {})
+        self.assertEqual([e['id'] for e in eventos], [primero.id])
+
+        HistorialEstadoAlumno.objects.filter(id=segundo.id).update(hora_cambio=antiguo)
+        eventos = eventos_desde(primero.id, {})
+        self.assertEqual([e['id'] for e in eventos], [segundo.id, tercero.id])
+
+    def cliente(self):
+        usuario = Usuario.objects.create_user(email="feed@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA)
+        client = APIClient()
+        client.force_authenticate(usuario)
+        return client
+
+    def test_espera_no_finita_responde_400(self):
+        client = self.cliente()
+        for modo in ('longpoll', 'sse'):
+            for espera in ('nan', 'inf', '-inf', 'abc'):
+                respuesta = client.get('/api/estado-alumnos/stream', {'modo': modo, 'espera': espera, 'cursor': 0})
+                self.assertEqual(respuesta.status_code, 400, (modo, espera))
+
+    def test_sse_con_espera_cero_cierra(self):
+        antiguo = timezone.now() - timedelta(seconds=settings.CAMBIOS_VENTANA_SEGUNDOS + 5)
+        HistorialEstadoAlumno.objects.update(hora_cambio=antiguo)
+
+        respuesta = self.cliente().get('/api/estado-alumnos/stream', {'espera': 0, 'cursor': 0})
+        cuerpo = b"".join(respuesta.streaming_content).decode()
+        self.assertEqual(cuerpo.count("event: estado"), 3)
+        self.assertIn(f"id: {self.historiales[-1].id}", cuerpo)
+
+
+class CambiosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=2, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="cambios@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def cambios(self, cursor=None):
+        params = {'desde_cursor': cursor} if cursor else {}
+        respuesta = self.client.get('/api/estado-alumnos/cambios', params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_pagina_vacia_no_adelanta_el_cursor(self):
+        inicial = self.cambios()
+        self.assertEqual(inicial['results'], [])
+
+        # Commit tardío: la fila confirma con una hora ya fuera de la ventana
+        estado = EstadoAlumno.objects.create(
+            alumno=self.alumnos[0], curso=self.cursos[0], fecha=timezone.localdate(), estado='AUSENTE'
+        )
+        EstadoAlumno.objects.filter(id=estado.id).update(
+            hora_registro=timezone.now() - timedelta(seconds=settings.CAMBIOS_VENTANA_SEGUNDOS + 1)
+        )
+
+        siguiente = self.cambios(inicial['next_cursor'])
+        self.assertEqual([r['id'] for r in siguiente['results']], [estado.id])
+
+        # Sin cambios nuevos se devuelve el mismo cursor recibido
+        self.assertEqual(self.cambios(siguiente['next_cursor'])['next_cursor'], siguiente['next_cursor'])
+
+
+class CargaEventosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=2, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="offline@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_id_no_numerico_rechaza_solo_ese_evento(self):
+        momento = "2024-06-12T10:00:00"
+        respuesta = self.client.post('/api/estado-alumnos/eventos', {'eventos': [
+            {'alumno_id': self.alumnos[0].id, 'tipo': 'ausente', 'timestamp': momento, 'id_cliente': 'a'},
+            {'alumno_id': 'abc', 'tipo': 'ausente', 'timestamp': momento, 'id_cliente': 'b'},
+            {'alumno_id': self.alumnos[1].id, 'tipo': 'retiro', 'timestamp': momento,
+             'retirado_por_id': 'x1', 'id_cliente': 'c'},
+        ]}, format='json')
+
+        self.assertEqual(respuesta.status_code, 200)
+        detalle = respuesta.json()['detalle']
+        self.assertEqual([d['id_cliente'] for d in detalle], ['a', 'b', 'c'])
+        self.assertEqual([d['codigo_bloqueo'] for d in detalle], [0, 903, 903])
+        self.assertEqual(respuesta.json()['aplicados'], 1)
+
+
+class ActualizarEstadosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=3, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="actualizar@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def actualizar(self, registros):
+        respuesta = self.client.post('/api/estado-alumnos/actualizar', {
+            'curso_id': self.cursos[0].id, 'fecha': '2024-06-12', 'registros': registros
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['detalle']
+
+    def test_id_no_numerico_rechaza_solo_ese_registro(self):
+        detalle = self.actualizar([
+            {'alumno_id': self.alumnos[0].id, 'estado': 'ausente'},
+            {'alumno_id': 'abc', 'estado': 'ausente'},
+            {'alumno_id': self.alumnos[1].id, 'estado': 'retirado', 'retirado_por_id': 'x1'},
+            {'alumno_id': self.alumnos[2].id, 'estado': 'ausente'},
+        ])
+
+        self.assertEqual([d['alumno_id'] for d in detalle], [self.alumnos[0].id, 'abc', self.alumnos[1].id, self.alumnos[2].id])
+        self.assertEqual([d['codigo_bloqueo'] for d in detalle], [0, 903, 903, 0])
+        self.assertEqual(EstadoAlumno.objects.count(), 2)
+
+    def test_codigos_de_bloqueo(self):
+        sin_curso = Alumno.objects.create(
+            persona=Persona.objects.create(nombres="Sin", apellido_uno="Curso")
+        )
+        apoderado, desconocido = Persona.objects.bulk_create([
+            Persona(nombres="Apoderado", apellido_uno="Prueba"),
+            Persona(nombres="Vecino", apellido_uno="Prueba"),
+        ])
+        PersonaAutorizadaAlumno.objects.bulk_create([
+            PersonaAutorizadaAlumno(alumno=self.alumnos[1], persona=apoderado, tipo_relacion="apoderado"),
+            PersonaAutorizadaAlumno(alumno=self.alumnos[2], persona=desconocido, tipo_relacion="otro",
+                                    autorizado=False),
+        ])
+
+        detalle = self.actualizar([
+            {'alumno_id': self.alumnos[0].id, 'estado': 'ausente'},
+            {'alumno_id': self.alumnos[0].id, 'estado': 'extension'},   # repetido en el lote
+            {'alumno_id': self.alumnos[1].id, 'estado': 'retirado', 'retirado_por_id': apoderado.id},
+            {'alumno_id': self.alumnos[2].id, 'estado': 'retirado', 'retirado_por_id': desconocido.id},
+            {'alumno_id': self.alumnos[2].id, 'estado': 'vacaciones'},
+            {'alumno_id': sin_curso.id, 'estado': 'ausente'},
+        ])
+
+        self.assertEqual([d['codigo_bloqueo'] for d in detalle], [0, 902, 0, 910, 900, 901])
+        self.assertEqual([d['codigo_estado'] for d in detalle], [1, 1, 2, 0, 0, 0])
+        self.assertEqual(
+            sorted(EstadoAlumno.objects.values_list('alumno_id', 'estado', 'retirado_por_id')),
+            [(self.alumnos[0].id, 'AUSENTE', None), (self.alumnos[1].id, 'RETIRADO', apoderado.id)]
+        )
+        self.assertEqual(HistorialEstadoAlumno.objects.count(), 2)
+
+        # Segunda llamada para el mismo día: lo ya guardado queda en 902
+        detalle = self.actualizar([{'alumno_id': self.alumnos[1].id, 'estado': 'ausente'}])
+        self.assertEqual((detalle[0]['codigo_bloqueo'], detalle[0]['estado']), (902, 'RETIRADO'))
+
+    def test_reintento_con_clave_no_duplica(self):
+        cuerpo = {'curso_id': self.cursos[0].id, 'fecha': '2024-06-12',
+                  'registros': [{'alumno_id': self.alumnos[0].id, 'estado': 'retirado'}]}
+        headers = {'Idempotency-Key': 'porteria-1-0001'}
+
+        primera = self.client.post('/api/estado-alumnos/actualizar', cuerpo, format='json', headers=headers)
+        reintento = self.client.post('/api/estado-alumnos/actualizar', cuerpo, format='json', headers=headers)
+
+        self.assertEqual(reintento.status_code, 200)
+        self.assertEqual(reintento['Idempotent-Replayed'], 'true')
+        # El reintento recibe el 0 original y no un 902 contra su propia escritura
+        self.assertEqual(reintento.json(), primera.json())
+        self.assertEqual(reintento.json()['detalle'][0]['codigo_bloqueo'], 0)
+        self.assertEqual(EstadoAlumno.objects.count(), 1)
+        self.assertEqual(HistorialEstadoAlumno.objects.count(), 1)
+
+        otro = {**cuerpo, 'registros': [{'alumno_id': self.alumnos[1].id, 'estado': 'ausente'}]}
+        respuesta = self.client.post('/api/estado-alumnos/actualizar', otro, format='json', headers=headers)
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(EstadoAlumno.objects.count(), 1)
+
+
+class AusentesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=4, cursos=2)
+        cls.fecha = date(2024, 6, 12)
+        # El primer curso ya tiene a sus dos alumnos registrados
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=cls.fecha, estado='RETIRADO')
+            for a in cls.alumnos if a.curso_id == cls.cursos[0].id
+        ])
+
+    def test_resumen_solo_de_los_cursos_insertados(self):
+        with mock.patch('estados.utils.actualizar_resumenes') as resumenes:
+            self.assertEqual(ausentes(self.fecha), 2)
+        resumenes.assert_called_once_with(self.fecha, curso_ids=[self.cursos[1].id])
+
+        with mock.patch('estados.utils.actualizar_resumenes') as resumenes:
+            self.assertEqual(ausentes(self.fecha), 0)
+        resumenes.assert_not_called()
+
+    def test_resumen_cuenta_los_ausentes(self):
+        ausentes(self.fecha)
+        self.assertEqual(
+            list(ResumenDiarioAsistencia.objects.filter(fecha=self.fecha).values_list('curso_id', 'ausentes')),
+            [(self.cursos[1].id, 2)]
+        )
+
+
+def imagen_base64(tamano=(40, 30), color=(200, 30, 30), formato='PNG', modo='RGB', **opciones):
+    """Imagen de prueba como data URL Base64, como la envía la portería."""
+    salida = io.BytesIO()
+    Image.new(modo, tamano, color).save(salida, formato, **opciones)
+    return f"data:image/{formato.lower()};base64," + base64.b64encode(salida.getvalue()).decode()
+
+
+class FotosTests(TestCase):
+    """Almacén de fotos direccionado por SHA-256: cada foto distinta se guarda una vez."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=3, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="fotos@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_fotos_repetidas_se_guardan_una_vez(self):
+        foto, otra = imagen_base64(), imagen_base64(color=(0, 0, 200))
+        hashes = guardar_fotos([foto, None, "no es base64 de una imagen", foto, otra])
+
+        self.assertEqual(hashes[1:3], [None, None])
+        self.assertEqual(hashes[0], hashes[3])
+        self.assertEqual(FotoDocumento.objects.count(), 2)
+
+        # Una foto ya almacenada no se vuelve a procesar
+        with mock.patch('estados.fotos.procesar_imagen') as procesar:
+            self.assertEqual(guardar_fotos([otra]), [hashes[4]])
+        procesar.assert_not_called()
+
+    def test_retiros_comparten_la_foto(self):
+        foto = imagen_base64()
+        respuesta = self.client.post('/api/estado-alumnos/actualizar', {
+            'curso_id': self.cursos[0].id, 'fecha': '2024-06-12',
+            'registros': [{'alumno_id': a.id, 'estado': 'retirado', 'foto_documento': foto} for a in self.alumnos[:2]]
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+
+        sha, = set(EstadoAlumno.objects.values_list('foto_id', flat=True))
+        self.assertEqual(FotoDocumento.objects.get().sha256, sha)
+
+        descarga = self.client.get(f'/api/estado-alumnos/fotos/{sha}')
+        self.assertEqual(descarga.status_code, 200)
+        self.assertEqual(descarga['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', descarga['Cache-Control'])
+        repetida = self.client.get(f'/api/estado-alumnos/fotos/{sha}', HTTP_IF_NONE_MATCH=descarga['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(self.client.get(f'/api/estado-alumnos/fotos/{"0" * 64}').status_code, 404)
+
+    def test_migrar_fotos_en_linea(self):
+        foto = imagen_base64()
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=date(2024, 6, 12), estado='RETIRADO',
+                         foto_documento=valor)
+            for a, valor in zip(self.alumnos, [foto, foto, "inválida"])
+        ])
+
+        call_command('migrar_fotos', lote=2, stdout=StringIO())
+
+        sha = FotoDocumento.objects.get().sha256
+        self.assertEqual(
+            list(EstadoAlumno.objects.order_by('alumno_id').values_list('foto_id', 'foto_documento')),
+            [(sha, None), (sha, None), (None, "inválida")]
+        )
+
+
+class ProcesarImagenTests(TestCase):
+    """Las fotos se guardan como JPEG reducido, orientado y sin metadatos."""
+
+    def abrir(self, contenido):
+        return Image.open(io.BytesIO(bytes(contenido)))
+
+    def test_reduce_y_aplana_transparencia(self):
+        original = base64.b64decode(imagen_base64((3000, 2000), (0, 0, 0, 0), modo='RGBA').split(',', 1)[1])
+        foto, miniatura = procesar_imagen(original)
+
+        foto, miniatura = self.abrir(foto), self.abrir(miniatura)
+        self.assertEqual((foto.format, foto.mode), ('JPEG', 'RGB'))
+        self.assertEqual(foto.size, (FOTO_LADO_MAX, round(FOTO_LADO_MAX * 2 / 3)))
+        self.assertEqual(max(miniatura.size), MINIATURA_LADO_MAX)
+        # Transparente sobre fondo blanco, no negro
+        self.assertGreater(min(foto.getpixel((10, 10))), 240)
+
+    def test_aplica_orientacion_y_quita_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6    # Orientation: rotar 90°
+        exif[0x010F] = "Cámara de prueba"
+        original = base64.b64decode(
+            imagen_base64((400, 200), formato='JPEG', exif=exif.tobytes()).split(',', 1)[1]
+        )
+
+        foto = self.abrir(procesar_imagen(original)[0])
+        self.assertEqual(foto.size, (200, 400))
+        self.assertEqual(len(foto.getexif()), 0)
+
+    def test_contenido_que_no_es_imagen(self):
+        self.assertIsNone(procesar_imagen(b"%PDF-1.4 no es una imagen"))
+
+    def test_miniatura_por_url_propia(self):
+        usuario = Usuario.objects.create_user(email="miniatura@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA)
+        client = APIClient()
+        client.force_authenticate(usuario)
+        sha, = guardar_fotos([imagen_base64((2000, 1000))])
+
+        miniatura = client.get(f'/api/estado-alumnos/fotos/{sha}/miniatura')
+        self.assertEqual(miniatura.status_code, 200)
+        self.assertEqual(self.abrir(miniatura.content).size, (MINIATURA_LADO_MAX, MINIATURA_LADO_MAX // 2))
+        self.assertNotEqual(miniatura['ETag'], client.get(f'/api/estado-alumnos/fotos/{sha}')['ETag'])
+
+
+class ResumenDiaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=6, cursos=2)
+        cls.fecha = date(2024, 6, 12)
+        estados = ['AUSENTE', 'RETIRADO', 'AUSENTE', 'RETIRADO', 'EXTENSION', 'AUSENTE']
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=cls.fecha, estado=estado,
+                         retiro_anticipado=(n == 1))
+            for n, (a, estado) in enumerate(zip(cls.alumnos, estados))
+        ])
+        cls.usuario = Usuario.objects.create_user(
+            email="resumen@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def resumen(self, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/api/estado-alumnos/resumen', {'fecha': str(self.fecha), **params}, headers=headers)
+
+    def test_totales_y_por_curso(self):
+        data = self.resumen(por_establecimiento='1').json()
+
+        self.assertEqual(
+            (data['total_ausentes'], data['total_retiros'], data['total_extension'], data['total_retiros_anticipados']),
+            (3, 2, 1, 1)
+        )
+        self.assertEqual(
+            [(c['curso_id'], c['ausentes'], c['retiros'], c['extension']) for c in data['por_curso']],
+            [(self.cursos[0].id, 2, 0, 1), (self.cursos[1].id, 1, 2, 0)]
+        )
+        establecimiento, = data['por_establecimiento']
+        self.assertEqual(establecimiento['retiros_anticipados'], 1)
+
+        filtrado = self.resumen(curso_id=self.cursos[1].id).json()
+        self.assertEqual([c['curso_id'] for c in filtrado['por_curso']], [self.cursos[1].id])
+
+    def test_etag_cambia_con_los_datos(self):
+        primera = self.resumen()
+        self.assertEqual(self.resumen(primera['ETag']).status_code, 304)
+
+        EstadoAlumno.objects.filter(alumno=self.alumnos[0]).update(estado='EXTENSION')
+        self.assertEqual(self.resumen(primera['ETag']).status_code, 200)
+
+    def test_filtros_invalidos_y_apoderado(self):
+        self.assertEqual(self.resumen(curso_id='abc').status_code, 400)
+        self.assertEqual(self.resumen(establecimiento_id='1;').status_code, 400)
+
+        apoderado = Usuario.objects.create_user(email="apoderado@prueba.cl", password="x", rol=Usuario.Roles.APODERADO)
+        self.client.force_authenticate(apoderado)
+        self.assertEqual(self.resumen().status_code, 403)
+
+
+class HistorialPaginadoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=2, cursos=1)
+        estado = EstadoAlumno.objects.create(
+            alumno=cls.alumnos[0], curso=cls.cursos[0], fecha=date(2024, 6, 12), estado='AUSENTE'
+        )
+        otro = EstadoAlumno.objects.create(
+            alumno=cls.alumnos[1], curso=cls.cursos[0], fecha=date(2024, 6, 13), estado='AUSENTE'
+        )
+        hora = timezone.make_aware(datetime(2024, 6, 12, 10))
+        # Cuatro cambios en la misma hora: el id desempata el orden
+        # (historial único por alumno, fecha y estado: una fecha por cambio)
+        horas = [hora, hora, hora, hora, hora - timedelta(minutes=5), hora + timedelta(minutes=5)]
+        historiales = HistorialEstadoAlumno.objects.bulk_create([
+            HistorialEstadoAlumno(estado_alumno=estado, alumno=estado.alumno, curso=estado.curso,
+                                  fecha=date(2024, 5, 1 + n), estado='AUSENTE', observacion=str(n))
+            for n in range(len(horas))
+        ] + [HistorialEstadoAlumno(estado_alumno=otro, alumno=otro.alumno, curso=otro.curso,
+                                   fecha=otro.fecha, estado='AUSENTE', observacion="otro")])
+        for h, hora_cambio in zip(historiales, horas):
+            HistorialEstadoAlumno.objects.filter(id=h.id).update(hora_cambio=hora_cambio)
+        cls.usuario = Usuario.objects.create_user(
+            email="historial@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def historial(self, **params):
+        return self.client.get('/api/estado-alumnos/historial', params)
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        vistos = []
+        cursor = None
+        while True:
+            params = {'alumno_id': self.alumnos[0].id, 'limit': 2, **({'cursor': cursor} if cursor else {})}
+            pagina = self.historial(**params).json()
+            vistos += [h['observacion'] for h in pagina['results']]
+            cursor = pagina['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(vistos, ['5', '3', '2', '1', '0', '4'])
+
+    def test_filtro_por_rango_de_fechas(self):
+        pagina = self.historial(desde='2024-06-13', hasta='2024-06-13').json()
+        self.assertEqual([h['observacion'] for h in pagina['results']], ['otro'])
+        self.assertIsNone(pagina['next_cursor'])
+
+    def test_parametros_invalidos(self):
+        for params in ({'cursor': 'xx'}, {'desde': '2024-13-01'}, {'alumno_id': 'abc'}, {'curso_id': '1 OR 1'}):
+            self.assertEqual(self.historial(**params).status_code, 400, params)
+
+
+class ArchivoResumenesTests(TestCase):
+    """El resumen de un mes archivado sobrevive a rebuild_rollups y se restaura."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=6, cursos=2)
+        cls.dias = [date(2023, 4, 3), date(2023, 4, 4), date(2023, 5, 2)]
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=dia, estado='AUSENTE')
+            for a in cls.alumnos for dia in cls.dias
+        ])
+        actualizar_resumenes(cls.dias[0], cls.dias[-1])
+
+    def test_rebuild_conserva_meses_archivados(self):
+        totales = sorted(ResumenDiarioAsistencia.objects.values_list('fecha', 'curso_id', 'ausentes'))
+        self.assertEqual(len(totales), 6)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command('archivar_estados', hasta='2023-04', directorio=directorio, stdout=StringIO())
+            self.assertEqual(list(MesArchivado.objects.values_list('mes', 'estados')), [(date(2023, 4, 1), 12)])
+            self.assertFalse(EstadoAlumno.objects.filter(fecha__lt=date(2023, 5, 1)).exists())
+
+            salida = StringIO()
+            call_command('rebuild_rollups', desde='2023-01-01', hasta='2023-12-31', stdout=salida)
+            self.assertIn('2023-04: mes archivado', salida.getvalue())
+            self.assertEqual(
+                sorted(ResumenDiarioAsistencia.objects.values_list('fecha', 'curso_id', 'ausentes')), totales
+            )
+
+            call_command('archivar_estados', restaurar='2023-04', directorio=directorio, stdout=StringIO())
+            self.assertFalse(MesArchivado.objects.exists())
+            self.assertEqual(EstadoAlumno.objects.count(), 18)
+            self.assertEqual(
+                sorted(ResumenDiarioAsistencia.objects.values_list('fecha', 'curso_id', 'ausentes')), totales
+            )
+
+    def test_historial_de_otro_mes_se_archiva_con_su_estado(self):
+        # Historial con fecha de mayo de un estado de abril: sale y vuelve con abril
+        estado = EstadoAlumno.objects.get(alumno=self.alumnos[0], fecha=self.dias[0])
+        historial = HistorialEstadoAlumno.objects.create(
+            estado_alumno=estado, alumno_id=estado.alumno_id, curso_id=estado.curso_id,
+            fecha=date(2023, 5, 10), estado='RETIRADO'
+        )
+
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command('archivar_estados', hasta='2023-04', directorio=directorio, stdout=StringIO())
+            self.assertEqual(MesArchivado.objects.get().historiales, 1)
+            self.assertFalse(HistorialEstadoAlumno.objects.filter(id=historial.id).exists())
+
+            ruta = os.path.join(directorio, f"{HistorialEstadoAlumno._meta.db_table}_2023-04.csv.gz")
+            with gzip.open(ruta, 'rt') as archivo:
+                self.assertEqual(len(archivo.read().splitlines()), 2)  # encabezado + la fila
+
+            call_command('archivar_estados', restaurar='2023-04', directorio=directorio, stdout=StringIO())
+            self.assertTrue(HistorialEstadoAlumno.objects.filter(id=historial.id, fecha=date(2023, 5, 10)).exists())
+
+
+class OutboxRetirosTests(TestCase):
+    """El trabajo de notificación del retiro se confirma junto con el estado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=2, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="outbox@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+        cls.apoderado = Persona.objects.create(nombres="Apoderado", apellido_uno="Prueba", email="ap@prueba.cl")
+        PersonaAutorizadaAlumno.objects.bulk_create([
+            PersonaAutorizadaAlumno(alumno=alumno, persona=cls.apoderado) for alumno in cls.alumnos
+        ])
+
+    def retirar(self):
+        return registrar_estados([
+            {'alumno_id': alumno.id, 'estado': 'RETIRADO', 'fecha': date(2024, 6, 12), 'hora': time(16)}
+            for alumno in self.alumnos
+        ], self.usuario)
+
+    def test_retiro_deja_un_trabajo_por_apoderado(self):
+        self.retirar()
+        trabajo = TrabajoNotificacion.objects.get(tipo="RETIRO")
+        self.assertEqual(trabajo.clave, f"retiro:{self.apoderado.id}")
+        self.assertEqual(len(trabajo.datos["items"]), 2)
+
+    def test_error_al_encolar_descarta_la_escritura(self):
+        with mock.patch("alumnos.signals.encolar_agrupado", side_effect=RuntimeError("cola caída")):
+            with self.assertRaises(RuntimeError):
+                self.retirar()
+        self.assertFalse(EstadoAlumno.objects.exists())
+        self.assertFalse(HistorialEstadoAlumno.objects.exists())
+
+
+@override_settings(HISTORIAL_POR_TRIGGER=True)
+class TriggerHistorialTests(TestCase):
+    """Con HISTORIAL_POR_TRIGGER el historial lo escribe Postgres, también en SQL masivo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=3, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="trigger@prueba.cl", password="x", rol=Usuario.Roles.PORTERIA
+        )
+        cls.apoderado = Persona.objects.create(nombres="Apoderado", apellido_uno="Prueba", email="ap@prueba.cl")
+        PersonaAutorizadaAlumno.objects.create(alumno=cls.alumnos[0], persona=cls.apoderado)
+        cls.fecha = date(2024, 6, 12)
+
+    def setUp(self):
+        # El DDL queda dentro de la transacción de la prueba y se revierte al final
+        call_command('historial_trigger', stdout=StringIO())
+
+    def historial(self):
+        return list(HistorialEstadoAlumno.objects.order_by('id').values_list('alumno_id', 'estado'))
+
+    def test_escrituras_masivas_y_cambios_de_estado(self):
+        ausentes(self.fecha)
+        self.assertEqual(self.historial(), [(a.id, 'AUSENTE') for a in self.alumnos])
+
+        # Solo un cambio de estado agrega historial
+        EstadoAlumno.objects.filter(alumno=self.alumnos[0]).update(observacion="llegó tarde")
+        EstadoAlumno.objects.filter(alumno=self.alumnos[1]).update(estado='RETIRADO')
+        self.assertEqual(self.historial()[3:], [(self.alumnos[1].id, 'RETIRADO')])
+
+    def test_registro_en_lote_sin_duplicar_y_con_aviso(self):
+        registrar_estados([
+            {'alumno_id': self.alumnos[0].id, 'estado': 'RETIRADO', 'fecha': self.fecha, 'hora': time(16)},
+            {'alumno_id': self.alumnos[1].id, 'estado': 'AUSENTE', 'fecha': self.fecha, 'hora': time(16)},
+        ], self.usuario)
+
+        self.assertEqual(self.historial(), [(self.alumnos[0].id, 'RETIRADO'), (self.alumnos[1].id, 'AUSENTE')])
+        self.assertEqual(
+            set(HistorialEstadoAlumno.objects.values_list('usuario_registro_id', flat=True)), {self.usuario.id}
+        )
+        # historiales_creados se emite con lo que escribió el trigger
+        trabajo = TrabajoNotificacion.objects.get(tipo="RETIRO")
+        self.assertEqual(trabajo.clave, f"retiro:{self.apoderado.id}")
+
+    def test_sin_la_opcion_el_trigger_se_quita(self):
+        with override_settings(HISTORIAL_POR_TRIGGER=False):
+            call_command('historial_trigger', stdout=StringIO())
+            ausentes(self.fecha)
+        self.assertEqual(self.historial(), [])
+
+
+class ExportacionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=4, cursos=2)
+        cls.usuario = Usuario.objects.create_user(
+            email="exportar@prueba.cl", password="x", rol=Usuario.Roles.ADMIN
+        )
+        cls.fecha = date(2024, 6, 12)
+        EstadoAlumno.objects.bulk_create([
+            EstadoAlumno(alumno=a, curso_id=a.curso_id, fecha=cls.fecha, estado='RETIRADO',
+                         hora_registro=timezone.now(), usuario_registro=cls.usuario)
+            for a in cls.alumnos
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def exportar(self, **params):
+        return self.client.get('/api/estado-alumnos/exportar', {'desde': str(self.fecha), **params})
+
+    def test_csv_sin_run(self):
+        respuesta = self.exportar(curso_id=str(self.cursos[0].id))
+        self.assertEqual(respuesta.status_code, 200)
+        lineas = b"".join(respuesta.streaming_content).decode().lstrip('﻿').splitlines()
+        self.assertEqual(lineas[0].split(','), COLUMNAS['estados'])
+        self.assertNotIn('run', lineas[0])
+        self.assertEqual(len(lineas), 1 + 2)
+
+    def test_ndjson(self):
+        respuesta = self.exportar(formato='ndjson')
+        filas = [json.loads(l) for l in b"".join(respuesta.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(f['alumno_id'] for f in filas), sorted(a.id for a in self.alumnos))
+
+    def test_filtros_invalidos_antes_del_stream(self):
+        for params in ({'curso_id': 'abc'}, {'curso_id': '1,x'}, {'establecimiento_id': 'abc'},
+                       {'hasta': '2024-06-01'}, {'desde': '2024-13-01'}):
+            respuesta = self.exportar(**params)
+            self.assertEqual(respuesta.status_code, 400, params)
+            self.assertFalse(respuesta.streaming)
+
+
+class AusentismoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cursos, cls.alumnos = crear_base(alumnos=4, cursos=1)
+        cls.usuario = Usuario.objects.create_user(
+            email="analitica@prueba.cl", password="x", rol=Usuario.Roles.ADMIN
+        )
+        # 10 días hábiles: el primer alumno falta todos, el segundo solo uno
+        cls.dias = [date(2024, 6, 3) + timedelta(days=n) for n in range(14) if (date(2024, 6, 3) + timedelta(days=n)).weekday() < 5]
+        EstadoAlumno.objects.bulk_create(
+            [EstadoAlumno(alumno=cls.alumnos[0], curso_id=cls.alumnos[0].curso_id, fecha=dia, estado='AUSENTE')
+             for dia in cls.dias]
+            + [EstadoAlumno(alumno=cls.alumnos[1], curso_id=cls.alumnos[1].curso_id, fecha=cls.dias[0], estado='AUSENTE')]
+        )
+        actualizar_resumenes(cls.dias[0], cls.dias[-1])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_marca_ausentismo_sin_run(self):
+        respuesta = self.client.get('/api/estado-alumnos/ausentismo', {
+            'dias': 10, 'umbral': 50, 'hasta': str(self.dias[-1])
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        alumno, = respuesta.json()['alumnos']
+        self.assertEqual(alumno['alumno_id'], self.alumnos[0].id)
+        self.assertEqual(alumno['alumno'], "Alumno0 Apellido0")
+        self.assertEqual((alumno['ausencias'], alumno['racha_actual']), (10, 10))
+        self.assertNotIn('run', alumno)
+
+    def test_parametros_invalidos(self):
+        for params in ({'curso_id': 'abc'}, {'umbral': 'nan'}, {'establecimiento_id': 'x'}):
+            respuesta = self.client.get('/api/estado-alumnos/ausentismo', params)
+            self.assertEqual(respuesta.status_code, 400, params)
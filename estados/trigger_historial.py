@@ -0,0 +1,64 @@
+"""
+Trigger opcional de Postgres que escribe historial_estado_alumno en cada
+INSERT o cambio de estado de estado_alumno, incluidas las escrituras masivas
+(comando ausentes, retiro por furgón, SQL manual). Se activa con
+settings.HISTORIAL_POR_TRIGGER; la migración 0015 y el comando
+`historial_trigger` dejan la BD de acuerdo con ese valor.
+"""
+from django.conf import settings
+from django.db import connection
+
+
+FUNCION_SQL = """
+CREATE OR REPLACE FUNCTION scoda_registrar_historial_estado() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.estado IS NOT DISTINCT FROM NEW.estado THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO historial_estado_alumno
+        (estado_alumno_id, alumno_id, curso_id, fecha, estado, observacion,
+         usuario_registro_id, retirado_por_id, hora_cambio)
+    VALUES
+        (NEW.id, NEW.alumno_id, NEW.curso_id, NEW.fecha, NEW.estado, NEW.observacion,
+         NEW.usuario_registro_id, NEW.retirado_por_id, now())
+    ON CONFLICT ON CONSTRAINT unique_estado_por_dia_y_alumno DO NOTHING;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS scoda_historial_estado ON estado_alumno;
+CREATE TRIGGER scoda_historial_estado
+    AFTER INSERT OR UPDATE OF estado ON estado_alumno
+    FOR EACH ROW EXECUTE FUNCTION scoda_registrar_historial_estado();
+"""
+
+QUITAR_SQL = """
+DROP TRIGGER IF EXISTS scoda_historial_estado ON estado_alumno;
+DROP FUNCTION IF EXISTS scoda_registrar_historial_estado();
+"""
+
+
+def historial_por_trigger():
+    return settings.HISTORIAL_POR_TRIGGER and connection.vendor == 'postgresql'
+
+
+def instalar(cursor):
+    cursor.execute(FUNCION_SQL)
+    cursor.execute(TRIGGER_SQL)
+
+
+def quitar(cursor):
+    cursor.execute(QUITAR_SQL)
+
+
+def sincronizar(cursor):
+    """Instala o quita el trigger según settings.HISTORIAL_POR_TRIGGER."""
+    if historial_por_trigger():
+        instalar(cursor)
+        return True
+    quitar(cursor)
+    return False
@@ -1,24 +1,223 @@
 from datetime import date
+from django.db import connection, transaction
+from django.utils import timezone
 from alumnos.models import Alumno
-from estados.models import EstadoAlumno
-
-def ausentes():
-    hoy = date.today()
-    alumnos = Alumno.objects.select_related('curso')
-
-    creados = 0
-    for alumno in alumnos:
-        obj, created = EstadoAlumno.objects.get_or_create(
-            alumno=alumno,
-            curso=alumno.curso,
-            fecha=hoy,
-            defaults={
-                'estado': 'AUSENTE',
-                'observacion': '',
-                'usuario_registro': None
-            }
+from escuela.models import Curso
+from estados.models import EstadoAlumno, HistorialEstadoAlumno, MesArchivado, ResumenDiarioAsistencia
+from estados.trigger_historial import historial_por_trigger
+
+
+def ausentes(fecha=None, establecimiento_id=None, dry_run=False):
+    """
+    Crea el registro base AUSENTE del día para todos los alumnos con curso,
+    en una sola sentencia INSERT ... SELECT ... ON CONFLICT DO NOTHING, y
+    recalcula el resumen solo de los cursos que recibieron filas nuevas.
+    Retorna la cantidad de registros creados (o que se crearían, con dry_run).
+    """
+    fecha = fecha or date.today()
+
+    estado_tabla = EstadoAlumno._meta.db_table
+    alumno_tabla = Alumno._meta.db_table
+    curso_tabla = Curso._meta.db_table
+
+    filtro = ""
+    params = [fecha]
+    if establecimiento_id:
+        filtro = f"AND a.curso_id IN (SELECT c.id FROM {curso_tabla} c WHERE c.establecimiento_id = %s)"
+        params.append(establecimiento_id)
+
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(f"""
+                SELECT COUNT(*)
+                FROM {alumno_tabla} a
+                WHERE a.curso_id IS NOT NULL {filtro}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {estado_tabla} e
+                      WHERE e.alumno_id = a.id AND e.curso_id = a.curso_id AND e.fecha = %s
+                  )
+            """, params[1:] + [fecha])
+            return cursor.fetchone()[0]
+
+        with transaction.atomic():
+            # RETURNING: solo los cursos con filas nuevas pasan al resumen
+            cursor.execute(f"""
+                WITH creados AS (
+                    INSERT INTO {estado_tabla}
+                        (alumno_id, curso_id, fecha, estado, observacion, hora_registro, retiro_anticipado)
+                    SELECT a.id, a.curso_id, %s, 'AUSENTE', '', %s, FALSE
+                    FROM {alumno_tabla} a
+                    WHERE a.curso_id IS NOT NULL {filtro}
+                    ON CONFLICT (alumno_id, curso_id, fecha) DO NOTHING
+                    RETURNING curso_id
+                )
+                SELECT curso_id, COUNT(*) FROM creados GROUP BY curso_id
+            """, [fecha, timezone.now()] + params[1:])
+            por_curso = dict(cursor.fetchall())
+
+    if por_curso:
+        actualizar_resumenes(fecha, curso_ids=list(por_curso))
+    return sum(por_curso.values())
+
+
+# Claves de pg_advisory_xact_lock(int, int) del resumen: (curso_id, día) y
+# (0, día) para el día completo; día = días desde 2000-01-01
+
+
+def _bloquear_resumenes(cursor, desde, hasta, curso_ids=None):
+    """
+    Serializa los recálculos concurrentes del mismo (fecha, curso) hasta el
+    fin de la transacción. Sin esto, dos escrituras simultáneas recalculan
+    cada una con una foto que no incluye la otra y la última en escribir deja
+    el resumen con conteos de menos.
+    Con curso_ids: lock compartido del día + exclusivo de cada (curso, día).
+    Sin curso_ids (ausentes, rebuild): exclusivo del día completo.
+    Siempre en orden de día y curso, para no producir deadlocks.
+    """
+    dias = "generate_series(%s::date - DATE '2000-01-01', %s::date - DATE '2000-01-01') AS d"
+    if not curso_ids:
+        cursor.execute(f"SELECT pg_advisory_xact_lock(0, d) FROM {dias} ORDER BY d", [desde, hasta])
+        return
+    cursor.execute(f"SELECT pg_advisory_xact_lock_shared(0, d) FROM {dias} ORDER BY d", [desde, hasta])
+    cursor.execute(f"""
+        SELECT pg_advisory_xact_lock(c, d)
+        FROM unnest(%s::int[]) AS c, {dias}
+        ORDER BY d, c
+    """, [sorted({int(c) for c in curso_ids}), desde, hasta])
+
+
+def actualizar_resumenes(desde, hasta=None, curso_ids=None, establecimiento_id=None):
+    """
+    Recalcula resumen_diario_asistencia para las fechas y cursos indicados con
+    un solo INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE.
+    Se llama después de cada escritura, solo con los (fecha, curso) afectados.
+    Toma antes los locks de _bloquear_resumenes: el recálculo ve todo lo
+    confirmado por quien tuvo el lock antes.
+    Las fechas de meses archivados (MesArchivado) no se tocan: sus estados
+    ya no están en la tabla y su resumen es el único registro que queda.
+    """
+    hasta = hasta or desde
+
+    resumen_tabla = ResumenDiarioAsistencia._meta.db_table
+    estado_tabla = EstadoAlumno._meta.db_table
+    alumno_tabla = Alumno._meta.db_table
+    curso_tabla = Curso._meta.db_table
+
+    filtro = f" AND date_trunc('month', e.fecha)::date NOT IN (SELECT mes FROM {MesArchivado._meta.db_table})"
+    params = [timezone.now(), desde, hasta]
+    if curso_ids:
+        filtro += " AND e.curso_id = ANY(%s)"
+        params.append([int(c) for c in curso_ids])
+    if establecimiento_id:
+        filtro += " AND c.establecimiento_id = %s"
+        params.append(establecimiento_id)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        _bloquear_resumenes(cursor, desde, hasta, curso_ids)
+
+        # Un (fecha, curso) sin estados ya no debe figurar en el resumen
+        cursor.execute(f"""
+            DELETE FROM {resumen_tabla} r
+            USING {curso_tabla} c
+            WHERE c.id = r.curso_id AND r.fecha BETWEEN %s AND %s
+              {filtro.replace('e.fecha', 'r.fecha').replace('e.curso_id', 'r.curso_id')}
+              AND NOT EXISTS (
+                  SELECT 1 FROM {estado_tabla} e
+                  WHERE e.fecha = r.fecha AND e.curso_id = r.curso_id
+              )
+        """, params[1:])
+
+        cursor.execute(f"""
+            INSERT INTO {resumen_tabla}
+                (fecha, curso_id, establecimiento_id, ausentes, retiros, extension,
+                 retiros_anticipados, matriculados, actualizado)
+            SELECT e.fecha, e.curso_id, c.establecimiento_id,
+                   COUNT(*) FILTER (WHERE e.estado = 'AUSENTE'),
+                   COUNT(*) FILTER (WHERE e.estado = 'RETIRADO'),
+                   COUNT(*) FILTER (WHERE e.estado = 'EXTENSION'),
+                   COUNT(*) FILTER (WHERE e.estado = 'RETIRADO' AND e.retiro_anticipado),
+                   (SELECT COUNT(*) FROM {alumno_tabla} a WHERE a.curso_id = e.curso_id),
+                   %s
+            FROM {estado_tabla} e
+            JOIN {curso_tabla} c ON c.id = e.curso_id
+            WHERE e.fecha BETWEEN %s AND %s {filtro}
+            GROUP BY e.fecha, e.curso_id, c.establecimiento_id
+            ON CONFLICT (fecha, curso_id) DO UPDATE SET
+                establecimiento_id = EXCLUDED.establecimiento_id,
+                ausentes = EXCLUDED.ausentes,
+                retiros = EXCLUDED.retiros,
+                extension = EXCLUDED.extension,
+                retiros_anticipados = EXCLUDED.retiros_anticipados,
+                matriculados = EXCLUDED.matriculados,
+                actualizado = EXCLUDED.actualizado
+        """, params)
+        return cursor.rowcount
+
+
+def registrar_historial(estados, usuario=None):
+    """
+    Agrega al historial los estados escritos fuera de actualizar_estados
+    (CRUD, retiro masivo del furgón) para que el feed de cambios los vea.
+    Un (alumno, fecha, estado) ya registrado se ignora.
+    No emite post_save: no dispara notificaciones.
+    Con HISTORIAL_POR_TRIGGER la BD ya lo registró y no se hace nada.
+    """
+    if historial_por_trigger():
+        return
+    HistorialEstadoAlumno.objects.bulk_create([
+        HistorialEstadoAlumno(
+            estado_alumno_id=e.id,
+            alumno_id=e.alumno_id,
+            curso_id=e.curso_id,
+            fecha=e.fecha,
+            estado=e.estado,
+            observacion=e.observacion,
+            usuario_registro=usuario if usuario and usuario.is_authenticated else None,
+            retirado_por_id=e.retirado_por_id,
         )
-        if created:
-            creados += 1
+        for e in estados if e.curso_id
+    ], ignore_conflicts=True)
+
+
+# Un carácter por día del año para el calendario de asistencia
+CODIGOS_CALENDARIO = {
+    'AUSENTE': 'A',
+    'RETIRADO': 'R',
+    'EXTENSION': 'E',
+}
+CODIGO_ANTICIPADO = 'T'
+CODIGO_SIN_REGISTRO = '.'
+
+
+def calendario_anual(alumno_id, anio):
+    """
+    Estados del alumno en el año como texto de un carácter por día
+    (posición 0 = 1 de enero), con una sola consulta sobre
+    estado_alumno_fecha_idx. Ver CODIGOS_CALENDARIO.
+    """
+    inicio = date(anio, 1, 1)
+    dias = [CODIGO_SIN_REGISTRO] * (date(anio, 12, 31) - inicio).days
+    dias.append(CODIGO_SIN_REGISTRO)
+
+    filas = EstadoAlumno.objects.filter(
+        alumno_id=alumno_id,
+        fecha__range=(inicio, date(anio, 12, 31))
+    ).values_list('fecha', 'estado', 'retiro_anticipado')
+
+    for fecha, estado, anticipado in filas:
+        codigo = CODIGO_ANTICIPADO if anticipado else CODIGOS_CALENDARIO.get(estado, CODIGO_SIN_REGISTRO)
+        dias[(fecha - inicio).days] = codigo
+    return "".join(dias)
+
 
-    print(f"Se generaron {creados} registros base con estado AUSENTE para el día {hoy}.")
+def comprimir_rle(texto):
+    """'....AA.' -> '4.2A.' (el largo se omite cuando es 1)."""
+    partes = []
+    i = 0
+    while i < len(texto):
+        j = i
+        while j < len(texto) and texto[j] == texto[i]:
+            j += 1
+        partes.append(f"{j - i if j - i > 1 else ''}{texto[i]}")
+        i = j
+    return "".join(partes)
@@ -1,14 +1,63 @@
-from datetime import datetime, date
+import base64
+import binascii
+import hashlib
+import json
+import math
+from datetime import datetime, date, timedelta
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from auditoria.mixins import AuditoriaMixin
-from .models import EstadoAlumno, HistorialEstadoAlumno
+from auditoria.idempotencia import idempotente
+from .models import EstadoAlumno, HistorialEstadoAlumno, FotoDocumento, ResumenDiarioAsistencia
 from .serializers import EstadoAlumnoSerializer
+from .exportacion import consulta_exportacion, stream_csv, stream_ndjson
+from .eventos import (
+    EventStreamRenderer, eventos_desde, esperar_eventos, stream_sse, ultimo_evento_id,
+    LONGPOLL_ESPERA_MAXIMA, SSE_DURACION_MAXIMA,
+)
+from .analitica import ausentismo_cronico
+from .listados import listar_estados
+from .registro import registrar_estados
+from .utils import actualizar_resumenes, registrar_historial
 from escuela.models import Curso
+from django.conf import settings
+from django.utils import timezone
 from django.utils.timezone import localtime
-from django.db import IntegrityError
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncYear
+
+
+HISTORIAL_LIMIT_DEFECTO = 100
+HISTORIAL_LIMIT_MAXIMO = 500
+CAMBIOS_LIMIT_DEFECTO = 500
+CAMBIOS_LIMIT_MAXIMO = 2000
+EVENTOS_MAXIMO = 5000
+
+TIPOS_EVENTO = {'AUSENTE': 'AUSENTE', 'RETIRO': 'RETIRADO', 'RETIRADO': 'RETIRADO', 'EXTENSION': 'EXTENSION'}
+
+
+def _codificar_cursor(hora, id_):
+    return base64.urlsafe_b64encode(f"{hora.isoformat()}|{id_}".encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    """Retorna (hora, id) o lanza ValueError si el cursor no es válido."""
+    try:
+        hora_str, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(hora_str), int(id_)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Cursor inválido")
+
+
+def _es_id(valor):
+    """Id válido para la BD (bigint positivo), como número o texto."""
+    if isinstance(valor, str) and valor.strip().isdecimal():
+        valor = int(valor)
+    return type(valor) is int and 0 < valor < 2 ** 63
 
 
 class EstadoAlumnoViewSet(AuditoriaMixin, viewsets.ModelViewSet):
@@ -54,13 +103,32 @@ class EstadoAlumnoViewSet(AuditoriaMixin, viewsets.ModelViewSet):
 
         return queryset.order_by('-fecha', 'alumno__persona__nombres')
 
+    # ----------------------------------------------------------
+    # CRUD: mantener historial y resumen diario al día
+    # ----------------------------------------------------------
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        registrar_historial([serializer.instance], self.request.user)
+        actualizar_resumenes(serializer.instance.fecha, curso_ids=[serializer.instance.curso_id])
+
+    def perform_update(self, serializer):
+        anterior = (serializer.instance.fecha, serializer.instance.curso_id)
+        super().perform_update(serializer)
+        registrar_historial([serializer.instance], self.request.user)
+        actualizar_resumenes(anterior[0], curso_ids=[anterior[1]])
+        actualizar_resumenes(serializer.instance.fecha, curso_ids=[serializer.instance.curso_id])
+
+    def perform_destroy(self, instance):
+        fecha, curso_id = instance.fecha, instance.curso_id
+        super().perform_destroy(instance)
+        actualizar_resumenes(fecha, curso_ids=[curso_id])
+
     # ----------------------------------------------------------
     # ACTUALIZAR ESTADOS
     # ----------------------------------------------------------
     @action(detail=False, methods=['post'], url_path='actualizar')
+    @idempotente
     def actualizar_estados(self, request):
-        from alumnos.models import PersonaAutorizadaAlumno, Alumno
-
         user = request.user
         curso_id_front = request.data.get('curso_id')
         registros = request.data.get('registros', [])
@@ -77,132 +145,30 @@ class EstadoAlumnoViewSet(AuditoriaMixin, viewsets.ModelViewSet):
         if not curso_id_front or not registros:
             return Response({'error': 'curso_id y registros son requeridos'}, status=400)
 
-        procesados = []
-        ESTADOS_VALIDOS = {'AUSENTE': 1, 'RETIRADO': 2, 'EXTENSION': 3}
-
-        for reg in registros:
-            alumno_id = reg.get('alumno_id')
-            estado = reg.get('estado')
-            observacion = reg.get('observacion', '')
-            retirado_por_id = reg.get('retirado_por_id')
-            foto_base64 = reg.get('foto_documento')
-
-            if not alumno_id or not estado:
+        # Validación y escritura en lote (estados/registro.py); ids mal
+        # formados se informan sin pasar a la validación, en su posición
+        ahora = localtime().time()
+        resultados = []
+        validos = []
+        for r in registros:
+            if not isinstance(r, dict) or not r.get('alumno_id') or not r.get('estado'):
                 continue
-
-            estado_upper = str(estado).upper().strip()
-
-            if estado_upper not in ESTADOS_VALIDOS:
-                procesados.append({
-                    'alumno_id': alumno_id,
-                    'estado': estado_upper,
+            if not _es_id(r['alumno_id']) or (
+                r.get('retirado_por_id') not in (None, '') and not _es_id(r['retirado_por_id'])
+            ):
+                resultados.append({
+                    'alumno_id': r['alumno_id'],
+                    'id_cliente': r.get('id_cliente'),
+                    'estado': str(r['estado']).upper().strip(),
                     'codigo_estado': 0,
-                    'codigo_bloqueo': 900,
-                    'observacion': f"Estado '{estado}' no es válido."
+                    'codigo_bloqueo': 903,
+                    'observacion': "alumno_id y retirado_por_id deben ser números enteros."
                 })
                 continue
-
-            # ------------------------------------------
-            # OBTENER EL CURSO REAL DEL ALUMNO
-            # ------------------------------------------
-            alumno_obj = Alumno.objects.select_related("curso").filter(id=alumno_id).first()
-            if not alumno_obj or not alumno_obj.curso:
-                procesados.append({
-                    'alumno_id': alumno_id,
-                    'estado': estado_upper,
-                    'codigo_estado': 0,
-                    'codigo_bloqueo': 901,
-                    'observacion': "El alumno no tiene curso asignado."
-                })
-                continue
-
-            curso_real = alumno_obj.curso
-
-            existente = EstadoAlumno.objects.filter(
-                alumno_id=alumno_id, curso_id=curso_real.id, fecha=fecha
-            ).first()
-
-            if existente:
-                procesados.append({
-                    'alumno_id': alumno_id,
-                    'estado': existente.estado,
-                    'codigo_estado': ESTADOS_VALIDOS.get(existente.estado.upper(), 0),
-                    'codigo_bloqueo': 902,
-                    'observacion': f"El alumno ya tiene estado '{existente.estado}' asignado hoy."
-                })
-                continue
-
-            # VALIDAR APODERADO/AUTORIZADO
-            if estado_upper == 'RETIRADO' and retirado_por_id:
-                autorizado = PersonaAutorizadaAlumno.objects.filter(
-                    alumno_id=alumno_id,
-                    persona_id=retirado_por_id,
-                    autorizado=True
-                ).exists()
-                apoderado = PersonaAutorizadaAlumno.objects.filter(
-                    alumno_id=alumno_id,
-                    persona_id=retirado_por_id,
-                    tipo_relacion__icontains='apoderado'
-                ).exists()
-
-                if not (autorizado or apoderado):
-                    procesados.append({
-                        'alumno_id': alumno_id,
-                        'estado': estado_upper,
-                        'codigo_estado': 0,
-                        'codigo_bloqueo': 910,
-                        'observacion': "La persona indicada NO está autorizada."
-                    })
-                    continue
-
-            defaults = {
-                'estado': estado_upper,
-                'observacion': observacion,
-                'usuario_registro': user
-            }
-
-            if estado_upper == 'RETIRADO' and retirado_por_id:
-                defaults['retirado_por_id'] = retirado_por_id
-            if foto_base64:
-                defaults['foto_documento'] = foto_base64
-
-            obj, _ = EstadoAlumno.objects.update_or_create(
-                alumno_id=alumno_id,
-                curso_id=curso_real.id,  # ← CURSO CORRECTO
-                fecha=fecha,
-                defaults=defaults
-            )
-
-            # RETIRO ANTICIPADO usando curso REAL
-            if estado_upper == 'RETIRADO':
-                curso = curso_real
-                if curso and curso.hora_termino:
-                    if localtime().time() < curso.hora_termino:
-                        obj.retiro_anticipado = True
-                        obj.save(update_fields=['retiro_anticipado'])
-
-            try:
-                HistorialEstadoAlumno.objects.create(
-                    estado_alumno=obj,
-                    alumno_id=alumno_id,
-                    curso_id=curso_real.id,  # ← CORRECTO
-                    fecha=fecha,
-                    estado=estado_upper,
-                    observacion=observacion,
-                    usuario_registro=user,
-                    retirado_por_id=retirado_por_id if estado_upper == 'RETIRADO' else None
-                )
-            except IntegrityError:
-                print(f"[WARN] Historial duplicado para alumno {alumno_id} ({fecha}) — ignorado.")
-
-            procesados.append({
-                'alumno_id': alumno_id,
-                'estado': estado_upper,
-                'codigo_estado': ESTADOS_VALIDOS.get(estado_upper, 0),
-                'codigo_bloqueo': 0,
-                'observacion': observacion,
-                'retiro_anticipado': getattr(obj, 'retiro_anticipado', False)
-            })
+            resultados.append(None)
+            validos.append({**r, 'fecha': fecha, 'hora': ahora})
+        aplicados = iter(registrar_estados(validos, user) if validos else [])
+        procesados = [r if r is not None else next(aplicados) for r in resultados]
 
         self.registrar_auditoria(
             request, 'ACTUALIZAR', 'EstadoAlumno',
@@ -215,274 +181,611 @@ class EstadoAlumnoViewSet(AuditoriaMixin, viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    # ----------------------------------------------------------
+    # CARGA DE EVENTOS OFFLINE (portería sin conexión)
+    # ----------------------------------------------------------
+    @action(detail=False, methods=['post'], url_path='eventos')
+    @idempotente
+    def cargar_eventos(self, request):
+        """
+        Recibe `eventos`: lista ordenada de eventos registrados sin conexión,
+        de uno o varios cursos. Cada evento: alumno_id, tipo (ausente, retiro,
+        extension), timestamp ISO del dispositivo; opcionales: id_cliente,
+        observacion, retirado_por_id, foto_documento.
+        La fecha y el retiro anticipado se calculan con el timestamp del
+        dispositivo. Se aplican las mismas validaciones que `actualizar` y se
+        responde un resultado por evento, en el mismo orden.
+        """
+        eventos = request.data.get('eventos')
+        if not isinstance(eventos, list) or not eventos:
+            return Response({'error': 'eventos es requerido'}, status=400)
+        if len(eventos) > EVENTOS_MAXIMO:
+            return Response({'error': f'Máximo {EVENTOS_MAXIMO} eventos por solicitud.'}, status=400)
+
+        # Eventos mal formados se informan sin pasar a la validación
+        resultados = [None] * len(eventos)
+        registros = []
+        posiciones = []
+        for i, ev in enumerate(eventos):
+            if not isinstance(ev, dict):
+                ev = {}
+            tipo = str(ev.get('tipo') or ev.get('estado') or '').upper().strip()
+            try:
+                momento = datetime.fromisoformat(str(ev.get('timestamp')))
+                # Sin zona horaria se asume la hora local del establecimiento
+                momento = localtime(momento) if timezone.is_aware(momento) else momento
+            except ValueError:
+                momento = None
+
+            error = None
+            if not ev.get('alumno_id') or not momento:
+                error = "El evento requiere alumno_id y timestamp válido."
+            elif not _es_id(ev['alumno_id']) or (
+                ev.get('retirado_por_id') not in (None, '') and not _es_id(ev['retirado_por_id'])
+            ):
+                error = "alumno_id y retirado_por_id deben ser números enteros."
+            if error:
+                resultados[i] = {
+                    'alumno_id': ev.get('alumno_id'),
+                    'id_cliente': ev.get('id_cliente'),
+                    'estado': tipo,
+                    'codigo_estado': 0,
+                    'codigo_bloqueo': 903,
+                    'observacion': error
+                }
+                continue
+
+            registros.append({
+                'id_cliente': ev.get('id_cliente'),
+                'alumno_id': ev['alumno_id'],
+                'estado': TIPOS_EVENTO.get(tipo, tipo),
+                'observacion': ev.get('observacion', ''),
+                'retirado_por_id': ev.get('retirado_por_id'),
+                'foto_documento': ev.get('foto_documento'),
+                'fecha': momento.date(),
+                'hora': momento.time(),
+            })
+            posiciones.append(i)
+
+        procesados = registrar_estados(registros, request.user) if registros else []
+        for i, resultado in zip(posiciones, procesados):
+            resultados[i] = resultado
+
+        aplicados = sum(1 for r in resultados if r['codigo_bloqueo'] == 0)
+        self.registrar_auditoria(
+            request, 'ACTUALIZAR', 'EstadoAlumno',
+            f"Carga offline: {aplicados} de {len(eventos)} eventos aplicados"
+        )
+
+        return Response({
+            'message': f'Se aplicaron {aplicados} de {len(eventos)} eventos.',
+            'aplicados': aplicados,
+            'rechazados': len(eventos) - aplicados,
+            'detalle': resultados,
+        }, status=status.HTTP_200_OK)
+
     # ----------------------------------------------------------
     # HISTORIAL
     # ----------------------------------------------------------
     @action(detail=False, methods=['get'], url_path='historial')
     def historial(self, request):
-
+        """
+        Historial paginado por keyset sobre (hora_cambio, id), del más reciente
+        al más antiguo. Para la página siguiente se envía `cursor=<next_cursor>`.
+        """
         alumno_id = request.query_params.get('alumno_id')
         curso_id = request.query_params.get('curso_id')
         fecha_str = request.query_params.get('fecha')
+        desde_str = request.query_params.get('desde')
+        hasta_str = request.query_params.get('hasta')
+        cursor = request.query_params.get('cursor')
 
-        historial = HistorialEstadoAlumno.objects.select_related('alumno__persona', 'curso')
+        try:
+            limit = min(int(request.query_params.get('limit', HISTORIAL_LIMIT_DEFECTO)), HISTORIAL_LIMIT_MAXIMO)
+        except ValueError:
+            limit = HISTORIAL_LIMIT_DEFECTO
+        limit = max(limit, 1)
+
+        if (alumno_id and not _es_id(alumno_id)) or (curso_id and not _es_id(curso_id)):
+            return Response({'error': 'alumno_id y curso_id deben ser números enteros.'}, status=400)
+
+        historial = HistorialEstadoAlumno.objects.all()
 
         if alumno_id:
             historial = historial.filter(alumno_id=alumno_id)
         if curso_id:
             historial = historial.filter(curso_id=curso_id)
-        if fecha_str:
+        try:
+            if fecha_str:
+                historial = historial.filter(fecha=datetime.strptime(fecha_str, '%Y-%m-%d').date())
+            if desde_str:
+                historial = historial.filter(fecha__gte=datetime.strptime(desde_str, '%Y-%m-%d').date())
+            if hasta_str:
+                historial = historial.filter(fecha__lte=datetime.strptime(hasta_str, '%Y-%m-%d').date())
+        except ValueError:
+            return Response({'error': 'Formato de fecha inválido.'}, status=400)
+
+        if cursor:
             try:
-                fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-                historial = historial.filter(fecha=fecha)
+                hora_cursor, ultimo_id = _decodificar_cursor(cursor)
             except ValueError:
-                pass
-
-        data = []
-        for h in historial.order_by('-hora_cambio'):
-            data.append({
-                'alumno': f"{h.alumno.persona.nombres} {h.alumno.persona.apellido_uno} {h.alumno.persona.apellido_dos or ''}".strip(),
-                'curso': h.curso.nombre,
-                'fecha': h.fecha,
-                'estado': h.estado,
-                'observacion': h.observacion,
-                'usuario_registro': getattr(h.usuario_registro, 'email', None),
-                'hora_cambio': localtime(h.hora_cambio).strftime("%H:%M")
-            })
+                return Response({'error': 'Cursor inválido.'}, status=400)
+            historial = historial.filter(
+                Q(hora_cambio__lt=hora_cursor) | Q(hora_cambio=hora_cursor, id__lt=ultimo_id)
+            )
+
+        filas = list(
+            historial
+            .order_by('-hora_cambio', '-id')
+            .values(
+                'id', 'fecha', 'estado', 'observacion', 'hora_cambio',
+                'alumno__persona__nombres', 'alumno__persona__apellido_uno',
+                'alumno__persona__apellido_dos', 'curso__nombre', 'usuario_registro__email'
+            )[:limit + 1]
+        )
+
+        next_cursor = None
+        if len(filas) > limit:
+            filas = filas[:limit]
+            ultima = filas[-1]
+            next_cursor = _codificar_cursor(ultima['hora_cambio'], ultima['id'])
+
+        data = [
+            {
+                'alumno': " ".join(filter(None, [
+                    h['alumno__persona__nombres'],
+                    h['alumno__persona__apellido_uno'],
+                    h['alumno__persona__apellido_dos'],
+                ])),
+                'curso': h['curso__nombre'],
+                'fecha': h['fecha'],
+                'estado': h['estado'],
+                'observacion': h['observacion'],
+                'usuario_registro': h['usuario_registro__email'],
+                'hora_cambio': localtime(h['hora_cambio']).strftime("%H:%M")
+            }
+            for h in filas
+        ]
 
-        return Response(data, status=status.HTTP_200_OK)
+        return Response({
+            'results': data,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
 
     # ----------------------------------------------------------
-    # LISTAR AUSENTES
+    # SINCRONIZACIÓN INCREMENTAL (solo lo que cambió desde el cursor)
     # ----------------------------------------------------------
-    @action(detail=False, methods=['get'], url_path='ausentes')
-    def listar_ausentes(self, request):
+    @action(detail=False, methods=['get'], url_path='cambios')
+    def cambios(self, request):
+        """
+        Estados creados o modificados después de `desde_cursor`, ordenados por
+        (hora_registro, id). Acepta los mismos filtros que el listado principal
+        (fecha, desde/hasta, curso_id). Sin cursor retorna todo el listado y el
+        cursor inicial. Se responde siempre `next_cursor` (igual al recibido si
+        no hubo cambios) y `has_more` si quedan páginas por leer. Las filas de
+        los últimos settings.CAMBIOS_VENTANA_SEGUNDOS salen en la próxima llamada.
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', CAMBIOS_LIMIT_DEFECTO)), CAMBIOS_LIMIT_MAXIMO)
+        except ValueError:
+            limit = CAMBIOS_LIMIT_DEFECTO
+        limit = max(limit, 1)
+
+        # Las filas de los últimos segundos se entregan en la próxima llamada:
+        # así una transacción lenta no queda detrás de un cursor ya avanzado.
+        tope = timezone.now() - timedelta(seconds=settings.CAMBIOS_VENTANA_SEGUNDOS)
+        queryset = self.get_queryset().filter(hora_registro__lte=tope)
+
+        cursor = request.query_params.get('desde_cursor')
+        if cursor:
+            try:
+                hora_cursor, ultimo_id = _decodificar_cursor(cursor)
+            except ValueError:
+                return Response({'error': 'Cursor inválido.'}, status=400)
+            queryset = queryset.filter(
+                Q(hora_registro__gt=hora_cursor) | Q(hora_registro=hora_cursor, id__gt=ultimo_id)
+            )
+
+        filas = list(queryset.order_by('hora_registro', 'id')[:limit + 1])
+        has_more = len(filas) > limit
+        filas = filas[:limit]
+
+        next_cursor = _codificar_cursor(filas[-1].hora_registro, filas[-1].id) if filas else cursor
+        if not next_cursor:
+            # Listado vacío: el cursor parte desde el inicio y no desde el tope,
+            # que saltaría las filas con hora anterior aún sin commit
+            next_cursor = _codificar_cursor(timezone.make_aware(datetime(1970, 1, 1)), 0)
+
+        return Response({
+            'results': self.get_serializer(filas, many=True).data,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
+
+    # ----------------------------------------------------------
+    # FEED DE CAMBIOS EN VIVO (SSE o long-poll sobre el historial)
+    # ----------------------------------------------------------
+    @action(detail=False, methods=['get'], url_path='stream',
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer])
+    def stream(self, request):
+        """
+        Eventos compactos (alumno, curso, estado, hora) de cada cambio de estado.
+        Por defecto responde `text/event-stream`; con `modo=longpoll` responde
+        JSON `{eventos, cursor}` apenas hay cambios o al vencer `espera` segundos.
+        Filtros: curso_id (uno o varios separados por coma) y establecimiento_id.
+        El cursor es el id del historial: header `Last-Event-ID` o `?cursor=`;
+        sin cursor se parte desde el último evento existente.
+        `espera` (segundos) es lo máximo que se mantiene abierta la solicitud en
+        ambos modos: long-poll hasta 25 (defecto 25) y SSE hasta 55 (defecto 55;
+        al cerrar, EventSource reconecta con Last-Event-ID). Cada solicitud
+        abierta ocupa un worker: con gunicorn sync (Procfile) usar `espera=0`,
+        que responde lo pendiente y cierra, o un worker con hilos.
+        """
         user = request.user
         if getattr(user, 'rol', '').lower() == 'apoderado':
             return Response({'error': 'No autorizado'}, status=403)
 
-        fecha_str = request.query_params.get('fecha')
-        curso_id = request.query_params.get('curso_id')
-
+        params = request.query_params
+        cursor = request.headers.get('Last-Event-ID') or params.get('cursor')
         try:
-            fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else date.today()
+            cursor = int(cursor) if cursor else ultimo_evento_id()
         except ValueError:
-            fecha = date.today()
+            return Response({'error': 'Cursor inválido.'}, status=400)
+
+        filtros = {}
+        if params.get('curso_id'):
+            filtros['curso_id__in'] = [c for c in params['curso_id'].split(',') if c]
+            if not all(_es_id(c) for c in filtros['curso_id__in']):
+                return Response({'error': 'curso_id inválido.'}, status=400)
+        if params.get('establecimiento_id'):
+            if not _es_id(params['establecimiento_id']):
+                return Response({'error': 'establecimiento_id inválido.'}, status=400)
+            filtros['curso__establecimiento_id'] = params['establecimiento_id']
+
+        longpoll = params.get('modo') == 'longpoll'
+        maximo = LONGPOLL_ESPERA_MAXIMA if longpoll else SSE_DURACION_MAXIMA
+        try:
+            espera = float(params.get('espera', maximo))
+        except ValueError:
+            espera = None
+        # NaN e infinito pasan float() y cualquier comparación: se rechazan
+        if espera is None or not math.isfinite(espera):
+            return Response({'error': 'espera debe ser un número de segundos.'}, status=400)
+        espera = min(max(espera, 0), maximo)
+
+        if longpoll:
+            eventos = esperar_eventos(cursor, filtros, espera) if espera else eventos_desde(cursor, filtros)
+            return Response({
+                'eventos': eventos,
+                'cursor': eventos[-1]['id'] if eventos else cursor,
+            }, status=200)
+
+        response = StreamingHttpResponse(stream_sse(cursor, filtros, espera), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: no acumular el stream
+        return response
 
-        filtros = {'fecha': fecha, 'estado': 'AUSENTE'}
-        if curso_id:
-            filtros['curso_id'] = curso_id
+    # ----------------------------------------------------------
+    # EXPORTACIÓN (CSV / NDJSON en streaming)
+    # ----------------------------------------------------------
+    @action(detail=False, methods=['get'], url_path='exportar')
+    def exportar(self, request):
+        """
+        Exporta estados (o historial, con `fuente=historial`) de un rango de
+        fechas. Filtros: desde, hasta, curso_id (uno o varios separados por
+        coma), establecimiento_id y estado. `formato=csv` (defecto) o `ndjson`.
+        """
+        user = request.user
+        if getattr(user, 'rol', '').lower() == 'apoderado':
+            return Response({'error': 'No autorizado'}, status=403)
 
-        queryset = EstadoAlumno.objects.select_related(
-            'alumno__persona', 'curso__establecimiento', 'usuario_registro'
-        ).filter(**filtros)
-
-        alumnos_data = []
-
-        for estado in queryset:
-            alumno = estado.alumno
-            persona = alumno.persona
-            curso = alumno.curso
-            establecimiento = curso.establecimiento if curso else None
-            usuario_registro = estado.usuario_registro
-
-            alumnos_data.append({
-                "id": estado.id,
-                "alumno": alumno.id,
-                "alumno_nombre": f"{persona.nombres} {persona.apellido_uno} {persona.apellido_dos or ''}".strip(),
-                "curso_id": curso.id if curso else None,
-                "curso_nombre": curso.nombre if curso else None,
-                "establecimiento": establecimiento.nombre if establecimiento else None,
-                "fecha": estado.fecha,
-                "estado": estado.estado,
-                "hora_registro": localtime(estado.hora_registro).strftime("%H:%M") if estado.hora_registro else "-",
-                "observacion": estado.observacion,
-                "foto_documento": estado.foto_documento,
-                "quien_registro": usuario_registro.email if usuario_registro else None
-            })
+        params = request.query_params
+        fuente = 'historial' if params.get('fuente') == 'historial' else 'estados'
+        formato = 'ndjson' if params.get('formato') == 'ndjson' else 'csv'
 
-        return Response({
-            "fecha": str(fecha),
-            "curso_id": curso_id,
-            "total_ausentes": len(alumnos_data),
-            "alumnos": alumnos_data
-        }, status=200)
+        try:
+            desde = datetime.strptime(params['desde'], '%Y-%m-%d').date() if params.get('desde') else date.today()
+            hasta = datetime.strptime(params['hasta'], '%Y-%m-%d').date() if params.get('hasta') else desde
+        except ValueError:
+            return Response({'error': 'Formato de fecha inválido.'}, status=400)
+        if hasta < desde:
+            return Response({'error': 'hasta no puede ser anterior a desde.'}, status=400)
+
+        # Todo se valida antes del 200: un error dentro del stream deja un archivo truncado
+        filtros = {'fecha__range': [desde, hasta]}
+        if params.get('curso_id'):
+            filtros['curso_id__in'] = [c for c in params['curso_id'].split(',') if c]
+            if not all(_es_id(c) for c in filtros['curso_id__in']):
+                return Response({'error': 'curso_id inválido.'}, status=400)
+        if params.get('establecimiento_id'):
+            if not _es_id(params['establecimiento_id']):
+                return Response({'error': 'establecimiento_id inválido.'}, status=400)
+            filtros['curso__establecimiento_id'] = params['establecimiento_id']
+        if params.get('estado'):
+            filtros['estado'] = params['estado'].upper()
+
+        consulta = consulta_exportacion(fuente, filtros)
+        if formato == 'ndjson':
+            response = StreamingHttpResponse(
+                stream_ndjson(fuente, consulta), content_type='application/x-ndjson; charset=utf-8'
+            )
+        else:
+            response = StreamingHttpResponse(
+                stream_csv(fuente, consulta), content_type='text/csv; charset=utf-8'
+            )
+        response['Content-Disposition'] = f'attachment; filename="{fuente}_{desde}_{hasta}.{formato}"'
+
+        self.registrar_auditoria(
+            request, 'EXPORTAR', 'EstadoAlumno',
+            f"Exportación {fuente} ({formato}) del {desde} al {hasta}"
+        )
+        return response
 
     # ----------------------------------------------------------
-    # RETIROS
+    # FOTO DE DOCUMENTO (contenido inmutable, direccionado por SHA-256)
     # ----------------------------------------------------------
-    @action(detail=False, methods=['get'], url_path='retiros')
-    def listar_retiros(self, request):
-        from alumnos.models import PersonaAutorizadaAlumno
+    def _respuesta_foto(self, request, sha256, miniatura=False):
+        etag = f'"{sha256}-miniatura"' if miniatura else f'"{sha256}"'
 
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            campos = ('content_type', 'contenido', 'miniatura') if miniatura else ('content_type', 'contenido')
+            foto = FotoDocumento.objects.filter(sha256=sha256).only(*campos).first()
+            if not foto:
+                return Response({'error': 'Foto no encontrada.'}, status=404)
+            # Fotos anteriores al procesamiento con Pillow no tienen miniatura
+            contenido = (foto.miniatura if miniatura else None) or foto.contenido
+            response = HttpResponse(bytes(contenido), content_type=foto.content_type)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'fotos/(?P<sha256>[0-9a-f]{64})', url_name='foto')
+    def foto(self, request, sha256=None):
+        return self._respuesta_foto(request, sha256)
+
+    @action(detail=False, methods=['get'], url_path=r'fotos/(?P<sha256>[0-9a-f]{64})/miniatura',
+            url_name='foto-miniatura')
+    def foto_miniatura(self, request, sha256=None):
+        return self._respuesta_foto(request, sha256, miniatura=True)
+
+    # ----------------------------------------------------------
+    # RESUMEN DEL DÍA (conteos para el dashboard, un solo GROUP BY)
+    # ----------------------------------------------------------
+    @action(detail=False, methods=['get'], url_path='resumen')
+    def resumen(self, request):
         user = request.user
         if getattr(user, 'rol', '').lower() == 'apoderado':
             return Response({'error': 'No autorizado'}, status=403)
 
         fecha_str = request.query_params.get('fecha')
         curso_id = request.query_params.get('curso_id')
+        establecimiento_id = request.query_params.get('establecimiento_id')
+        por_establecimiento = request.query_params.get('por_establecimiento') in ('1', 'true', 'True')
 
         try:
             fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else date.today()
         except ValueError:
             fecha = date.today()
+        if (curso_id and not _es_id(curso_id)) or (establecimiento_id and not _es_id(establecimiento_id)):
+            return Response({'error': 'curso_id y establecimiento_id deben ser números enteros.'}, status=400)
 
-        filtros = {'fecha': fecha, 'estado': 'RETIRADO'}
+        filtros = {'fecha': fecha}
         if curso_id:
             filtros['curso_id'] = curso_id
+        if establecimiento_id:
+            filtros['curso__establecimiento_id'] = establecimiento_id
+
+        filas = (
+            EstadoAlumno.objects
+            .filter(**filtros)
+            .values(
+                'estado', 'curso_id', 'curso__nombre',
+                'curso__establecimiento_id', 'curso__establecimiento__nombre'
+            )
+            .annotate(
+                total=Count('id'),
+                anticipados=Count('id', filter=Q(retiro_anticipado=True))
+            )
+            .order_by('curso_id', 'estado')
+        )
+
+        claves = {'AUSENTE': 'ausentes', 'RETIRADO': 'retiros', 'EXTENSION': 'extension'}
+
+        def contadores():
+            return {'ausentes': 0, 'retiros': 0, 'extension': 0, 'retiros_anticipados': 0}
+
+        totales = contadores()
+        cursos = {}
+        establecimientos = {}
+
+        for fila in filas:
+            clave = claves.get(fila['estado'])
+            if not clave:
+                continue
 
-        queryset = EstadoAlumno.objects.select_related(
-            'alumno__persona', 'curso__establecimiento', 'usuario_registro', 'retirado_por'
-        ).filter(**filtros)
-
-        alumnos_data = []
-
-        for estado in queryset:
-            alumno = estado.alumno
-            persona = alumno.persona
-            curso = alumno.curso
-            establecimiento = curso.establecimiento if curso else None
-            retirado_por = estado.retirado_por
-            usuario_registro = estado.usuario_registro
-
-            parentesco = None
-            if retirado_por:
-                relacion = PersonaAutorizadaAlumno.objects.filter(
-                    alumno_id=alumno.id,
-                    persona_id=retirado_por.id
-                ).first()
-                parentesco = getattr(relacion, "tipo_relacion", None)
-
-            alumnos_data.append({
-                "id": estado.id,
-                "alumno": alumno.id,
-                "alumno_nombre": f"{persona.nombres} {persona.apellido_uno} {persona.apellido_dos or ''}".strip(),
-                "curso_id": curso.id if curso else None,
-                "curso_nombre": curso.nombre if curso else None,
-                "establecimiento": establecimiento.nombre if establecimiento else None,
-                "fecha": estado.fecha,
-                "estado": estado.estado,
-                "hora_registro": localtime(estado.hora_registro).strftime("%H:%M") if estado.hora_registro else "-",
-                "observacion": estado.observacion,
-                "foto_documento": estado.foto_documento,
-                "quien_retiro": f"{retirado_por.nombres} {retirado_por.apellido_uno}" if retirado_por else None,
-                "quien_registro": usuario_registro.email if usuario_registro else None,
-                "parentesco": parentesco,
-                "retiro_anticipado": estado.retiro_anticipado
+            curso = cursos.setdefault(fila['curso_id'], {
+                'curso_id': fila['curso_id'],
+                'curso_nombre': fila['curso__nombre'],
+                **contadores()
             })
+            grupos = [totales, curso]
+
+            if por_establecimiento:
+                grupos.append(establecimientos.setdefault(fila['curso__establecimiento_id'], {
+                    'establecimiento_id': fila['curso__establecimiento_id'],
+                    'establecimiento': fila['curso__establecimiento__nombre'],
+                    **contadores()
+                }))
+
+            for grupo in grupos:
+                grupo[clave] += fila['total']
+                grupo['retiros_anticipados'] += fila['anticipados']
+
+        data = {
+            'fecha': str(fecha),
+            'curso_id': curso_id,
+            'total_ausentes': totales['ausentes'],
+            'total_retiros': totales['retiros'],
+            'total_extension': totales['extension'],
+            'total_retiros_anticipados': totales['retiros_anticipados'],
+            'por_curso': list(cursos.values()),
+        }
+        if por_establecimiento:
+            data['por_establecimiento'] = list(establecimientos.values())
+
+        # ETag del contenido: el dashboard recibe 304 si nada cambió
+        etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data, status=200)
 
-        return Response({
-            "fecha": str(fecha),
-            "curso_id": curso_id,
-            "total_retiros": len(alumnos_data),
-            "alumnos": alumnos_data
-        }, status=200)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
     # ----------------------------------------------------------
-    # RETIROS ANTICIPADOS
+    # REPORTE DE ASISTENCIA POR DÍA / MES / AÑO (lee el resumen diario)
     # ----------------------------------------------------------
-    @action(detail=False, methods=['get'], url_path='retiros-anticipados')
-    def listar_retiros_anticipados(self, request):
+    @action(detail=False, methods=['get'], url_path='reporte-asistencia')
+    def reporte_asistencia(self, request):
+        user = request.user
+        if getattr(user, 'rol', '').lower() == 'apoderado':
+            return Response({'error': 'No autorizado'}, status=403)
 
-        fecha_str = request.query_params.get('fecha')
+        desde_str = request.query_params.get('desde')
+        hasta_str = request.query_params.get('hasta')
+        agrupar = request.query_params.get('agrupar', 'mes')
         curso_id = request.query_params.get('curso_id')
+        establecimiento_id = request.query_params.get('establecimiento_id')
+
+        truncar = {'dia': TruncDay, 'mes': TruncMonth, 'anio': TruncYear}.get(agrupar)
+        if not truncar:
+            return Response({'error': 'agrupar debe ser dia, mes o anio'}, status=400)
 
         try:
-            fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else date.today()
-        except:
-            fecha = date.today()
+            hoy = date.today()
+            desde = datetime.strptime(desde_str, '%Y-%m-%d').date() if desde_str else hoy.replace(month=1, day=1)
+            hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date() if hasta_str else hoy
+        except ValueError:
+            return Response({'error': 'Formato de fecha inválido, use YYYY-MM-DD'}, status=400)
+        if (curso_id and not _es_id(curso_id)) or (establecimiento_id and not _es_id(establecimiento_id)):
+            return Response({'error': 'curso_id y establecimiento_id deben ser números enteros.'}, status=400)
 
-        filtros = {'fecha': fecha, 'estado': 'RETIRADO', 'retiro_anticipado': True}
+        filtros = {'fecha__range': (desde, hasta)}
         if curso_id:
             filtros['curso_id'] = curso_id
+        if establecimiento_id:
+            filtros['establecimiento_id'] = establecimiento_id
+
+        filas = (
+            ResumenDiarioAsistencia.objects
+            .filter(**filtros)
+            .annotate(periodo=truncar('fecha'))
+            .values('periodo')
+            .annotate(
+                ausentes=Sum('ausentes'),
+                retiros=Sum('retiros'),
+                extension=Sum('extension'),
+                retiros_anticipados=Sum('retiros_anticipados'),
+                matriculados=Sum('matriculados'),
+                dias=Count('fecha', distinct=True),
+            )
+            .order_by('periodo')
+        )
 
-        queryset = EstadoAlumno.objects.select_related(
-            'alumno__persona', 'curso__establecimiento', 'usuario_registro', 'retirado_por'
-        ).filter(**filtros)
-
-        alumnos_data = []
-
-        for estado in queryset:
-            alumno = estado.alumno
-            persona = alumno.persona
-            curso = alumno.curso
-            establecimiento = curso.establecimiento if curso else None
-            retirado_por = estado.retirado_por
-            usuario_registro = estado.usuario_registro
-
-            alumnos_data.append({
-                "id": estado.id,
-                "alumno": alumno.id,
-                "alumno_nombre": f"{persona.nombres} {persona.apellido_uno} {persona.apellido_dos or ''}".strip(),
-                "curso_id": curso.id if curso else None,
-                "curso_nombre": curso.nombre if curso else None,
-                "establecimiento": establecimiento.nombre if establecimiento else None,
-                "fecha": estado.fecha,
-                "estado": estado.estado,
-                "hora_registro": localtime(estado.hora_registro).strftime("%H:%M"),
-                "observacion": estado.observacion,
-                "foto_documento": estado.foto_documento,
-                "quien_retiro": f"{retirado_por.nombres} {retirado_por.apellido_uno}" if retirado_por else None,
-                "quien_registro": usuario_registro.email if usuario_registro else None,
-                "retiro_anticipado": estado.retiro_anticipado
+        periodos = []
+        for fila in filas:
+            matriculados = fila['matriculados'] or 0
+            presentes = matriculados - (fila['ausentes'] or 0)
+            periodos.append({
+                'periodo': str(fila['periodo'])[:10],
+                'dias': fila['dias'],
+                'ausentes': fila['ausentes'],
+                'retiros': fila['retiros'],
+                'extension': fila['extension'],
+                'retiros_anticipados': fila['retiros_anticipados'],
+                'matriculados_dia': matriculados,
+                'porcentaje_asistencia': round(presentes * 100 / matriculados, 1) if matriculados else None,
             })
 
         return Response({
-            "fecha": str(fecha),
-            "curso_id": curso_id,
-            "total_retiros_anticipados": len(alumnos_data),
-            "alumnos": alumnos_data
+            'desde': str(desde),
+            'hasta': str(hasta),
+            'agrupar': agrupar,
+            'curso_id': curso_id,
+            'establecimiento_id': establecimiento_id,
+            'periodos': periodos,
         }, status=200)
 
     # ----------------------------------------------------------
-    # EXTENSIÓN
+    # AUSENTISMO CRÓNICO (calculado en SQL, solo alumnos marcados)
     # ----------------------------------------------------------
-    @action(detail=False, methods=['get'], url_path='extension')
-    def listar_extension(self, request):
-
-        fecha_str = request.query_params.get('fecha')
-        curso_id = request.query_params.get('curso_id')
+    @action(detail=False, methods=['get'], url_path='ausentismo')
+    def ausentismo(self, request):
+        """
+        Alumnos sobre `umbral` % de ausencia (defecto 10) en los últimos `dias`
+        días hábiles (defecto 30) hasta `hasta`, o con racha actual >= `racha`.
+        Filtros: curso_id (uno o varios separados por coma), establecimiento_id.
+        Incluye rachas y ranking por curso y general. `limit` máximo 1000.
+        """
+        user = request.user
+        if getattr(user, 'rol', '').lower() == 'apoderado':
+            return Response({'error': 'No autorizado'}, status=403)
 
+        params = request.query_params
         try:
-            fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date() if fecha_str else date.today()
-        except:
-            fecha = date.today()
-
-        filtros = {'fecha': fecha, 'estado': 'EXTENSION'}
-        if curso_id:
-            filtros['curso_id'] = curso_id
-
-        queryset = EstadoAlumno.objects.select_related(
-            'alumno__persona', 'curso__establecimiento', 'usuario_registro'
-        ).filter(**filtros)
-
-        alumnos_data = []
-
-        for estado in queryset:
-            alumno = estado.alumno
-            persona = alumno.persona
-            curso = alumno.curso
-            establecimiento = curso.establecimiento if curso else None
-            usuario_registro = estado.usuario_registro
-
-            alumnos_data.append({
-                "id": estado.id,
-                "alumno": alumno.id,
-                "alumno_nombre": f"{persona.nombres} {persona.apellido_uno} {persona.apellido_dos or ''}".strip(),
-                "curso_id": curso.id if curso else None,
-                "curso_nombre": curso.nombre if curso else None,
-                "establecimiento": establecimiento.nombre if establecimiento else None,
-                "fecha": estado.fecha,
-                "estado": estado.estado,
-                "hora_registro": localtime(estado.hora_registro).strftime("%H:%M"),
-                "observacion": estado.observacion,
-                "foto_documento": estado.foto_documento,
-                "quien_registro": usuario_registro.email if usuario_registro else None
-            })
+            dias = min(max(int(params.get('dias', 30)), 1), 400)
+            umbral = float(params.get('umbral', 10))
+            racha = int(params['racha']) if params.get('racha') else None
+            limit = min(max(int(params.get('limit', 200)), 1), 1000)
+            hasta = datetime.strptime(params['hasta'], '%Y-%m-%d').date() if params.get('hasta') else date.today()
+        except ValueError:
+            return Response({'error': 'Parámetros inválidos.'}, status=400)
+        curso_ids = [c for c in params.get('curso_id', '').split(',') if c]
+        if not math.isfinite(umbral) or not all(_es_id(c) for c in curso_ids) or (
+            params.get('establecimiento_id') and not _es_id(params['establecimiento_id'])
+        ):
+            return Response({'error': 'Parámetros inválidos.'}, status=400)
+
+        alumnos = ausentismo_cronico(
+            dias=dias,
+            umbral=umbral,
+            racha=racha,
+            hasta=hasta,
+            curso_ids=curso_ids,
+            establecimiento_id=params.get('establecimiento_id'),
+            limite=limit
+        )
 
         return Response({
-            "fecha": str(fecha),
-            "curso_id": curso_id,
-            "total_extension": len(alumnos_data),
-            "alumnos": alumnos_data
+            'hasta': str(hasta),
+            'dias': dias,
+            'umbral': umbral,
+            'racha': racha,
+            'total': len(alumnos),
+            'alumnos': alumnos,
         }, status=200)
+
+    # ----------------------------------------------------------
+    # LISTADOS DEL DÍA (motor común en estados/listados.py)
+    # ----------------------------------------------------------
+    @action(detail=False, methods=['get'], url_path='ausentes')
+    def listar_ausentes(self, request):
+        return listar_estados(request, 'ausentes')
+
+    @action(detail=False, methods=['get'], url_path='retiros')
+    def listar_retiros(self, request):
+        return listar_estados(request, 'retiros')
+
+    @action(detail=False, methods=['get'], url_path='retiros-anticipados')
+    def listar_retiros_anticipados(self, request):
+        return listar_estados(request, 'retiros_anticipados')
+
+    @action(detail=False, methods=['get'], url_path='extension')
+    def listar_extension(self, request):
+        return listar_estados(request, 'extension')
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+class DummyEmailBackend(BaseEmailBackend):
+    """
+    Backend local para medir throughput sin servidor de correo. Simula el
+    costo de un SMTP real: abrir la conexión (TCP + TLS + login) cuesta
+    EMAIL_DUMMY_CONEXION_MS y cada mensaje EMAIL_DUMMY_MENSAJE_MS. Cuenta
+    conexiones y mensajes en DummyEmailBackend.estadisticas.
+
+    EMAIL_BACKEND=notificaciones.backends.DummyEmailBackend
+    """
+    estadisticas = {'conexiones': 0, 'mensajes': 0}
+    _lock_estadisticas = threading.Lock()
+
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently, **kwargs)
+        self.abierta = False
+        self.costo_conexion = getattr(settings, 'EMAIL_DUMMY_CONEXION_MS', 300) / 1000
+        self.costo_mensaje = getattr(settings, 'EMAIL_DUMMY_MENSAJE_MS', 20) / 1000
+
+    @classmethod
+    def reiniciar_estadisticas(cls):
+        with cls._lock_estadisticas:
+            cls.estadisticas = {'conexiones': 0, 'mensajes': 0}
+
+    def open(self):
+        # Igual que el backend SMTP: False si ya estaba abierta
+        if self.abierta:
+            return False
+        time.sleep(self.costo_conexion)
+        self.abierta = True
+        with self._lock_estadisticas:
+            self.estadisticas['conexiones'] += 1
+        return True
+
+    def close(self):
+        self.abierta = False
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        nueva = self.open()
+        try:
+            for mensaje in email_messages:
+                mensaje.message()  # arma el MIME como lo haría el envío real
+                time.sleep(self.costo_mensaje)
+            with self._lock_estadisticas:
+                self.estadisticas['mensajes'] += len(email_messages)
+        finally:
+            if nueva:
+                self.close()
+        return len(email_messages)
@@ -0,0 +1,208 @@
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.utils import timezone
+
+from .models import TrabajoNotificacion
+
+
+logger = logging.getLogger(__name__)
+
+# Parámetros de la cola
+TRABAJOS_LOTE = 50          # trabajos que toma cada worker por vuelta
+MAX_INTENTOS = 6
+REINTENTO_BASE = 30         # segundos; se duplica en cada intento
+REINTENTO_MAXIMO = 3600
+TIEMPO_PROCESANDO = 600     # un trabajo "PROCESANDO" más antiguo quedó de un worker caído
+
+MANEJADORES = {}
+
+
+def manejador(tipo, lote=False):
+    """
+    Registra la función que procesa los trabajos de `tipo`. Recibe los datos
+    de un trabajo o, con lote=True, la lista de datos de todos los trabajos
+    de ese tipo reclamados en la vuelta; en ese caso retorna una lista en el
+    mismo orden con None (enviado) o el texto del error de cada trabajo.
+    """
+    def registrar(funcion):
+        MANEJADORES[tipo] = (funcion, lote)
+        return funcion
+    return registrar
+
+
+def encolar(tipo, datos, demora=0, usuario=None):
+    """Agrega un trabajo a la cola. Dentro de una transacción, se confirma con ella."""
+    return TrabajoNotificacion.objects.create(
+        tipo=tipo,
+        datos=datos,
+        usuario=usuario,
+        disponible_en=timezone.now() + timedelta(seconds=demora)
+    )
+
+
+def estado_envio(trabajo):
+    """Resumen del trabajo para incluir en una respuesta de la API."""
+    resultado = {
+        'trabajo_id': trabajo.id,
+        'estado': trabajo.estado,
+        'intentos': trabajo.intentos,
+        'creado': trabajo.creado,
+        'procesado_en': trabajo.procesado_en,
+    }
+    if trabajo.ultimo_error:
+        resultado['ultimo_error'] = trabajo.ultimo_error.strip().splitlines()[-1]
+    return resultado
+
+
+def encolar_agrupado(tipo, grupos, ventana):
+    """
+    Debounce por clave, con el estado en la BD (sirve entre procesos).
+    `grupos` es {clave: datos}, donde datos['items'] es una lista. Si ya hay
+    un trabajo PENDIENTE con esa clave, sus items se agregan a él; si no, se
+    crea uno disponible en `ventana` segundos. La ventana corre desde el
+    primer evento y no se alarga: todo lo que llega antes de que un worker
+    tome el trabajo sale en un solo mensaje.
+    Una sentencia para todas las claves. Retorna cuántos trabajos se crearon.
+    """
+    if not grupos:
+        return 0
+
+    tabla = TrabajoNotificacion._meta.db_table
+    claves = list(grupos)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {tabla} AS t
+                (tipo, clave, datos, estado, intentos, disponible_en, ultimo_error, creado)
+            SELECT %s, g.clave, g.datos, %s, 0, now() + make_interval(secs => %s), '', now()
+            FROM unnest(%s::varchar[], %s::jsonb[]) AS g(clave, datos)
+            ON CONFLICT (clave) WHERE estado = 'PENDIENTE'
+            DO UPDATE SET datos = jsonb_set(t.datos, '{{items}}', (t.datos -> 'items') || (EXCLUDED.datos -> 'items'))
+            RETURNING (xmax = 0)
+        """, [
+            tipo, TrabajoNotificacion.PENDIENTE, ventana,
+            claves, [json.dumps(grupos[c], cls=DjangoJSONEncoder) for c in claves],
+        ])
+        return sum(1 for (creado,) in cursor.fetchall() if creado)
+
+
+def reclamar(lote=TRABAJOS_LOTE):
+    """
+    Toma hasta `lote` trabajos disponibles y los marca PROCESANDO en una sola
+    sentencia. FOR UPDATE SKIP LOCKED: varios workers (hilos o procesos)
+    reclaman a la vez sin bloquearse ni tomar el mismo trabajo.
+    """
+    tabla = TrabajoNotificacion._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {tabla} SET estado = %s, tomado_en = now(), intentos = intentos + 1
+            WHERE id IN (
+                SELECT id FROM {tabla}
+                WHERE estado = %s AND disponible_en <= now()
+                ORDER BY disponible_en, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, [TrabajoNotificacion.PROCESANDO, TrabajoNotificacion.PENDIENTE, lote])
+        ids = [fila[0] for fila in cursor.fetchall()]
+
+    if not ids:
+        return []
+    return list(TrabajoNotificacion.objects.filter(id__in=ids).order_by('disponible_en', 'id'))
+
+
+def liberar_colgados():
+    """
+    Devuelve a la cola los trabajos que un worker tomó y no terminó (reinicio,
+    caída). Vuelven sin clave: puede haber ya otro PENDIENTE con la misma
+    (unique_trabajo_pendiente_clave) y así tampoco retienen los eventos nuevos.
+    """
+    return TrabajoNotificacion.objects.filter(
+        estado=TrabajoNotificacion.PROCESANDO,
+        tomado_en__lt=timezone.now() - timedelta(seconds=TIEMPO_PROCESANDO)
+    ).update(estado=TrabajoNotificacion.PENDIENTE, clave=None)
+
+
+def espera_reintento(intentos):
+    """Backoff exponencial con un poco de azar para no reintentar todos juntos."""
+    segundos = min(REINTENTO_BASE * 2 ** (intentos - 1), REINTENTO_MAXIMO)
+    return segundos * random.uniform(1.0, 1.2)
+
+
+def _completar(trabajos):
+    TrabajoNotificacion.objects.filter(id__in=[t.id for t in trabajos]).update(
+        estado=TrabajoNotificacion.ENVIADO,
+        procesado_en=timezone.now(),
+        ultimo_error=''
+    )
+
+
+def _fallar(trabajo, error):
+    trabajo.ultimo_error = error
+    if trabajo.intentos >= MAX_INTENTOS:
+        trabajo.estado = TrabajoNotificacion.ERROR
+        trabajo.procesado_en = timezone.now()
+    else:
+        # Sin clave, como en liberar_colgados: los eventos que lleguen durante
+        # el backoff van a un trabajo nuevo y no esperan este reintento
+        trabajo.estado = TrabajoNotificacion.PENDIENTE
+        trabajo.clave = None
+        trabajo.disponible_en = timezone.now() + timedelta(seconds=espera_reintento(trabajo.intentos))
+    trabajo.save(update_fields=['estado', 'clave', 'procesado_en', 'disponible_en', 'ultimo_error'])
+
+
+def procesar(trabajos):
+    """
+    Ejecuta los trabajos con su manejador, agrupados por tipo. Los enviados
+    se marcan con un solo UPDATE. Retorna (enviados, fallidos).
+    """
+    por_tipo = {}
+    for trabajo in trabajos:
+        por_tipo.setdefault(trabajo.tipo, []).append(trabajo)
+
+    completados = []
+    fallidos = 0
+    for tipo, grupo in por_tipo.items():
+        funcion, lote = MANEJADORES.get(tipo, (None, False))
+        if funcion is None:
+            for trabajo in grupo:
+                _fallar(trabajo, f"Tipo de trabajo sin manejador: {tipo}")
+            fallidos += len(grupo)
+            continue
+
+        if lote:
+            try:
+                errores = funcion([trabajo.datos for trabajo in grupo])
+            except Exception:
+                errores = [traceback.format_exc(limit=5)] * len(grupo)
+        else:
+            errores = []
+            for trabajo in grupo:
+                try:
+                    funcion(trabajo.datos)
+                    errores.append(None)
+                except Exception:
+                    errores.append(traceback.format_exc(limit=5))
+
+        for trabajo, error in zip(grupo, errores):
+            if error:
+                logger.warning("Trabajo %s (%s) falló, intento %s", trabajo.id, trabajo.tipo, trabajo.intentos)
+                _fallar(trabajo, error)
+                fallidos += 1
+            else:
+                completados.append(trabajo)
+
+    if completados:
+        _completar(completados)
+    return len(completados), fallidos
+
+
+def procesar_pendientes(lote=TRABAJOS_LOTE):
+    """Una vuelta de un worker: reclama un lote y lo procesa."""
+    return procesar(reclamar(lote))
@@ -0,0 +1,103 @@
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+
+# Una conexión SMTP abierta sin uso más de esto se cierra (los servidores la cortan)
+CONEXION_INACTIVIDAD = 30
+
+_local = threading.local()
+
+
+def crear_mensaje(asunto, texto, destinatarios, html=None, from_email=None):
+    mensaje = EmailMultiAlternatives(
+        subject=asunto,
+        body=texto,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(destinatarios)
+    )
+    if html:
+        mensaje.attach_alternative(html, "text/html")
+    return mensaje
+
+
+# ----------------------------------------------------------
+# CONEXIÓN PERSISTENTE (workers)
+# ----------------------------------------------------------
+def activar_conexion_persistente():
+    """
+    El hilo actual reutiliza una sola conexión SMTP entre envíos (worker de
+    la cola). Sin esto, cada llamada a enviar_correos abre y cierra la suya.
+    """
+    _local.persistente = True
+
+
+def cerrar_conexion(inactiva_por=0):
+    """Cierra la conexión del hilo si lleva al menos `inactiva_por` segundos sin uso."""
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None or time.monotonic() - _local.ultimo_uso < inactiva_por:
+        return
+    conexion.close()
+    _local.conexion = None
+
+
+def _obtener_conexion():
+    if not getattr(_local, 'persistente', False):
+        return get_connection(), True
+    if getattr(_local, 'conexion', None) is None:
+        _local.conexion = get_connection()
+    return _local.conexion, False
+
+
+# ----------------------------------------------------------
+# ENVÍO
+# ----------------------------------------------------------
+def _enviar(conexion, mensaje):
+    try:
+        return conexion.send_messages([mensaje])
+    except smtplib.SMTPServerDisconnected:
+        # El servidor cerró la conexión ociosa: se reabre una vez
+        conexion.close()
+        conexion.open()
+        return conexion.send_messages([mensaje])
+
+
+def enviar_correos(mensajes):
+    """
+    Envía los mensajes por una misma conexión (get_connection + un solo
+    open). Un error no detiene el resto del lote. Retorna un resultado por
+    mensaje, en orden: {'destinatarios', 'enviado', 'error'}.
+    """
+    resultados = []
+    if not mensajes:
+        return resultados
+
+    conexion, propia = _obtener_conexion()
+    try:
+        conexion.open()
+        for mensaje in mensajes:
+            mensaje.connection = conexion
+            try:
+                enviado = bool(_enviar(conexion, mensaje))
+                error = None if enviado else "El backend no envió el mensaje."
+            except Exception as e:
+                enviado, error = False, f"{type(e).__name__}: {e}"
+            resultados.append({'destinatarios': mensaje.to, 'enviado': enviado, 'error': error})
+    finally:
+        if propia:
+            conexion.close()
+        else:
+            _local.ultimo_uso = time.monotonic()
+
+    return resultados
+
+
+def enviar_correo(mensaje):
+    """Envía un mensaje; si falla lanza la excepción (para reintentos de la cola)."""
+    resultado = enviar_correos([mensaje])[0]
+    if not resultado['enviado']:
+        raise smtplib.SMTPException(resultado['error'])
+    return resultado
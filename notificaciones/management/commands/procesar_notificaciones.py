@@ -0,0 +1,102 @@
+import signal
+import threading
+import traceback
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from notificaciones.cola import TRABAJOS_LOTE, liberar_colgados, procesar_pendientes
+from notificaciones.correo import CONEXION_INACTIVIDAD, activar_conexion_persistente, cerrar_conexion
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de notificaciones (trabajo_notificacion) con N workers "
+        "en paralelo. Se pueden correr varias instancias: los trabajos se "
+        "reclaman con FOR UPDATE SKIP LOCKED."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Hilos en paralelo (defecto: 2)")
+        parser.add_argument('--lote', type=int, default=TRABAJOS_LOTE,
+                            help=f"Trabajos por vuelta de cada worker (defecto: {TRABAJOS_LOTE})")
+        parser.add_argument('--intervalo', type=float, default=1.0,
+                            help="Segundos de espera cuando la cola está vacía (defecto: 1)")
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Vacía la cola disponible y termina (cron)")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers debe ser al menos 1.")
+
+        self.detener = threading.Event()
+        self.enviados = self.fallidos = 0
+        self.lock = threading.Lock()
+
+        if not options['una_vez']:
+            signal.signal(signal.SIGTERM, lambda *_: self.detener.set())
+
+        liberados = liberar_colgados()
+        if liberados:
+            self.stdout.write(f"{liberados} trabajos colgados devueltos a la cola.")
+
+        hilos = [
+            threading.Thread(
+                target=self.worker,
+                args=(options['lote'], options['intervalo'], options['una_vez']),
+                name=f"notificaciones-{n}"
+            )
+            for n in range(options['workers'])
+        ]
+        for hilo in hilos:
+            hilo.start()
+
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(0.5)
+        except KeyboardInterrupt:
+            self.detener.set()
+            for hilo in hilos:
+                hilo.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Notificaciones procesadas: {self.enviados} enviadas, {self.fallidos} con error."
+        ))
+
+    # ----------------------------------------------------------
+    # LOOP DE UN WORKER (una conexión a la BD y una SMTP por hilo)
+    # ----------------------------------------------------------
+    def worker(self, lote, intervalo, una_vez):
+        vueltas = 0
+        activar_conexion_persistente()
+        try:
+            while not self.detener.is_set():
+                close_old_connections()
+                try:
+                    enviados, fallidos = procesar_pendientes(lote)
+                except Exception:
+                    # Un error fuera de los manejadores (BD caída, etc.) no
+                    # mata el hilo: los trabajos ya tomados los devuelve
+                    # liberar_colgados y se reintenta en la próxima vuelta
+                    self.stderr.write(f"Error en {threading.current_thread().name}:\n{traceback.format_exc()}")
+                    connection.close()
+                    if una_vez:
+                        return
+                    self.detener.wait(intervalo)
+                    continue
+                with self.lock:
+                    self.enviados += enviados
+                    self.fallidos += fallidos
+
+                if enviados + fallidos == 0:
+                    if una_vez:
+                        return
+                    vueltas += 1
+                    if vueltas % 60 == 0:
+                        liberar_colgados()
+                    cerrar_conexion(inactiva_por=CONEXION_INACTIVIDAD)
+                    self.detener.wait(intervalo)
+        finally:
+            cerrar_conexion()
+            connection.close()
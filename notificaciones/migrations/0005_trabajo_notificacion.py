@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0004_notificacion_persona_alter_notificacion_usuario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=40)),
+                ('datos', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('ENVIADO', 'Enviado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tomado_en', models.DateTimeField(blank=True, null=True)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'trabajo_notificacion',
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='trabajo_estado_disponible_idx')],
+            },
+        ),
+    ]
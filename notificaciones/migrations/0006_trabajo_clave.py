@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0005_trabajo_notificacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajonotificacion',
+            name='clave',
+            field=models.CharField(blank=True, max_length=120, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='trabajonotificacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'PENDIENTE')), fields=('clave',), name='unique_trabajo_pendiente_clave'),
+        ),
+    ]
@@ -29,3 +29,59 @@ class Notificacion(models.Model):
     def __str__(self):
         estado = "Leído" if self.leido else "Pendiente"
         return f"Notificación {self.id} - {estado}"
+
+
+class TrabajoNotificacion(models.Model):
+    """
+    Cola (outbox) de notificaciones pendientes. Se escribe en la misma
+    transacción que el evento que la origina (guardar_estados emite
+    historiales_creados dentro de su transacción) y la procesa
+    `manage.py procesar_notificaciones` (ver notificaciones/cola.py).
+    """
+    PENDIENTE = 'PENDIENTE'
+    PROCESANDO = 'PROCESANDO'
+    ENVIADO = 'ENVIADO'
+    ERROR = 'ERROR'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESANDO, 'Procesando'),
+        (ENVIADO, 'Enviado'),
+        (ERROR, 'Error'),
+    ]
+
+    tipo = models.CharField(max_length=40)
+    # Trabajos agrupables: mientras hay uno PENDIENTE con la misma clave,
+    # los eventos nuevos se suman a él en vez de crear otro
+    clave = models.CharField(max_length=120, blank=True, null=True)
+    datos = models.JSONField(default=dict)
+    # Destinatario, para consultar el estado de los correos de una cuenta
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='trabajos_notificacion',
+        null=True, blank=True
+    )
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # No se toma antes de esta hora (demora inicial y espera entre reintentos)
+    disponible_en = models.DateTimeField(default=timezone.now)
+    tomado_en = models.DateTimeField(blank=True, null=True)
+    procesado_en = models.DateTimeField(blank=True, null=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'trabajo_notificacion'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='trabajo_estado_disponible_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=models.Q(estado='PENDIENTE'),
+                name='unique_trabajo_pendiente_clave'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Trabajo {self.id} {self.tipo} - {self.estado}"
@@ -1,3 +1,117 @@
-from django.test import TestCase
+import smtplib
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .backends import DummyEmailBackend
+from .cola import TIEMPO_PROCESANDO, encolar_agrupado, liberar_colgados, procesar, reclamar
+from .correo import activar_conexion_persistente, cerrar_conexion, crear_mensaje, enviar_correos
+from .models import TrabajoNotificacion
+
+
+class ReintentoConClaveTests(TestCase):
+    """
+    Un trabajo agrupado que vuelve a PENDIENTE (error o worker caído) no debe
+    chocar con el PENDIENTE nuevo de la misma clave (unique_trabajo_pendiente_clave).
+    """
+
+    def setUp(self):
+        encolar_agrupado("PRUEBA", {"persona-1": {"items": [1]}}, ventana=0)
+        self.tomado, = reclamar()
+        # Mientras se procesa llega otro evento para la misma persona
+        encolar_agrupado("PRUEBA", {"persona-1": {"items": [2]}}, ventana=0)
+
+    def pendientes(self):
+        return list(
+            TrabajoNotificacion.objects.filter(estado=TrabajoNotificacion.PENDIENTE)
+            .order_by('id').values_list('clave', 'datos')
+        )
+
+    def test_fallo_vuelve_sin_clave(self):
+        enviados, fallidos = procesar([self.tomado])  # tipo sin manejador: falla
+        self.assertEqual((enviados, fallidos), (0, 1))
+        self.assertEqual(self.pendientes(), [
+            (None, {"items": [1]}),
+            ("persona-1", {"items": [2]}),
+        ])
+
+    def test_colgado_vuelve_sin_clave(self):
+        TrabajoNotificacion.objects.filter(id=self.tomado.id).update(
+            tomado_en=timezone.now() - timedelta(seconds=TIEMPO_PROCESANDO + 1)
+        )
+        self.assertEqual(liberar_colgados(), 1)
+        self.assertEqual(self.pendientes(), [
+            (None, {"items": [1]}),
+            ("persona-1", {"items": [2]}),
+        ])
+
+
+@override_settings(
+    EMAIL_BACKEND='notificaciones.backends.DummyEmailBackend',
+    EMAIL_DUMMY_CONEXION_MS=0,
+    EMAIL_DUMMY_MENSAJE_MS=0,
+)
+class ConexionCorreoTests(TestCase):
+    """Los correos de un lote (y de un worker) comparten la conexión SMTP."""
+
+    def setUp(self):
+        DummyEmailBackend.reiniciar_estadisticas()
+
+    def mensajes(self, cantidad):
+        return [crear_mensaje("Prueba", "Texto", [f"destino{n}@prueba.cl"]) for n in range(cantidad)]
+
+    def test_lote_por_una_conexion(self):
+        resultados = enviar_correos(self.mensajes(5))
+        self.assertTrue(all(r['enviado'] for r in resultados))
+        self.assertEqual(DummyEmailBackend.estadisticas, {'conexiones': 1, 'mensajes': 5})
+
+    def test_error_de_un_mensaje_no_detiene_el_lote(self):
+        envio = DummyEmailBackend.send_messages
+        fallas = iter([False, True, False])
+
+        def enviar(backend, mensajes):
+            if next(fallas):
+                raise smtplib.SMTPRecipientsRefused({mensajes[0].to[0]: (550, b"no existe")})
+            return envio(backend, mensajes)
+
+        with mock.patch.object(DummyEmailBackend, 'send_messages', enviar):
+            resultados = enviar_correos(self.mensajes(3))
+
+        self.assertEqual([r['enviado'] for r in resultados], [True, False, True])
+        self.assertIn("SMTPRecipientsRefused", resultados[1]['error'])
+        self.assertEqual(DummyEmailBackend.estadisticas['conexiones'], 1)
+
+    def test_conexion_cortada_se_reabre_una_vez(self):
+        envio = DummyEmailBackend.send_messages
+        cortes = iter([True])
+
+        def enviar(backend, mensajes):
+            if next(cortes, False):
+                raise smtplib.SMTPServerDisconnected()
+            return envio(backend, mensajes)
+
+        with mock.patch.object(DummyEmailBackend, 'send_messages', enviar):
+            resultados = enviar_correos(self.mensajes(2))
+
+        self.assertEqual([r['enviado'] for r in resultados], [True, True])
+        self.assertEqual(DummyEmailBackend.estadisticas, {'conexiones': 2, 'mensajes': 2})
+
+    def test_conexion_persistente_del_worker(self):
+        # En otro hilo: la conexión persistente es por hilo y no debe quedar en este
+        def worker():
+            activar_conexion_persistente()
+            enviar_correos(self.mensajes(2))
+            enviar_correos(self.mensajes(3))
+            cerrar_conexion(inactiva_por=60)    # usada recién: sigue abierta
+            enviar_correos(self.mensajes(1))
+            cerrar_conexion()
+            enviar_correos(self.mensajes(1))
+            cerrar_conexion()
+
+        hilo = threading.Thread(target=worker)
+        hilo.start()
+        hilo.join()
+        self.assertEqual(DummyEmailBackend.estadisticas, {'conexiones': 2, 'mensajes': 7})
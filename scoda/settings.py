@@ -222,6 +222,15 @@ FRONTEND_URL = env(
 
 LOGIN_URL = '/panel/'
 
+# Historial de estados escrito por un trigger de Postgres en vez de Python.
+# Al cambiarlo ejecutar `manage.py historial_trigger` para instalar/quitar el trigger.
+HISTORIAL_POR_TRIGGER = env.bool("HISTORIAL_POR_TRIGGER", default=False)
+
+# Segundos que /cambios y /stream retienen las filas más nuevas: una transacción
+# aún sin commit puede confirmar después una hora/id menor. Debe superar la
+# escritura más lenta (cargas masivas de eventos, lotes grandes de actualizar).
+CAMBIOS_VENTANA_SEGUNDOS = env.int("CAMBIOS_VENTANA_SEGUNDOS", default=2)
+
 API_BASE_URL = env(
     "API_BASE_URL",
     default="http://127.0.0.1:8000"
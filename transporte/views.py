@@ -4,11 +4,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from datetime import date
 
+from auditoria.idempotencia import idempotente
+
 from .models import Furgon
 from .serializers import FurgonSerializer
 
 from alumnos.models import Alumno
 from estados.models import EstadoAlumno
+from estados.registro import guardar_estados
 
 
 class FurgonViewSet(viewsets.ModelViewSet):
@@ -50,6 +53,7 @@ class FurgonViewSet(viewsets.ModelViewSet):
     # RETIRO MASIVO DE ALUMNOS POR FURGÓN
     # ============================================
     @action(detail=True, methods=["POST"])
+    @idempotente
     def retirar_todos(self, request, pk=None):
         hoy = date.today()
 
@@ -71,26 +75,38 @@ class FurgonViewSet(viewsets.ModelViewSet):
                 status=200
             )
 
-        retirados = []
-
-        #Registrar RETIRO masivo
-        for alumno in alumnos_presentes:
-            estado = EstadoAlumno.objects.create(
-                alumno=alumno,
-                curso=alumno.curso,
+        alumnos_presentes = list(
+            alumnos_presentes.filter(curso__isnull=False).select_related('persona', 'curso')
+        )
+
+        #Registrar RETIRO masivo en una sola sentencia; si otro dispositivo
+        #registró al alumno entremedio, ese estado se respeta (ON CONFLICT).
+        #guardar_estados escribe historial y resumen y encola los avisos
+        #a apoderados y autorizados en lote
+        estados = [
+            EstadoAlumno(
+                alumno_id=alumno.id,
+                curso_id=alumno.curso_id,
                 fecha=hoy,
                 estado="RETIRADO",
                 usuario_registro=request.user,
                 retirado_por=None,
                 retiro_anticipado=False
             )
+            for alumno in alumnos_presentes
+        ]
+        guardar_estados([(e, None, {}) for e in estados], request.user)
+        guardados = {e.alumno_id for e in estados if e.id}
 
-            retirados.append({
+        retirados = [
+            {
                 "id": alumno.id,
                 "nombre": f"{alumno.persona.nombres} {alumno.persona.apellido_uno}",
                 "curso": alumno.curso.nombre if alumno.curso else None,
-                "estado": estado.estado
-            })
+                "estado": "RETIRADO"
+            }
+            for alumno in alumnos_presentes if alumno.id in guardados
+        ]
 
         return Response({
             "mensaje": "Retiros masivos registrados correctamente.",